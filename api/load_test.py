@@ -0,0 +1,67 @@
+# Local load generator for comparing the Flask and ASGI serving modes
+# Usage: python load_test.py http://localhost:5000 --concurrency 32 --duration 10
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+import requests
+
+
+def worker(url, deadline, latencies, errors, lock):
+    session = requests.Session()
+    local = []
+    failed = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=30)
+            if response.status_code != 200:
+                failed += 1
+                continue
+        except requests.RequestException:
+            failed += 1
+            continue
+        local.append(time.perf_counter() - start)
+    with lock:
+        latencies.extend(local)
+        errors.append(failed)
+
+
+def run(base_url, path, concurrency, duration):
+    url = base_url.rstrip('/') + path
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(url, deadline, latencies, errors, lock))
+               for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    lat_ms = np.asarray(latencies) * 1e3
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': int(sum(errors)),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(float(np.percentile(lat_ms, 50)), 2) if len(lat_ms) else None,
+        'p95_ms': round(float(np.percentile(lat_ms, 95)), 2) if len(lat_ms) else None,
+        'p99_ms': round(float(np.percentile(lat_ms, 99)), 2) if len(lat_ms) else None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test a prediction API endpoint')
+    parser.add_argument('base_url')
+    parser.add_argument('--path', default='/simulate-and-predict')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+
+    for c in args.concurrency:
+        print(json.dumps(run(args.base_url, args.path, c, args.duration)))
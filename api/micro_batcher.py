@@ -0,0 +1,96 @@
+# asyncio micro-batching: coalesce concurrent scoring requests into one batched model call
+import asyncio
+import time
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Collects feature matrices submitted within a short window and scores them together.
+
+    A batch is flushed when ``max_batch_rows`` rows are queued or ``max_wait_ms``
+    has passed since the first queued request, whichever comes first. The
+    scoring function runs in the loop's default thread pool (or ``executor``),
+    so the event loop keeps accepting requests while the models work. Each
+    caller gets back only the rows it submitted. Requests submitted with
+    different ``context`` objects (e.g. model versions) are never scored in
+    the same call: ``score_fn(matrix, context)`` runs once per context.
+    """
+
+    def __init__(self, score_fn, split_fn, max_batch_rows=64, max_wait_ms=2.0, executor=None):
+        self.score_fn = score_fn
+        self.split_fn = split_fn
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.batches = 0
+        self.rows = 0
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, features, context=None):
+        """Queue a (n_rows, n_features) matrix and wait for its share of the batched result."""
+        if self._worker is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, context, future))
+        return await future
+
+    async def _collect(self):
+        pending = [await self._queue.get()]
+        rows = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_rows:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            pending.append(item)
+            rows += len(item[0])
+        return pending
+
+    async def _run(self):
+        while True:
+            pending = await self._collect()
+            groups = {}
+            for features, context, future in pending:
+                if not future.cancelled():
+                    groups.setdefault(id(context), (context, []))[1].append((features, future))
+            for context, group in groups.values():
+                await self._score(context, group)
+
+    async def _score(self, context, pending):
+        loop = asyncio.get_running_loop()
+        matrix = np.concatenate([features for features, _ in pending]) if len(pending) > 1 else pending[0][0]
+        try:
+            result = await loop.run_in_executor(self.executor, self.score_fn, matrix, context)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(matrix)
+        start = 0
+        for features, future in pending:
+            stop = start + len(features)
+            if not future.done():
+                future.set_result(self.split_fn(result, start, stop))
+            start = stop
@@ -1,78 +1,391 @@
+import contextvars
+import hmac
+import io
 import os
 import random
+import sys
+import time
 from datetime import datetime
-import joblib
 import numpy as np
 import pandas as pd
 import warnings
 from sklearn.exceptions import DataConversionWarning
-from flask import Flask, jsonify
+from flask import Flask, Response, g, has_request_context, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
+warnings.filterwarnings(action='ignore', category=DataConversionWarning)
+
+MODELS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models')
+MODEL_DIR = os.path.join(MODELS_PATH, 'best_models')
+sys.path.insert(0, os.path.abspath(MODELS_PATH))
+
+from broadcast import Broadcaster, ndjson_format, sse_format
+from features import build_feature_matrix
+from fleet_state import DEFAULT_SECTOR, FleetState
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsRegistry, StageTimer
+from model_registry import LiveModels, ModelRegistry, RegistryWatcher
+from model_store import ModelStore
+from prediction_cache import PredictionCache
+from predictor import RockfallPredictor
+from risk_policy import POLICY_FILE, PolicyFile
+from sampling_profiler import SamplingProfiler
+from shm_ring import DEFAULT_CAPACITY, ScoredRing, scored_rows
+from temporal_features import TemporalFeatureEngine
+import wire_format
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify through wire_format.dumps (orjson when installed): same keys, order and values, less CPU."""
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, (np.ndarray, np.generic)):
+            return wire_format.json_default(obj)
+        return DefaultJSONProvider.default(obj)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return wire_format.dumps(obj, default=self.default, sort_keys=self.sort_keys).decode()
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(wire_format.dumps(obj, default=self.default, sort_keys=self.sort_keys) + b"\n",
+                                        mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
-warnings.filterwarnings(action='ignore', category=DataConversionWarning)
+# Request/stage latency histograms and counters, scraped from /metrics
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter('rockfall_requests_total', 'HTTP requests by endpoint and status', ('endpoint', 'status'))
+REQUEST_SECONDS = metrics.histogram('rockfall_request_duration_seconds', 'Request latency', ('endpoint',))
+STAGE_SECONDS = metrics.histogram('rockfall_stage_duration_seconds', 'Latency of each scoring stage', ('stage',))
+ERRORS = metrics.counter('rockfall_errors_total', 'Failures caught in the scoring path', ('stage',))
+ROWS_SCORED = metrics.counter('rockfall_rows_scored_total', 'Readings scored by the binary model')
+stage_timer = StageTimer(STAGE_SECONDS)
 
-MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'best_models')
-
-try:
-    binary_model = joblib.load(os.path.join(MODEL_DIR, 'rockfall_binary_model.pkl'))
-    print("Binary model loaded successfully")
-except Exception as e:
-    binary_model = None
-    print(f"Failed loading binary model: {e}")
-
-try:
-    multiclass_model = joblib.load(os.path.join(MODEL_DIR, 'rockfall_multiclass_model.pkl'))
-    print("Multiclass model loaded successfully")
-except Exception as e:
-    multiclass_model = None
-    print(f"Failed loading multiclass model: {e}")
-
-try:
-    le = joblib.load(os.path.join(MODEL_DIR, 'rockfall_label_encoder.pkl'))
-    print("Label encoder loaded successfully")
-except Exception as e:
-    le = None
-    print(f"Failed loading label encoder: {e}")
-
-FEATURES_BASE = [
-    'slope_height_m', 'slope_angle_deg', 'cohesion_kpa', 'friction_angle_deg', 'unit_weight_kn_m3',
-    'rqd_percent', 'joint_spacing_m', 'rainfall_mm', 'temperature_range_c', 'groundwater_depth_m',
-    'freeze_thaw_cycles', 'blasting_distance_m', 'vibration_intensity', 'days_since_blast',
-    'mining_depth_m', 'days_since_rain', 'season_encoded'
-]
-
-def calculate_features(input_data):
-    try:
-        stability_index = (
-            input_data['cohesion_kpa'] +
-            input_data['unit_weight_kn_m3'] * input_data['slope_height_m'] *
-            np.tan(np.radians(input_data['friction_angle_deg']))
-        ) / (
-            input_data['unit_weight_kn_m3'] * input_data['slope_height_m'] *
-            np.sin(np.radians(input_data['slope_angle_deg']))
-        )
-        weather_risk_score = (input_data['rainfall_mm'] * input_data['temperature_range_c']) / (input_data['days_since_rain'] + 1)
-        operational_stress = input_data['vibration_intensity'] / (input_data['blasting_distance_m'] + 1) * (60 - input_data['days_since_blast']) / 60
-        geological_weakness = (100 - input_data['rqd_percent']) / input_data['joint_spacing_m']
-        slope_steepness_factor = np.tan(np.radians(input_data['slope_angle_deg'])) * input_data['slope_height_m']
-
-        base_features = [
-            input_data.get('slope_height_m', 0), input_data.get('slope_angle_deg', 0), input_data.get('cohesion_kpa', 0),
-            input_data.get('friction_angle_deg', 0), input_data.get('unit_weight_kn_m3', 0), input_data.get('rqd_percent', 0),
-            input_data.get('joint_spacing_m', 0), input_data.get('rainfall_mm', 0), input_data.get('temperature_range_c', 0),
-            input_data.get('groundwater_depth_m', 0), input_data.get('freeze_thaw_cycles', 0), input_data.get('blasting_distance_m', 0),
-            input_data.get('vibration_intensity', 0), input_data.get('days_since_blast', 0), input_data.get('mining_depth_m', 0),
-            input_data.get('days_since_rain', 0), input_data.get('season_encoded', 0),
-        ]
-        extended_features = [stability_index, weather_risk_score, operational_stress, geological_weakness, slope_steepness_factor]
-        features = base_features + extended_features
-        return features
-    except Exception as ex:
-        print(f"Feature calculation error: {ex}")
+# POST /debug/profiler, /models/reload and /policy/reload change server state: they need
+# "Authorization: Bearer $ROCKFALL_ADMIN_TOKEN", or come from this host when no token is configured
+ADMIN_TOKEN = os.environ.get('ROCKFALL_ADMIN_TOKEN')
+LOOPBACK_ADDRS = ('127.0.0.1', '::1')
+
+def admin_denied():
+    """An error response unless the current request may use the admin routes, else None."""
+    if ADMIN_TOKEN:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+            return None
+        return jsonify({'error': 'Admin token required'}), 401
+    if request.remote_addr in LOOPBACK_ADDRS:
         return None
+    return jsonify({'error': 'Admin routes only answer local requests unless ROCKFALL_ADMIN_TOKEN is set'}), 403
+
+# Off unless ROCKFALL_PROFILE_SLOW_MS is set or it is switched on through /debug/profiler;
+# traces are per thread, so they cover the threaded Flask server, not rockfall_asgi
+profiler = SamplingProfiler()
+if os.environ.get('ROCKFALL_PROFILE_SLOW_MS'):
+    profiler.start(slow_threshold=float(os.environ['ROCKFALL_PROFILE_SLOW_MS']) / 1000)
+
+# Per-reading prediction cache; ROCKFALL_CACHE_SIZE=0 turns it off
+CACHE_SIZE = int(os.environ.get('ROCKFALL_CACHE_SIZE', '10000'))
+CACHE_TTL = float(os.environ.get('ROCKFALL_CACHE_TTL', '300'))
+CACHE_DECIMALS = int(os.environ.get('ROCKFALL_CACHE_DECIMALS', '3'))
+prediction_cache = PredictionCache(CACHE_SIZE, ttl=CACHE_TTL, decimals=CACHE_DECIMALS) if CACHE_SIZE > 0 else None
+
+# Served models come from the versioned registry once a version has been published to it (model_registry.py),
+# otherwise from best_models/. Each version is loaded and warmed off the request path, then swapped in by reference;
+# forests are memory-mapped from packed sidecars and shared by all workers
+MODEL_REGISTRY_DIR = os.environ.get('ROCKFALL_MODEL_REGISTRY', os.path.join(MODELS_PATH, 'registry'))
+REGISTRY_POLL = float(os.environ.get('ROCKFALL_REGISTRY_POLL', '5'))
+
+def make_predictor(store):
+    return RockfallPredictor.from_store(store, cache=prediction_cache, timer=stage_timer)
+
+live_models = LiveModels(make_predictor)
+registry = ModelRegistry(MODEL_REGISTRY_DIR)
+registry_watcher = None
+if registry.current() is not None:
+    registry_watcher = RegistryWatcher(registry, live_models, REGISTRY_POLL)
+    registry_watcher.check()
+    registry_watcher.start()
+else:
+    live_models.install(ModelStore.from_dir(MODEL_DIR))
+
+# Version pinned by the ASGI app for the request being handled (Flask requests pin through ``g``)
+pinned_model = contextvars.ContextVar('pinned_model', default=None)
+
+def active_model():
+    """The model version scoring this request; pinned on first use so one request never spans a swap."""
+    pinned = pinned_model.get()
+    if pinned is not None:
+        return pinned
+    if has_request_context():
+        served = g.get('served_model')
+        if served is None:
+            served = g.served_model = live_models.acquire()
+        return served
+    return live_models.active
+
+@metrics.collector
+def cache_metrics():
+    if prediction_cache is None:
+        return []
+    stats = prediction_cache.snapshot()
+    samples = [(f'rockfall_prediction_cache_{name}_total', 'counter', f'Prediction cache {name}', stats[name])
+               for name in ('hits', 'misses', 'evictions', 'expired', 'invalidations')]
+    samples.append(('rockfall_prediction_cache_entries', 'gauge', 'Readings held in the prediction cache',
+                    stats['size']))
+    return samples
+
+MAX_BATCH_SIZE = 10000
+
+# Rolling per-stream aggregates appended to every feature matrix; only for models tuned with the same flag
+TEMPORAL_FEATURES = os.environ.get('ROCKFALL_TEMPORAL_FEATURES') == '1'
+temporal_engine = TemporalFeatureEngine() if TEMPORAL_FEATURES else None
+
+# Risk ladder(s) from risk_policy.json (ROCKFALL_RISK_POLICY); edits are picked up without a restart
+risk_policy = PolicyFile(os.environ.get('ROCKFALL_RISK_POLICY', POLICY_FILE))
+
+# Seconds between simulated readings pushed to /stream subscribers
+STREAM_INTERVAL = float(os.environ.get('ROCKFALL_STREAM_INTERVAL', '5'))
+stream_hub = Broadcaster()
+
+# Optional shared-memory ring (ROCKFALL_SHM_RING=<name>) every worker writes its scored readings into,
+# so a dashboard on the same host reads them without an HTTP hop; see models/shm_ring.py
+SHM_RING = os.environ.get('ROCKFALL_SHM_RING')
+scored_ring = ScoredRing.open(SHM_RING, int(os.environ.get('ROCKFALL_SHM_RING_CAPACITY', DEFAULT_CAPACITY))) \
+    if SHM_RING else None
+
+def calculate_features(input_data, mine_id=None):
+    """Feature matrix for one reading dict or a whole batch, in feature_columns order.
+
+    ``mine_id`` (from a /mines/<mine_id> route) places readings in that mine's temporal streams.
+    """
+    with stage_timer('features'):
+        matrix = build_feature_matrix(input_data)
+    if temporal_engine is not None:
+        with stage_timer('temporal_features'):
+            matrix = temporal_engine.extend(input_data, matrix, mine_id)
+    return matrix
+
+def read_batch_readings():
+    """Parse a /predict/batch body: JSON array (or {"readings": [...]}) or a CSV with a header row."""
+    if request.mimetype in ('text/csv', 'application/csv'):
+        return pd.read_csv(io.StringIO(request.get_data(as_text=True)))
+
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get('readings')
+    if not isinstance(payload, list) or not all(isinstance(r, dict) for r in payload):
+        raise ValueError("Expected a JSON array of sensor readings or a CSV body")
+    return payload
+
+def binary_risk_levels(probs, mine_ids=None):
+    """Risk level and recommendation arrays under the current policy; ``mine_ids`` is one id or one per row."""
+    risk = risk_policy.current.classify(probs, mine_ids)
+    return risk['risk_level'], risk['recommendation']
+
+def reading_mine_ids(readings):
+    """mine_id of every reading (None where absent) for the per-mine policy; None if no reading has one."""
+    if isinstance(readings, pd.DataFrame):
+        return readings['mine_id'].astype(str).to_numpy() if 'mine_id' in readings.columns else None
+    mine_ids = [r.get('mine_id') for r in readings]
+    return np.array([str(m) for m in mine_ids]) if any(m is not None for m in mine_ids) else None
+
+def reading_timestamps(readings):
+    """timestamp of every reading (None where absent); None if no reading has one."""
+    if isinstance(readings, pd.DataFrame):
+        return readings['timestamp'].tolist() if 'timestamp' in readings.columns else None
+    timestamps = [r.get('timestamp') for r in readings]
+    return timestamps if any(t is not None for t in timestamps) else None
+
+def publish_scored(readings, features, binary_scores, mc_scores, mine_ids=None):
+    """Append a scored batch to the shared-memory ring, if one is configured; never fails the request."""
+    if scored_ring is None or binary_scores is None:
+        return
+    try:
+        risk_levels, _ = binary_risk_levels(binary_scores['probability'], mine_ids)
+        scored_ring.write(scored_rows(features, binary_scores, mc_scores, risk_levels, mine_ids,
+                                      reading_timestamps(readings)))
+    except Exception as e:
+        ERRORS.inc('shm_ring')
+        print(f"Shared-memory ring write error: {e}")
+
+def score_features(features, served=None):
+    """Score a feature matrix with ``served`` (the request's version by default); multiclass scores may be None."""
+    predictor = (served or active_model()).predictor
+    binary_scores = predictor.score_binary(features)
+    ROWS_SCORED.inc(amount=len(binary_scores['prediction']))
+    mc_scores = None
+    if predictor.has_multiclass:
+        try:
+            mc_scores = predictor.score_multiclass(features)
+        except Exception as e:
+            ERRORS.inc('multiclass_prediction')
+            print(f"Multiclass prediction error: {e}")
+    return binary_scores, mc_scores
+
+def format_single_prediction(binary_scores, mc_scores, mine_id=None, served=None):
+    """The /simulate-and-predict result for the first scored row; ``served`` is the version that scored it."""
+    binary_result = {'prediction': None, 'confidence': 0.0, 'risk_level': 'UNKNOWN', 'recommendation': ''}
+    multiclass_result = {'prediction_label': "N/A", 'confidence': 0.0}
+
+    if binary_scores is not None:
+        binary_pred = binary_scores['prediction'][0]
+        binary_prob = binary_scores['probability'][0]
+        risk_levels, recommendations = binary_risk_levels(binary_scores['probability'][:1], mine_id)
+
+        binary_result = {
+            'prediction': int(binary_pred),
+            'confidence': float(np.round(binary_prob, 2)),
+            'risk_level': str(risk_levels[0]),
+            'recommendation': str(recommendations[0])
+        }
+
+    if mc_scores is not None:
+        mc_probs = mc_scores['probabilities'][0]
+        mc_label = mc_scores['prediction_label'][0]
+        conf_threshold = 0.5
+        if max(mc_probs) < conf_threshold:
+            alt_idx = (mc_scores['prediction_encoded'][0] + random.choice([-1, 1])) % len(mc_probs)
+            mc_label = (served or active_model()).predictor.label_encoder.inverse_transform([alt_idx])[0]
+
+        mc_conf = float(np.round(max(mc_probs), 2))
+        multiclass_result = {
+            'prediction_label': str(mc_label),
+            'confidence': mc_conf,
+            'probabilities': mc_probs.tolist()
+        }
+
+    return {
+        'binary_result': binary_result,
+        'multiclass_result': multiclass_result
+    }
+
+def format_predictions(binary_scores, mc_scores, mine_ids=None):
+    """Per-row /predict/batch results, in the order the rows were scored."""
+    binary_preds = binary_scores['prediction']
+    positive_probs = binary_scores['probability']
+    risk_levels, recommendations = binary_risk_levels(positive_probs, mine_ids)
+    confidences = np.round(positive_probs, 2)
+
+    if mc_scores is not None:
+        mc_probs = mc_scores['probabilities']
+        mc_labels = mc_scores['prediction_label'].astype(str)
+        mc_confs = np.round(mc_scores['confidence'], 2)
+
+    results = []
+    for i in range(len(binary_preds)):
+        multiclass_result = {'prediction_label': "N/A", 'confidence': 0.0}
+        if mc_scores is not None:
+            multiclass_result = {
+                'prediction_label': mc_labels[i],
+                'confidence': float(mc_confs[i]),
+                'probabilities': mc_probs[i].tolist()
+            }
+        results.append({
+            'binary_result': {
+                'prediction': int(binary_preds[i]),
+                'confidence': float(confidences[i]),
+                'risk_level': str(risk_levels[i]),
+                'recommendation': str(recommendations[i])
+            },
+            'multiclass_result': multiclass_result
+        })
+    return results
+
+# Columns the compact formats send unless ?fields= names others; recommendation, color and alert follow from risk_level
+COMPACT_FIELDS = ['mine_id', 'sector_id', 'binary_prediction', 'binary_confidence', 'risk_level', 'mc_label',
+                  'mc_confidence', 'mc_probabilities']
+
+def prediction_columns(binary_scores, mc_scores, mine_ids=None):
+    """A scored batch as column arrays for the compact formats; no per-reading objects are built."""
+    probs = binary_scores['probability']
+    risk = risk_policy.current.classify(probs, mine_ids)
+    columns = {
+        'binary_prediction': binary_scores['prediction'].astype(np.int8),
+        'binary_confidence': np.round(probs, 2).astype(np.float32),
+        'risk_level': risk['risk_level'],
+        'recommendation': risk['recommendation'],
+        'color': risk['color'],
+        'alert': risk['alert'],
+    }
+    if mc_scores is not None:
+        columns['mc_label'] = mc_scores['prediction_label'].astype(str)
+        columns['mc_confidence'] = np.round(mc_scores['confidence'], 2).astype(np.float32)
+        columns['mc_probabilities'] = mc_scores['probabilities'].astype(np.float32)
+    return columns
+
+def response_format(allowed=tuple(wire_format.FORMATS)):
+    """The negotiated wire format and ?fields= projection of this request; ValueError if the format can't be served."""
+    return (wire_format.negotiate(request.args.get('format'), request.headers.get('Accept'), allowed),
+            wire_format.parse_fields(request.args.get('fields')))
+
+def timed_jsonify(payload, fields=None):
+    """jsonify (of the ``fields`` projection) with the serialization time recorded as its own stage."""
+    with stage_timer('serialize'):
+        return jsonify(payload if fields is None else wire_format.project(payload, fields))
+
+def columns_response(format_name, columns, fields, meta):
+    """A compact-format response of the selected columns; 400 for unknown field names."""
+    try:
+        columns = wire_format.select_columns(columns, fields, COMPACT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid fields', 'details': str(e)}), 400
+    with stage_timer('serialize'):
+        body, mimetype = wire_format.encode_columns(format_name, columns, meta)
+    return Response(body, mimetype=mimetype)
+
+def scored_batch_response(format_name, fields, binary_scores, mc_scores, results=None, extra_columns=None,
+                          mine_ids=None):
+    """/predict/batch and /mines ingest body: per-reading objects for 'json', columns for the compact formats."""
+    meta = {'count': len(binary_scores['prediction']), 'model_version': active_model().version,
+            'timestamp': datetime.now().isoformat()}
+    if format_name == 'json':
+        return timed_jsonify(dict(meta, predictions=results), fields)
+    with stage_timer('format'):
+        columns = dict(extra_columns or {}, **prediction_columns(binary_scores, mc_scores, mine_ids))
+        if mc_scores is not None:
+            meta['mc_classes'] = [str(c) for c in active_model().predictor.label_encoder.classes_]
+    return columns_response(format_name, columns, fields, meta)
+
+# Latest scores of every (mine, sector) reporting through /mines/...
+fleet = FleetState()
+
+def format_sector_states(state, mine_id=None):
+    """Current risk rows for a FleetState gather, derived from the stored scores without rescoring."""
+    probs = state['binary_probability']
+    risk_levels, recommendations = binary_risk_levels(probs, mine_id)
+    # Stored decoded by the version that scored each sector, so a hot swap never relabels them
+    mc_labels = state['mc_label']
+    confidences = np.round(probs, 2)
+    mc_confs = np.round(np.nan_to_num(state['mc_confidence'].astype(np.float64)), 2)
+
+    return [{
+        'sector_id': sector_id,
+        'binary_result': {
+            'prediction': int(state['binary_prediction'][i]),
+            'confidence': float(confidences[i]),
+            'risk_level': str(risk_levels[i]),
+            'recommendation': str(recommendations[i])
+        },
+        'multiclass_result': {'prediction_label': str(mc_labels[i]), 'confidence': float(mc_confs[i])},
+        'timestamp': datetime.fromtimestamp(state['timestamp'][i]).isoformat(),
+        'readings': int(state['readings'][i])
+    } for i, sector_id in enumerate(state['sector_id'])]
+
+def mine_summary(mine_id, state):
+    policy = risk_policy.current
+    codes, _ = policy.codes(state['binary_probability'], mine_id)
+    tally = np.bincount(codes, minlength=policy.unknown_code + 1)
+    counts = {level: int(tally[i]) for i, level in enumerate(policy.levels)}
+    highest = next((level for level in reversed(policy.levels) if counts[level]), "UNKNOWN")
+    return {'mine_id': mine_id, 'sectors': len(state['sector_id']), 'highest_risk': highest, 'risk_counts': counts,
+            'max_confidence': round(float(np.nanmax(state['binary_probability'])), 2)}
 
 def generate_sensor_data():
     now = datetime.now()
@@ -98,84 +411,317 @@ def generate_sensor_data():
         'season_encoded': random.randint(0, 3)
     }
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.profile_token = profiler.begin(request.path)
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUESTS.inc(endpoint, str(response.status_code))
+    start = g.pop('request_start', None)
+    if start is not None:
+        duration = time.perf_counter() - start
+        profiler.end(g.pop('profile_token', None), duration)
+        # A stream's "latency" is its lifetime, which would swamp the histogram
+        if not response.is_streamed:
+            REQUEST_SECONDS.observe(duration, endpoint)
+    served = g.get('served_model')
+    response.headers['X-Model-Version'] = served.version if served is not None else live_models.version or ''
+    return response
+
+@app.teardown_request
+def release_model(exc):
+    served = g.pop('served_model', None)
+    if served is not None:
+        live_models.release(served)
+
 @app.route('/')
 def home():
     return jsonify({"message": "API is running"})
 
+def simulate_reading():
+    """Generate one simulated sensor reading and score it; raises ValueError if features can't be built.
+
+    Also runs from the stream producer thread, outside any request, so it
+    holds its own version: scores, alt label and model_version all come from
+    one model, and a draining version waits for it.
+    """
+    served = live_models.acquire()
+    try:
+        with stage_timer('generate'):
+            sensor_data = generate_sensor_data()
+        features = calculate_features(sensor_data)
+
+        try:
+            binary_scores, mc_scores = score_features(features, served)
+        except Exception as e:
+            ERRORS.inc('binary_prediction')
+            print(f"Binary prediction error: {e}")
+            binary_scores = mc_scores = None
+        publish_scored([sensor_data], features, binary_scores, mc_scores, sensor_data.get('mine_id'))
+
+        with stage_timer('format'):
+            prediction = format_single_prediction(binary_scores, mc_scores, sensor_data.get('mine_id'), served)
+        return {
+            'sensor_data': sensor_data,
+            'prediction': prediction,
+            'model_version': served.version,
+            'timestamp': datetime.now().isoformat()
+        }
+    finally:
+        live_models.release(served)
+
 @app.route('/simulate-and-predict')
 def simulate_and_predict():
-    if binary_model is None:
+    """One simulated reading and its scores; ?fields=prediction,timestamp drops the echoed sensor_data."""
+    if not live_models.predictor.available:
         return jsonify({"error": "Binary model not loaded."}), 500
+    try:
+        _, fields = response_format(allowed=('json',))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
 
-    sensor_data = generate_sensor_data()
-    features = calculate_features(sensor_data)
-    if features is None:
+    try:
+        result = simulate_reading()
+    except Exception as e:
+        ERRORS.inc('features')
+        print(f"Feature calculation error: {e}")
         return jsonify({'error': 'Feature calculation failed'}), 500
 
-    feature_names_extended = FEATURES_BASE + [
-        'stability_index', 'weather_risk_score', 'operational_stress', 'geological_weakness', 'slope_steepness_factor'
-    ]
-    features_df = pd.DataFrame([features], columns=feature_names_extended)
+    return timed_jsonify(result, fields)
 
-    binary_result = {'prediction': None, 'confidence': 0.0, 'risk_level': 'UNKNOWN', 'recommendation': ''}
-    multiclass_result = {'prediction_label': "N/A", 'confidence': 0.0}
+@app.route('/stream')
+def stream():
+    """Server-push feed of scored readings: SSE by default, NDJSON with ?format=ndjson."""
+    if not live_models.predictor.available:
+        return jsonify({"error": "Binary model not loaded."}), 500
 
-    try:
-        binary_pred = binary_model.predict(features_df)[0]
-        binary_prob = binary_model.predict_proba(features_df)[0][1]
+    stream_hub.run_periodic(simulate_reading, STREAM_INTERVAL)
+    if request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+        body = stream_hub.listen(formatter=ndjson_format, heartbeat_line="\n")
+        mimetype = 'application/x-ndjson'
+    else:
+        body = stream_hub.listen(formatter=sse_format)
+        mimetype = 'text/event-stream'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cache/stats')
+def cache_stats():
+    if prediction_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(prediction_cache.snapshot(), enabled=True))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
-        if binary_prob > 0.4:
-            risk_level = "CRITICAL"
-            recommendation = "Immediate evacuation required."
-        elif binary_prob > 0.3:
-            risk_level = "HIGH"
-            recommendation = "High risk detected. Consider evacuation."
-        elif binary_prob > 0.1:
-            risk_level = "MEDIUM"
-            recommendation = "Moderate risk. Increase monitoring."
+@app.route('/debug/profiler', methods=['GET', 'POST'])
+def profiler_control():
+    """Status and recent slow-request traces; POST {"enabled": bool, "slow_ms": .., "interval_ms": ..} toggles it."""
+    if request.method == 'POST':
+        denied = admin_denied()
+        if denied is not None:
+            return denied
+        body = request.get_json(silent=True) or {}
+        try:
+            if body.get('enabled', True):
+                profiler.start(interval=body['interval_ms'] / 1000 if 'interval_ms' in body else None,
+                               slow_threshold=body['slow_ms'] / 1000 if 'slow_ms' in body else None)
+            else:
+                profiler.stop()
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': 'Invalid profiler settings', 'details': str(e)}), 400
+    return jsonify(profiler.status())
+
+@app.route('/models/reload', methods=['POST'])
+def reload_models():
+    """Load the registry's current version (or best_models/) now instead of at the next poll, and swap it in."""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    try:
+        if registry_watcher is not None:
+            registry_watcher.check(force=True)
         else:
-            risk_level = "LOW"
-            recommendation = "Low risk. Continue operations."
+            live_models.install(ModelStore.from_dir(MODEL_DIR))
+    except Exception as e:
+        return jsonify({'error': 'Model reload failed', 'details': str(e),
+                        'model_version': live_models.version}), 500
+    return jsonify({'model_version': live_models.version, 'binary_available': live_models.predictor.available})
 
-        binary_result = {
-            'prediction': int(binary_pred),
-            'confidence': float(np.round(binary_prob, 2)),
-            'risk_level': risk_level,
-            'recommendation': recommendation
-        }
+@app.route('/models/version')
+def model_version():
+    return jsonify({
+        'model_version': live_models.version,
+        'registry': registry_watcher is not None,
+        'draining': [served.version for served in live_models.retired],
+        # Not retried until the manifest changes or POST /models/reload
+        'failed_version': registry_watcher.failed[1] if registry_watcher is not None and registry_watcher.failed else None
+    })
+
+@app.route('/policy')
+def current_policy():
+    return jsonify({'policy': risk_policy.current.config, 'source': risk_policy.path,
+                    'loaded_at': datetime.fromtimestamp(risk_policy.loaded_at).isoformat()})
+
+@app.route('/policy/reload', methods=['POST'])
+def reload_policy():
+    """Re-read the risk policy file now rather than at the next change check."""
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    try:
+        policy = risk_policy.reload()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': 'Risk policy reload failed', 'details': str(e)}), 400
+    return jsonify({'policy': policy.config, 'loaded_at': datetime.fromtimestamp(risk_policy.loaded_at).isoformat()})
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Score a batch; ?format=compact|msgpack|arrow (or Accept) returns columns, ?fields= selects what is sent."""
+    if not live_models.predictor.available:
+        return jsonify({"error": "Binary model not loaded."}), 500
+    try:
+        format_name, fields = response_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
+
+    try:
+        with stage_timer('parse'):
+            readings = read_batch_readings()
     except Exception as e:
-        print(f"Binary prediction error: {e}")
+        ERRORS.inc('batch_body')
+        return jsonify({'error': 'Invalid batch body', 'details': str(e)}), 400
+    if len(readings) == 0:
+        return jsonify({'error': 'No readings provided'}), 400
+    if len(readings) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Batch too large (max {MAX_BATCH_SIZE} readings)'}), 413
 
-    if multiclass_model and le:
-        try:
-            mc_pred_idx = multiclass_model.predict(features_df)[0]
-            mc_probs = multiclass_model.predict_proba(features_df)[0]
-            conf_threshold = 0.5
-            if max(mc_probs) < conf_threshold:
-                import random
-                alt_idx = (mc_pred_idx + random.choice([-1, 1])) % len(mc_probs)
-                mc_pred_idx = alt_idx
-
-            mc_label = le.inverse_transform([mc_pred_idx])[0]
-            mc_conf = float(np.round(max(mc_probs), 2))
-            multiclass_result = {
-                'prediction_label': str(mc_label),
-                'confidence': mc_conf,
-                'probabilities': mc_probs.tolist()
-            }
-        except Exception as e:
-            print(f"Multiclass prediction error: {e}")
+    try:
+        features = calculate_features(readings)
+    except (KeyError, ValueError) as e:
+        ERRORS.inc('features')
+        return jsonify({'error': 'Feature calculation failed', 'details': str(e.args[0])}), 400
 
-    result = {
-        'sensor_data': sensor_data,
-        'prediction': {
-            'binary_result': binary_result,
-            'multiclass_result': multiclass_result
-        },
-        'timestamp': datetime.now().isoformat()
-    }
+    try:
+        binary_scores, mc_scores = score_features(features)
+    except Exception as e:
+        ERRORS.inc('binary_prediction')
+        print(f"Batch binary prediction error: {e}")
+        return jsonify({'error': 'Binary prediction failed'}), 500
+    mine_ids = reading_mine_ids(readings)
+    publish_scored(readings, features, binary_scores, mc_scores, mine_ids)
+    results = None
+    if format_name == 'json' or stream_hub.subscriber_count:
+        with stage_timer('format'):
+            results = format_predictions(binary_scores, mc_scores, mine_ids)
+
+    if stream_hub.subscriber_count:
+        scored_at = datetime.now().isoformat()
+        records = readings if isinstance(readings, list) else readings.to_dict('records')
+        for reading, prediction in zip(records, results):
+            stream_hub.publish({'sensor_data': reading, 'prediction': prediction,
+                                'timestamp': reading.get('timestamp', scored_at)})
+
+    return scored_batch_response(format_name, fields, binary_scores, mc_scores, results, mine_ids=mine_ids)
 
-    return jsonify(result)
+def ingest_fleet_readings(mine_id=None):
+    """Shared body of the /mines ingest routes: score the batch once, fold it into the fleet state."""
+    if not live_models.predictor.available:
+        return jsonify({"error": "Binary model not loaded."}), 500
+    try:
+        format_name, fields = response_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
+    try:
+        readings = read_batch_readings()
+    except Exception as e:
+        ERRORS.inc('batch_body')
+        return jsonify({'error': 'Invalid batch body', 'details': str(e)}), 400
+    if isinstance(readings, pd.DataFrame):
+        readings = readings.to_dict('records')
+    if len(readings) == 0:
+        return jsonify({'error': 'No readings provided'}), 400
+    if len(readings) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Batch too large (max {MAX_BATCH_SIZE} readings)'}), 413
+
+    if mine_id is None and not all(r.get('mine_id') for r in readings):
+        return jsonify({'error': 'Every reading needs a mine_id'}), 400
+    try:
+        features = calculate_features(readings, mine_id)
+    except (KeyError, ValueError) as e:
+        ERRORS.inc('features')
+        return jsonify({'error': 'Feature calculation failed', 'details': str(e.args[0])}), 400
+
+    try:
+        binary_scores, mc_scores = fleet.ingest(readings, mine_id=mine_id, features=features,
+                                                  predictor=active_model().predictor)
+    except Exception as e:
+        ERRORS.inc('binary_prediction')
+        print(f"Fleet prediction error: {e}")
+        return jsonify({'error': 'Binary prediction failed'}), 500
+    ROWS_SCORED.inc(amount=len(readings))
+
+    mine_ids = [mine_id if mine_id is not None else str(r['mine_id']) for r in readings]
+    sector_ids = [str(r.get('sector_id') or DEFAULT_SECTOR) for r in readings]
+    publish_scored(readings, features, binary_scores, mc_scores, mine_ids)
+    if format_name != 'json':
+        return scored_batch_response(format_name, fields, binary_scores, mc_scores,
+                                     extra_columns={'mine_id': mine_ids, 'sector_id': sector_ids}, mine_ids=mine_ids)
+    with stage_timer('format'):
+        results = format_predictions(binary_scores, mc_scores, mine_ids)
+        for result, reading_mine, reading_sector in zip(results, mine_ids, sector_ids):
+            result['mine_id'] = reading_mine
+            result['sector_id'] = reading_sector
+    return scored_batch_response(format_name, fields, binary_scores, mc_scores, results, mine_ids=mine_ids)
+
+@app.route('/mines')
+def list_mines():
+    """Risk summary per mine, straight from the stored fleet state."""
+    states = fleet.fleet_state()
+    return timed_jsonify({'mines': [mine_summary(mine_id, state) for mine_id, state in states.items()]},
+                         wire_format.parse_fields(request.args.get('fields')))
+
+@app.route('/mines/readings', methods=['POST'])
+def ingest_readings():
+    """Interleaved readings from any number of mines; each carries mine_id and optionally sector_id."""
+    return ingest_fleet_readings()
+
+@app.route('/mines/<mine_id>/readings', methods=['POST'])
+def ingest_mine_readings(mine_id):
+    return ingest_fleet_readings(mine_id)
+
+@app.route('/mines/<mine_id>/risk')
+def mine_risk(mine_id):
+    """Current risk of every sector of one mine; ?min_level=HIGH keeps only sectors at or above a level."""
+    try:
+        state = fleet.mine_state(mine_id)
+    except KeyError:
+        return jsonify({'error': f'Unknown mine {mine_id}'}), 404
+    shown = state
+    min_level = request.args.get('min_level')
+    if min_level is not None:
+        levels = risk_policy.current.levels
+        if min_level not in levels:
+            return jsonify({'error': f'min_level must be one of {", ".join(levels)}'}), 400
+        codes, _ = risk_policy.current.codes(state['binary_probability'], mine_id)
+        keep = np.flatnonzero((codes >= levels.index(min_level)) & (codes < len(levels)))
+        shown = {name: values[keep] for name, values in state.items() if name != 'sector_id'}
+        shown['sector_id'] = [state['sector_id'][i] for i in keep]
+    sectors = format_sector_states(shown, mine_id)
+    return timed_jsonify(dict(mine_summary(mine_id, state), sector_risk=sectors),
+                         wire_format.parse_fields(request.args.get('fields')))
+
+@app.route('/mines/<mine_id>/sectors/<sector_id>')
+def sector_risk(mine_id, sector_id):
+    try:
+        state = fleet.sector_state(mine_id, sector_id)
+    except KeyError:
+        return jsonify({'error': f'Unknown sector {sector_id} of mine {mine_id}'}), 404
+    return jsonify(dict(format_sector_states(state, mine_id)[0], mine_id=mine_id))
 
 if __name__ == '__main__':
     app.run(debug=True, host='localhost', port=5000)
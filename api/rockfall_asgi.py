@@ -0,0 +1,260 @@
+# ASGI serving mode for the prediction API with asyncio micro-batching.
+# Run from the api/ directory with: uvicorn rockfall_asgi:app --port 5000 (starlette and uvicorn are in requirements.txt)
+import asyncio
+import contextlib
+import io
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import rockfall_api
+import wire_format
+from metrics import PROMETHEUS_CONTENT_TYPE
+from micro_batcher import MicroBatcher
+from predictor import slice_scores
+
+BATCH_WINDOW_MS = float(os.environ.get('ROCKFALL_BATCH_WINDOW_MS', '2'))
+BATCH_MAX_ROWS = int(os.environ.get('ROCKFALL_BATCH_MAX_ROWS', '64'))
+
+
+def split_scores(result, start, stop):
+    binary_scores, mc_scores = result
+    return slice_scores(binary_scores, start, stop), slice_scores(mc_scores, start, stop)
+
+
+batcher = MicroBatcher(rockfall_api.score_features, split_scores,
+                       max_batch_rows=BATCH_MAX_ROWS, max_wait_ms=BATCH_WINDOW_MS)
+
+
+async def in_executor(fn, *args):
+    """Run blocking pandas/NumPy work in the batcher's executor, so one large payload never stalls the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(batcher.executor, fn, *args)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with wire_format.dumps (orjson when installed)."""
+
+    def render(self, content):
+        return wire_format.dumps(content)
+
+
+def timed_json(payload, status_code=200, fields=None):
+    with rockfall_api.stage_timer('serialize'):
+        return FastJSONResponse(payload if fields is None else wire_format.project(payload, fields),
+                                status_code=status_code)
+
+
+def response_format(request, allowed=tuple(wire_format.FORMATS)):
+    return (wire_format.negotiate(request.query_params.get('format'), request.headers.get('accept'), allowed),
+            wire_format.parse_fields(request.query_params.get('fields')))
+
+
+class PinnedModel:
+    """ASGI middleware pinning one model version per request, as rockfall_api does through Flask's ``g``.
+
+    The version is acquired before the endpoint runs and released after the
+    response is sent, so a hot swap drains ASGI requests too and a response
+    never mixes two versions' scores, labels or version string.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        served = rockfall_api.live_models.acquire()
+        token = rockfall_api.pinned_model.set(served)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + [
+                    (b'x-model-version', str(served.version or '').encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            rockfall_api.pinned_model.reset(token)
+            rockfall_api.live_models.release(served)
+
+
+class RequestMetrics:
+    """ASGI middleware feeding rockfall_api's request counter and latency histogram."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = ROUTE_PATHS.get(scope.get('endpoint'), 'unmatched')
+            rockfall_api.REQUESTS.inc(endpoint, str(status[0]))
+            rockfall_api.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+
+
+async def home(request):
+    return JSONResponse({"message": "API is running", "mode": "asgi"})
+
+
+async def simulate_and_predict(request):
+    served = rockfall_api.active_model()
+    if not served.predictor.available:
+        return JSONResponse({"error": "Binary model not loaded."}, status_code=500)
+    try:
+        _, fields = response_format(request, allowed=('json',))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=406)
+
+    with rockfall_api.stage_timer('generate'):
+        sensor_data = rockfall_api.generate_sensor_data()
+    try:
+        features = await in_executor(rockfall_api.calculate_features, sensor_data)
+    except Exception as e:
+        rockfall_api.ERRORS.inc('features')
+        print(f"Feature calculation error: {e}")
+        return JSONResponse({'error': 'Feature calculation failed'}, status_code=500)
+
+    try:
+        binary_scores, mc_scores = await batcher.submit(features, served)
+    except Exception as e:
+        rockfall_api.ERRORS.inc('binary_prediction')
+        print(f"Binary prediction error: {e}")
+        binary_scores = mc_scores = None
+    rockfall_api.publish_scored([sensor_data], features, binary_scores, mc_scores, sensor_data.get('mine_id'))
+
+    with rockfall_api.stage_timer('format'):
+        prediction = rockfall_api.format_single_prediction(binary_scores, mc_scores, sensor_data.get('mine_id'),
+                                                              served)
+    return timed_json({
+        'sensor_data': sensor_data,
+        'prediction': prediction,
+        'model_version': served.version,
+        'timestamp': datetime.now().isoformat()
+    }, fields=fields)
+
+
+async def read_batch_readings(request):
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    if content_type in ('text/csv', 'application/csv'):
+        return await in_executor(pd.read_csv, io.BytesIO(await request.body()))
+
+    payload = await request.json()
+    if isinstance(payload, dict):
+        payload = payload.get('readings')
+    if not isinstance(payload, list) or not all(isinstance(r, dict) for r in payload):
+        raise ValueError("Expected a JSON array of sensor readings or a CSV body")
+    return payload
+
+
+async def predict_batch(request):
+    served = rockfall_api.active_model()
+    if not served.predictor.available:
+        return JSONResponse({"error": "Binary model not loaded."}, status_code=500)
+    try:
+        format_name, fields = response_format(request)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=406)
+
+    try:
+        readings = await read_batch_readings(request)
+    except Exception as e:
+        rockfall_api.ERRORS.inc('batch_body')
+        return JSONResponse({'error': 'Invalid batch body', 'details': str(e)}, status_code=400)
+    if len(readings) == 0:
+        return JSONResponse({'error': 'No readings provided'}, status_code=400)
+    if len(readings) > rockfall_api.MAX_BATCH_SIZE:
+        return JSONResponse({'error': f'Batch too large (max {rockfall_api.MAX_BATCH_SIZE} readings)'},
+                            status_code=413)
+
+    try:
+        features = await in_executor(rockfall_api.calculate_features, readings)
+    except (KeyError, ValueError) as e:
+        rockfall_api.ERRORS.inc('features')
+        return JSONResponse({'error': 'Feature calculation failed', 'details': str(e.args[0])}, status_code=400)
+
+    try:
+        binary_scores, mc_scores = await batcher.submit(features, served)
+    except Exception as e:
+        rockfall_api.ERRORS.inc('binary_prediction')
+        print(f"Batch binary prediction error: {e}")
+        return JSONResponse({'error': 'Binary prediction failed'}, status_code=500)
+    meta = {'count': len(binary_scores['prediction']), 'model_version': served.version,
+            'timestamp': datetime.now().isoformat()}
+    mine_ids = rockfall_api.reading_mine_ids(readings)
+    rockfall_api.publish_scored(readings, features, binary_scores, mc_scores, mine_ids)
+    if format_name != 'json':
+        return columns_response(format_name, fields, binary_scores, mc_scores, meta, served, mine_ids)
+    with rockfall_api.stage_timer('format'):
+        results = rockfall_api.format_predictions(binary_scores, mc_scores, mine_ids)
+    return timed_json(dict(meta, predictions=results), fields=fields)
+
+
+def columns_response(format_name, fields, binary_scores, mc_scores, meta, served, mine_ids=None):
+    with rockfall_api.stage_timer('format'):
+        columns = rockfall_api.prediction_columns(binary_scores, mc_scores, mine_ids)
+        if mc_scores is not None:
+            meta['mc_classes'] = [str(c) for c in served.predictor.label_encoder.classes_]
+    try:
+        columns = wire_format.select_columns(columns, fields, rockfall_api.COMPACT_FIELDS)
+    except ValueError as e:
+        return JSONResponse({'error': 'Invalid fields', 'details': str(e)}, status_code=400)
+    with rockfall_api.stage_timer('serialize'):
+        body, media_type = wire_format.encode_columns(format_name, columns, meta)
+    return Response(body, media_type=media_type)
+
+
+async def batcher_stats(request):
+    return JSONResponse({
+        'batches': batcher.batches,
+        'rows': batcher.rows,
+        'window_ms': BATCH_WINDOW_MS,
+        'max_batch_rows': BATCH_MAX_ROWS
+    })
+
+
+async def cache_stats(request):
+    if rockfall_api.prediction_cache is None:
+        return JSONResponse({'enabled': False})
+    return JSONResponse(dict(rockfall_api.prediction_cache.snapshot(), enabled=True))
+
+
+async def prometheus_metrics(request):
+    return Response(rockfall_api.metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    batcher.start()
+    yield
+    await batcher.stop()
+
+
+routes = [
+    Route('/', home),
+    Route('/simulate-and-predict', simulate_and_predict),
+    Route('/predict/batch', predict_batch, methods=['POST']),
+    Route('/batcher/stats', batcher_stats),
+    Route('/cache/stats', cache_stats),
+    Route('/metrics', prometheus_metrics),
+]
+ROUTE_PATHS = {route.endpoint: route.path for route in routes}
+
+app = Starlette(routes=routes, middleware=[Middleware(RequestMetrics), Middleware(PinnedModel)], lifespan=lifespan)
@@ -1,8 +1,14 @@
 # Step 2: Create a synthetic dataset for rockfall prediction based on research features
+import os
+import sys
+
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+from features import add_derived_features
+
 np.random.seed(42)
 
 # Sample size based on research (220-450 samples for good performance)
@@ -48,20 +54,8 @@ df['season_encoded'] = season_encoder.fit_transform(df['season'])
 
 print("Basic features created. Now generating derived features...")
 
-# Create derived features based on geotechnical engineering principles
-df['stability_index'] = (df['cohesion_kpa'] + df['unit_weight_kn_m3'] * df['slope_height_m'] *
-                         np.tan(np.radians(df['friction_angle_deg']))) / \
-                        (df['unit_weight_kn_m3'] * df['slope_height_m'] *
-                         np.sin(np.radians(df['slope_angle_deg'])))
-
-df['weather_risk_score'] = (df['rainfall_mm'] * df['temperature_range_c']) / (df['days_since_rain'] + 1)
-
-df['operational_stress'] = df['vibration_intensity'] / (df['blasting_distance_m'] + 1) * \
-                           (60 - df['days_since_blast']) / 60
-
-df['geological_weakness'] = (100 - df['rqd_percent']) / df['joint_spacing_m']
-
-df['slope_steepness_factor'] = np.tan(np.radians(df['slope_angle_deg'])) * df['slope_height_m']
+# Create derived features based on geotechnical engineering principles (shared with serving)
+add_derived_features(df)
 
 print("Derived features created. Now generating target variable...")
 
@@ -92,6 +86,14 @@ df['risk_level'] = pd.cut(risk_score,
 # Create binary target (Rockfall/No Rockfall)
 df['rockfall_binary'] = (risk_score > 0.6).astype(int)
 
+# Place each reading in a (mine, sector) sensor stream on a 60-day time axis, so training can replay the
+# rolling temporal features (ROCKFALL_TEMPORAL_FEATURES=1); its own generator leaves every column above unchanged
+stream_rng = np.random.default_rng(7)
+df['mine_id'] = [f'MINE-{i:02d}' for i in stream_rng.integers(1, 4, n_samples)]
+df['sector_id'] = [f'S{i}' for i in stream_rng.integers(1, 3, n_samples)]
+df['timestamp'] = (pd.Timestamp('2024-01-01') + pd.to_timedelta(
+    np.sort(stream_rng.uniform(0, 60 * 86400, n_samples)).round(), unit='s')).strftime('%Y-%m-%dT%H:%M:%S')
+
 # Display dataset info
 print(f"\nDataset created successfully!")
 print(f"Shape: {df.shape}")
@@ -1,74 +1,60 @@
 # Step 4: Data Preprocessing and Feature Selection
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.preprocessing import LabelEncoder
 import joblib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+from dataset_store import DATASET_DIR, DatasetStore, write_dataset_store
+from features import STREAM_COLUMNS, build_feature_frame, feature_columns
+
 print("=== STEP 4: DATA PREPROCESSING ===")
 # Load dataset CSV into df
 df = pd.read_csv('rockfall_synthetic_dataset.csv')
 
-# Select features for the model (remove categorical and intermediate features)
-feature_columns = [
-    'slope_height_m', 'slope_angle_deg', 'cohesion_kpa', 'friction_angle_deg',
-    'unit_weight_kn_m3', 'rqd_percent', 'joint_spacing_m', 'rainfall_mm',
-    'temperature_range_c', 'groundwater_depth_m', 'freeze_thaw_cycles',
-    'blasting_distance_m', 'vibration_intensity', 'days_since_blast',
-    'mining_depth_m', 'days_since_rain', 'season_encoded',
-    'stability_index', 'weather_risk_score', 'operational_stress',
-    'geological_weakness', 'slope_steepness_factor'
-]
-
-# Prepare data for modeling
-X = df[feature_columns]
+# Recompute the engineered features with the same code path used at serving time
+X = build_feature_frame(df)
 y_binary = df['rockfall_binary']
 y_multiclass = df['risk_level']
+# Stream identity and time axis, kept so training can replay the rolling temporal features
+streams = df[STREAM_COLUMNS] if set(STREAM_COLUMNS).issubset(df.columns) else None
 
 print(f"Features selected: {len(feature_columns)}")
 print(f"Feature columns: {feature_columns}")
 
-# Split the data
-X_train, X_test, y_train_bin, y_test_bin = train_test_split(
-    X, y_binary, test_size=0.3, random_state=42, stratify=y_binary
-)
+# Split row indices rather than copies of the data; the store derives every split from them
+rows = np.arange(len(X))
+train_bin, test_bin = train_test_split(rows, test_size=0.3, random_state=42, stratify=y_binary)
 
 # Split for multiclass (encode labels first)
 le = LabelEncoder()
 y_multiclass_encoded = le.fit_transform(y_multiclass)
-X_train_mc, X_test_mc, y_train_mc, y_test_mc = train_test_split(
-    X, y_multiclass_encoded, test_size=0.3, random_state=42, stratify=y_multiclass_encoded
+train_mc, test_mc = train_test_split(rows, test_size=0.3, random_state=42, stratify=y_multiclass_encoded)
+
+# One columnar store replaces the CSV + per-split pickles: features are written once and scaled
+# views are computed on read from statistics fit on each task's training rows
+write_dataset_store(
+    DATASET_DIR, X,
+    targets={'rockfall_binary': y_binary.to_numpy(), 'risk_level': y_multiclass_encoded},
+    splits={'binary_train': train_bin, 'binary_test': test_bin,
+            'multiclass_train': train_mc, 'multiclass_test': test_mc},
+    classes={'risk_level': le.classes_},
+    streams=streams
 )
+store = DatasetStore(DATASET_DIR)
 
-# Scale the features
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
-
-X_train_mc_scaled = scaler.fit_transform(X_train_mc)
-X_test_mc_scaled = scaler.transform(X_test_mc)
-
-print(f"Training set size: {X_train.shape}")
-print(f"Test set size: {X_test.shape}")
-print(f"Binary target distribution in training: {np.bincount(y_train_bin)}")
+print(f"Training set size: {(len(train_bin), len(feature_columns))}")
+print(f"Test set size: {(len(test_bin), len(feature_columns))}")
+print(f"Binary target distribution in training: {np.bincount(store.target('rockfall_binary', 'binary_train'))}")
 print("\nData preprocessing complete!")
 
-# Save the scaler and label encoder for later use
-joblib.dump(scaler, '../models/best_models/rockfall_scaler.pkl')
+# Save one scaler per task (each fit on that task's training rows, like the scaled models) and the label encoder
+joblib.dump(store.scaler('multiclass'), '../models/best_models/rockfall_scaler.pkl')
+joblib.dump(store.scaler('binary'), '../models/best_models/rockfall_binary_scaler.pkl')
 joblib.dump(le, '../models/best_models/rockfall_label_encoder.pkl')
 
-# Save data splits and scaled versions
-joblib.dump(X_train, '../models/X_train.pkl')
-joblib.dump(X_test, '../models/X_test.pkl')
-joblib.dump(y_train_bin, '../models/y_train_bin.pkl')
-joblib.dump(y_test_bin, '../models/y_test_bin.pkl')
-joblib.dump(X_train_scaled, '../models/X_train_scaled.pkl')
-joblib.dump(X_test_scaled, '../models/X_test_scaled.pkl')
-
-joblib.dump(X_train_mc, '../models/X_train_mc.pkl')
-joblib.dump(X_test_mc, '../models/X_test_mc.pkl')
-joblib.dump(y_train_mc, '../models/y_train_mc.pkl')
-joblib.dump(y_test_mc, '../models/y_test_mc.pkl')
-joblib.dump(X_train_mc_scaled, '../models/X_train_mc_scaled.pkl')
-joblib.dump(X_test_mc_scaled, '../models/X_test_mc_scaled.pkl')
-
-print("Scaler, label encoder, and data splits saved!")
+print(f"Scaler, label encoder, and dataset store ({DATASET_DIR}) saved!")
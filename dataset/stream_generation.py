@@ -0,0 +1,205 @@
+# Chunked, multi-process version of steps 2 + 3 for datasets far larger than RAM
+# Usage: python stream_generation.py --rows 10000000 --chunk-size 1000000 --out generated
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+from features import add_derived_features
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# LabelEncoder order of the season names used by data_generation.py
+SEASONS = np.array(['Fall', 'Spring', 'Summer', 'Winter'])
+
+# Derived features normalised by their dataset-wide maximum in the risk score, with the rebalanced weights
+RISK_WEIGHTS = {
+    'slope_steepness_factor': 0.35,
+    'geological_weakness': 0.3,
+    'weather_risk_score': 0.2,
+    'operational_stress': 0.15,
+}
+
+RISK_LEVELS = ['Low', 'Medium', 'High']
+RISK_BINS = [0, 0.4, 0.7, 1.0]
+BINARY_THRESHOLD = 0.55
+
+
+def chunk_rng(seed, chunk_index):
+    """Independent generators for one chunk's features and label noise.
+
+    Seeded from (seed, chunk_index) only, so a chunk comes out identical no
+    matter which worker builds it or how often it is regenerated.
+    """
+    features_seq, noise_seq = np.random.SeedSequence([seed, chunk_index]).spawn(2)
+    return np.random.default_rng(features_seq), np.random.default_rng(noise_seq)
+
+
+def generate_chunk(chunk_index, n_rows, seed):
+    """Base readings and derived features for one chunk (same distributions as data_generation.py)."""
+    rng, _ = chunk_rng(seed, chunk_index)
+    df = pd.DataFrame({
+        # Geological Parameters
+        'slope_height_m': rng.uniform(10, 200, n_rows),
+        'slope_angle_deg': rng.uniform(30, 85, n_rows),
+        'cohesion_kpa': rng.uniform(0, 100, n_rows),
+        'friction_angle_deg': rng.uniform(20, 45, n_rows),
+        'unit_weight_kn_m3': rng.uniform(20, 28, n_rows),
+        'rqd_percent': rng.uniform(10, 95, n_rows),
+        'joint_spacing_m': rng.uniform(0.1, 3.0, n_rows),
+
+        # Environmental Factors
+        'rainfall_mm': rng.exponential(5, n_rows),
+        'temperature_range_c': rng.uniform(5, 30, n_rows),
+        'groundwater_depth_m': rng.uniform(1, 50, n_rows),
+        'freeze_thaw_cycles': rng.poisson(15, n_rows),
+
+        # Operational Parameters
+        'blasting_distance_m': rng.uniform(10, 500, n_rows),
+        'vibration_intensity': rng.uniform(0, 10, n_rows),
+        'days_since_blast': rng.uniform(1, 60, n_rows),
+        'mining_depth_m': rng.uniform(5, 150, n_rows),
+
+        # Time-related features
+        'days_since_rain': rng.uniform(0, 30, n_rows),
+    })
+    season_encoded = rng.integers(0, len(SEASONS), n_rows)
+    df['season'] = SEASONS[season_encoded]
+    df['season_encoded'] = season_encoded
+    return add_derived_features(df)
+
+
+def chunk_sizes(n_rows, chunk_size):
+    n_chunks = -(-n_rows // chunk_size)
+    return [min(chunk_size, n_rows - i * chunk_size) for i in range(n_chunks)]
+
+
+def _chunk_maxima(args):
+    chunk_index, n_rows, seed = args
+    df = generate_chunk(chunk_index, n_rows, seed)
+    return {name: float(df[name].max()) for name in RISK_WEIGHTS}
+
+
+def label_chunk(df, chunk_index, seed, maxima):
+    """Rebalanced risk_score / risk_level / rockfall_binary (step 3) using dataset-wide maxima."""
+    _, noise_rng = chunk_rng(seed, chunk_index)
+    risk_score = sum(weight * (df[name].to_numpy() / maxima[name]) for name, weight in RISK_WEIGHTS.items())
+
+    # Add controlled noise and bias toward higher risk
+    risk_score = np.clip(risk_score + noise_rng.normal(0.15, 0.2, len(df)), 0, 1)
+
+    df['risk_score'] = risk_score
+    # include_lowest keeps scores clipped to exactly 0 in 'Low' instead of leaving them unlabelled
+    df['risk_level'] = pd.cut(risk_score, bins=RISK_BINS, labels=RISK_LEVELS, include_lowest=True)
+    df['rockfall_binary'] = (risk_score > BINARY_THRESHOLD).astype(int)
+    return df
+
+
+def part_path(out_dir, chunk_index, fmt):
+    return os.path.join(out_dir, f'part-{chunk_index:05d}.{fmt}')
+
+
+def _write_chunk(args):
+    chunk_index, n_rows, seed, maxima, out_dir, fmt = args
+    df = label_chunk(generate_chunk(chunk_index, n_rows, seed), chunk_index, seed, maxima)
+    df['risk_level'] = df['risk_level'].astype(str)
+
+    # Write under a temporary name so a killed run never leaves a truncated part behind
+    path = part_path(out_dir, chunk_index, fmt)
+    staging = path + '.tmp'
+    if fmt == 'parquet':
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), staging)
+    else:
+        df.to_csv(staging, index=False)
+    os.replace(staging, path)
+    return {
+        'rows': len(df),
+        'risk_level': df['risk_level'].value_counts().to_dict(),
+        'rockfall_binary': int(df['rockfall_binary'].sum()),
+    }
+
+
+def generate_dataset(n_rows, out_dir, chunk_size=1_000_000, seed=42, workers=None, fmt=None):
+    """Stream ``n_rows`` labelled rows to ``out_dir`` as one file per chunk plus a _manifest.json.
+
+    Pass 1 generates every chunk to find the maxima used to normalise the risk
+    score; pass 2 regenerates the same chunks from their seeds, labels them and
+    writes them. Each worker only ever holds one chunk.
+    """
+    fmt = fmt or ('parquet' if pq is not None else 'csv')
+    if fmt == 'parquet' and pq is None:
+        raise ImportError("pyarrow is required for Parquet output; use fmt='csv'")
+    os.makedirs(out_dir, exist_ok=True)
+    sizes = chunk_sizes(n_rows, chunk_size)
+
+    with Pool(workers) as pool:
+        start = time.perf_counter()
+        maxima = {name: 0.0 for name in RISK_WEIGHTS}
+        for chunk_max in pool.imap_unordered(_chunk_maxima, [(i, n, seed) for i, n in enumerate(sizes)]):
+            for name, value in chunk_max.items():
+                maxima[name] = max(maxima[name], value)
+        print(f"Pass 1: normalisation maxima from {len(sizes)} chunks in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        jobs = [(i, n, seed, maxima, out_dir, fmt) for i, n in enumerate(sizes)]
+        risk_levels, binary_positive, written = {}, 0, 0
+        for summary in pool.imap_unordered(_write_chunk, jobs):
+            written += summary['rows']
+            binary_positive += summary['rockfall_binary']
+            for level, count in summary['risk_level'].items():
+                risk_levels[level] = risk_levels.get(level, 0) + count
+            print(f"  {written}/{n_rows} rows written")
+        elapsed = time.perf_counter() - start
+        print(f"Pass 2: wrote {written} rows in {elapsed:.1f}s ({written / elapsed:,.0f} rows/s)")
+
+    manifest = {
+        'rows': written,
+        'chunk_size': chunk_size,
+        'chunks': len(sizes),
+        'seed': seed,
+        'format': fmt,
+        'normalization_maxima': maxima,
+        'risk_level': risk_levels,
+        'rockfall_binary': {'1': binary_positive, '0': written - binary_positive},
+    }
+    with open(os.path.join(out_dir, '_manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def iter_parts(out_dir, columns=None):
+    """Yield the dataset in out_dir one part (DataFrame) at a time."""
+    for path in sorted(glob.glob(os.path.join(out_dir, 'part-*.*'))):
+        if path.endswith('.parquet'):
+            yield pq.read_table(path, columns=columns).to_pandas()
+        elif path.endswith('.csv'):
+            yield pd.read_csv(path, usecols=columns)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a large synthetic rockfall dataset in chunks')
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--format', choices=['parquet', 'csv'], default=None)
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generated'))
+    args = parser.parse_args()
+
+    print("=== STEPS 2-3: STREAMING SYNTHETIC ROCKFALL DATASET ===")
+    manifest = generate_dataset(args.rows, args.out, chunk_size=args.chunk_size, seed=args.seed,
+                                workers=args.workers, fmt=args.format)
+    print(f"\nTarget distribution: {manifest['risk_level']}")
+    print(f"Binary target distribution: {manifest['rockfall_binary']}")
+    print(f"Dataset written to '{args.out}'")
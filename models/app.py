@@ -1,11 +1,182 @@
-from flask import Flask, jsonify, render_template
+import json
+import os
+import threading
+import time
+
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
 from flask_cors import CORS
-import requests
+
+from broadcast import Broadcaster, sse_format
+from history_store import HistoryStore, record_from_columns
+from shm_ring import ScoredRing
+from upstream_client import UpstreamClient, UpstreamUnavailable
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
 
-history = []
+API_BASE_URL = os.environ.get('ROCKFALL_API_URL', 'http://localhost:5000')
+
+# Default capacity holds a day of readings at the 5 s stream interval; set
+# ROCKFALL_HISTORY_FILE to share the buffer between workers and keep it across restarts
+HISTORY_CAPACITY = int(os.environ.get('ROCKFALL_HISTORY_CAPACITY', '20000'))
+HISTORY_DEFAULT_LIMIT = 50
+history = HistoryStore(HISTORY_CAPACITY, path=os.environ.get('ROCKFALL_HISTORY_FILE') or None)
+
+# One upstream stream connection, fanned out to every connected browser
+relay_hub = Broadcaster()
+relay_lock = threading.Lock()
+relay_thread = None
+
+def record_history(data):
+    try:
+        history.append(data)
+    except Exception as e:
+        print(f"Failed to record history: {e}")
+
+# Seconds a prediction is served from cache, and how long stale data may cover for a slow/down API
+LATEST_TTL = float(os.environ.get('ROCKFALL_LATEST_TTL', '1'))
+LATEST_STALE_TTL = float(os.environ.get('ROCKFALL_LATEST_STALE_TTL', '60'))
+
+upstream = UpstreamClient(API_BASE_URL, ttl=LATEST_TTL, stale_ttl=LATEST_STALE_TTL, on_update=record_history)
+
+# Name of the API workers' shared-memory ring (ROCKFALL_SHM_RING); when set and on this host, the latest
+# prediction and the live stream are read from it directly and HTTP is only the fallback
+SHM_RING = os.environ.get('ROCKFALL_SHM_RING')
+RING_POLL_INTERVAL = float(os.environ.get('ROCKFALL_SHM_POLL_INTERVAL', '0.05'))
+RING_RETRY_INTERVAL = 5.0
+ring_lock = threading.Lock()
+scored_ring = None
+ring_checked = 0.0
+ring_missing_logged = False
+
+def attached_ring():
+    """The shared-memory ring, attached on first use; None until a worker has created it."""
+    global scored_ring, ring_checked, ring_missing_logged
+    if SHM_RING is None or scored_ring is not None:
+        return scored_ring
+    with ring_lock:
+        if scored_ring is None and time.monotonic() - ring_checked >= RING_RETRY_INTERVAL:
+            ring_checked = time.monotonic()
+            try:
+                scored_ring = ScoredRing.attach(SHM_RING)
+                ring_missing_logged = False
+                print(f"Reading scored readings from shared-memory ring {SHM_RING}")
+            except (FileNotFoundError, ValueError) as e:
+                if not ring_missing_logged:
+                    ring_missing_logged = True
+                    print(f"Shared-memory ring {SHM_RING} unavailable, using HTTP: {e}")
+    return scored_ring
+
+def refresh_ring(ring):
+    """Called once ``ring`` has gone quiet: the ring now under its name (re-attached if it was recreated), or None."""
+    global scored_ring, ring_checked, ring_missing_logged
+    with ring_lock:
+        if scored_ring is not ring:
+            return scored_ring
+        if time.monotonic() - ring_checked < RING_RETRY_INTERVAL:
+            return ring
+        ring_checked = time.monotonic()
+        try:
+            fresh = ScoredRing.attach(SHM_RING)
+        except (FileNotFoundError, ValueError) as e:
+            # Dropped rather than closed: another thread may still be copying out of the old mapping
+            print(f"Shared-memory ring {SHM_RING} is gone, using HTTP: {e}")
+            scored_ring = None
+            ring_missing_logged = True
+            return None
+        if fresh.token == ring.token:
+            fresh.close()
+            return ring
+        print(f"Shared-memory ring {SHM_RING} was recreated; re-attached")
+        scored_ring = fresh
+        return fresh
+
+def latest_from_ring():
+    """Newest record in the ring, or None if there is no ring or its newest record is older than LATEST_STALE_TTL."""
+    ring = attached_ring()
+    if ring is None:
+        return None
+    rows, _ = ring.read(limit=1)
+    if not len(rows) or time.time() - rows['scored_at'][0] > LATEST_STALE_TTL:
+        fresh = refresh_ring(ring)
+        if fresh is None or fresh is ring:
+            return None
+        rows, _ = fresh.read(limit=1)
+        if not len(rows) or time.time() - rows['scored_at'][0] > LATEST_STALE_TTL:
+            return None
+    return record_from_columns(rows, 0)
+
+def relay_ring(ring, cursor=None):
+    """Follow ``ring`` (from its head by default) into the history and the connected browsers; returns once it is removed."""
+    cursor = ring.head if cursor is None else cursor
+    last_progress = time.monotonic()
+    while True:
+        try:
+            records, next_cursor = ring.records(cursor)
+            for data in records:
+                record_history(data)
+                relay_hub.publish(data)
+        except Exception as e:
+            print(f"Shared-memory ring error: {e}")
+            next_cursor = cursor
+        if next_cursor != cursor:
+            last_progress = time.monotonic()
+        elif time.monotonic() - last_progress > LATEST_STALE_TTL:
+            # Quiet for longer than a reading may be stale: the workers may have unlinked and recreated it
+            fresh = refresh_ring(ring)
+            if fresh is None:
+                return
+            if fresh is not ring:
+                ring, next_cursor = fresh, 0
+            last_progress = time.monotonic()
+        cursor = next_cursor
+        time.sleep(RING_POLL_INTERVAL)
+
+def ring_available():
+    return SHM_RING is not None and attached_ring() is not None
+
+def relay_upstream_stream():
+    """Relay the API's /stream; returns as soon as a shared-memory ring can be read instead."""
+    backoff = 1
+    while True:
+        relay_hub.wait_for_subscribers()
+        if ring_available():
+            return
+        try:
+            with upstream.session.get(f'{API_BASE_URL}/stream', stream=True, timeout=(5, 60)) as response:
+                response.raise_for_status()
+                backoff = 1
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and line.startswith('data: '):
+                        data = json.loads(line[len('data: '):])
+                        record_history(data)
+                        relay_hub.publish(data)
+                    if not relay_hub.subscriber_count or ring_available():
+                        break
+        except Exception as e:
+            print(f"Upstream stream error: {e}")
+            # Short naps while a ring may appear, so the relay switches to it promptly
+            time.sleep(min(backoff, RING_RETRY_INTERVAL) if SHM_RING else backoff)
+            backoff = min(backoff * 2, 30)
+
+def relay():
+    """Feed relay_hub from the shared-memory ring while one is readable, from the API's HTTP stream otherwise."""
+    cursor = None
+    while True:
+        ring = attached_ring()
+        if ring is not None:
+            relay_ring(ring, cursor)
+        else:
+            relay_upstream_stream()
+        # A ring attached after a fallback holds only readings the HTTP relay never saw
+        cursor = 0
+
+def start_relay():
+    global relay_thread
+    with relay_lock:
+        if relay_thread is None:
+            relay_thread = threading.Thread(target=relay, daemon=True)
+            relay_thread.start()
 
 @app.route('/')
 def dashboard():
@@ -13,19 +184,43 @@ def dashboard():
 
 @app.route('/api/latest')
 def get_latest():
+    data = latest_from_ring()
+    if data is not None:
+        start_relay()
+        response = jsonify(data)
+        response.headers['X-Cache'] = 'SHM'
+        return response
     try:
-        response = requests.get('http://localhost:5000/simulate-and-predict', timeout=5)
-        data = response.json()
-        history.append(data)
-        if len(history) > 50:
-            history.pop(0)
-        return jsonify(data)
-    except Exception as e:
+        data, cache_status = upstream.get_latest()
+    except UpstreamUnavailable as e:
         return jsonify({'error': 'Failed to get latest data', 'details': str(e)}), 503
+    response = jsonify(data)
+    response.headers['X-Cache'] = cache_status.upper()
+    return response
+
+@app.route('/api/upstream-stats')
+def get_upstream_stats():
+    return jsonify(upstream.stats)
+
+@app.route('/api/stream')
+def stream_latest():
+    start_relay()
+    return Response(stream_with_context(relay_hub.listen(formatter=sse_format)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/history')
 def get_history():
-    return jsonify(history)
+    since, until = request.args.get('since'), request.args.get('until')
+    try:
+        limit = request.args.get('limit', type=int)
+        downsample = request.args.get('downsample', type=int)
+        # Without a time range keep the old behaviour of returning the last 50 readings
+        if limit is None and since is None and until is None:
+            limit = HISTORY_DEFAULT_LIMIT
+        records = history.query(since=since, until=until, limit=limit, downsample=downsample)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid history query', 'details': str(e)}), 400
+    return jsonify(records)
 
 if __name__ == '__main__':
-    app.run(debug=True, port=8081)
+    app.run(debug=True, port=8081, threaded=True)
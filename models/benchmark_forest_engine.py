@@ -0,0 +1,64 @@
+# Compare the packed forest engine against the pickled sklearn models
+import os
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from features import build_feature_matrix, feature_columns
+from forest_engine import export_forest
+
+warnings.filterwarnings('ignore')
+
+base_path = os.path.abspath(os.path.dirname(__file__))
+best_models_dir = os.path.join(base_path, 'best_models')
+dataset_path = os.path.join(base_path, '..', 'dataset', 'rockfall_synthetic_dataset.csv')
+
+SINGLE_ROW_REPEATS = 200
+BATCH_ROWS = 10000
+BATCH_REPEATS = 5
+
+
+def time_call(fn, X, repeats):
+    fn(X)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def benchmark(name, model, X_single, X_batch):
+    packed = export_forest(model)
+
+    reference = model.predict_proba(X_batch)
+    max_diff = float(np.abs(packed.predict_proba(X_batch) - reference).max())
+
+    sk_single = time_call(model.predict_proba, X_single, SINGLE_ROW_REPEATS)
+    pk_single = time_call(packed.predict_proba, X_single, SINGLE_ROW_REPEATS)
+    sk_batch = time_call(model.predict_proba, X_batch, BATCH_REPEATS)
+    pk_batch = time_call(packed.predict_proba, X_batch, BATCH_REPEATS)
+
+    print(f"\n{name}: {packed.n_estimators} trees, {packed.n_nodes} nodes, max depth {packed.max_depth}")
+    print(f"  max |proba diff| vs sklearn: {max_diff:.2e}")
+    print(f"  single row : sklearn {sk_single * 1e3:8.3f} ms  packed {pk_single * 1e3:8.3f} ms  "
+          f"({sk_single / pk_single:.1f}x)")
+    print(f"  {len(X_batch)} rows : sklearn {sk_batch * 1e3:8.1f} ms  packed {pk_batch * 1e3:8.1f} ms  "
+          f"({sk_batch / pk_batch:.1f}x)")
+    return max_diff
+
+
+if __name__ == "__main__":
+    df = pd.read_csv(dataset_path)
+    rng = np.random.default_rng(42)
+    rows = df.iloc[rng.integers(0, len(df), BATCH_ROWS)]
+    X_batch = pd.DataFrame(build_feature_matrix(rows), columns=feature_columns)
+    X_single = X_batch.iloc[:1]
+
+    for model_name in ['rockfall_binary_model.pkl', 'rockfall_multiclass_model.pkl']:
+        model = joblib.load(os.path.join(best_models_dir, model_name))
+        diff = benchmark(model_name, model, X_single, X_batch)
+        assert diff < 1e-9, f"{model_name}: packed forest disagrees with sklearn ({diff:.2e})"
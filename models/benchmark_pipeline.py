@@ -0,0 +1,243 @@
+# End-to-end latency benchmark of the scoring pipeline with a regression check against a stored baseline
+# Usage: python benchmark_pipeline.py --batch-sizes 1 100 1000 --threads 1 4 --output results.json
+#        python benchmark_pipeline.py --baseline benchmark_baseline.json          (exit 1 on regression)
+#        python benchmark_pipeline.py --update-baseline benchmark_baseline.json
+# Baselines are host-specific and not committed: record one on the machine (or CI runner type) that checks it
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import warnings
+
+# Measure the models, not the prediction cache; set before rockfall_api is imported
+os.environ.setdefault('ROCKFALL_CACHE_SIZE', '0')
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+
+warnings.filterwarnings('ignore')
+
+base_path = os.path.abspath(os.path.dirname(__file__))
+api_path = os.path.join(base_path, '..', 'api')
+best_models_dir = os.path.join(base_path, 'best_models')
+dataset_path = os.path.join(base_path, '..', 'dataset', 'rockfall_synthetic_dataset.csv')
+sys.path.insert(0, os.path.abspath(api_path))
+
+from features import FEATURES_BASE, build_feature_matrix
+
+DEFAULT_BATCH_SIZES = [1, 100, 1000]
+DEFAULT_THREADS = [1, 4]
+# A case is flagged when its median is this much slower than the baseline and by more than MIN_DELTA_MS
+DEFAULT_TOLERANCE = 0.25
+MIN_DELTA_MS = 0.25
+# Environment keys that must match for two reports' latencies to be comparable
+FINGERPRINT_KEYS = ('cpu', 'machine', 'cpu_count', 'python', 'numpy', 'pandas', 'sklearn')
+
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def fingerprint(environment):
+    """Short hash of the hardware and library versions a report was measured on."""
+    parts = '|'.join(f'{key}={environment.get(key)}' for key in FINGERPRINT_KEYS)
+    return hashlib.sha1(parts.encode()).hexdigest()[:12]
+
+
+def load_readings(n_rows, seed):
+    """Reproducible sensor readings (records, as the API receives them) sampled from the synthetic dataset."""
+    df = pd.read_csv(dataset_path)
+    rows = df.iloc[np.random.default_rng(seed).integers(0, len(df), n_rows)]
+    readings = rows[FEATURES_BASE].to_dict('records')
+    for i, reading in enumerate(readings):
+        reading['timestamp'] = f'2024-01-01T00:00:{i % 60:02d}'
+        reading['mine_id'] = 'MINE_001'
+    return readings
+
+
+def load_pickles():
+    """The pickled forests and label encoder exactly as training saved them."""
+    return tuple(joblib.load(os.path.join(best_models_dir, name)) for name in
+                 ('rockfall_binary_model.pkl', 'rockfall_multiclass_model.pkl', 'rockfall_label_encoder.pkl'))
+
+
+def build_cases(batch_size, readings, models, client, api):
+    """{name: zero-argument callable} for one batch size; each call handles ``batch_size`` readings."""
+    import prediction_model
+
+    binary_model, multiclass_model, label_encoder = models
+    batch = readings[:batch_size]
+    features = build_feature_matrix(batch)
+    frame = prediction_model.prepare_feature_dataframe(batch)
+    encoded = multiclass_model.predict(frame)
+
+    cases = {
+        'calculate_features': lambda: api.calculate_features(batch),
+        'prepare_feature_dataframe': lambda: prediction_model.prepare_feature_dataframe(batch),
+        'predict_proba_binary_sklearn': lambda: binary_model.predict_proba(frame),
+        'predict_proba_multiclass_sklearn': lambda: multiclass_model.predict_proba(frame),
+        'predictor_score': lambda: api.score_features(features),
+        'label_decode': lambda: label_encoder.inverse_transform(encoded),
+        'http_predict_batch': lambda: _check(client.post('/predict/batch', json=batch)),
+    }
+    if batch_size == 1:
+        cases['http_simulate_and_predict'] = lambda: _check(client.get('/simulate-and-predict'))
+    return cases
+
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+
+def measure(fn, threads, min_time, max_calls):
+    """Call fn concurrently from ``threads`` threads; per-call latencies are pooled across threads."""
+    fn()
+    start = time.perf_counter()
+    fn()
+    single = max(time.perf_counter() - start, 1e-6)
+    calls = int(np.clip(min_time / single, 5, max_calls))
+
+    barrier = threading.Barrier(threads)
+    latencies = [[] for _ in range(threads)]
+    errors = []
+
+    def run(slot):
+        barrier.wait()
+        try:
+            for _ in range(calls):
+                t0 = time.perf_counter()
+                fn()
+                slot.append(time.perf_counter() - t0)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=run, args=(slot,)) for slot in latencies]
+    wall = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    wall = time.perf_counter() - wall
+    if errors:
+        raise errors[0]
+    return np.concatenate([np.asarray(slot) for slot in latencies]) * 1e3, wall
+
+
+def run_benchmarks(batch_sizes, threads_list, min_time, max_calls, seed, only=None, log=print):
+    import rockfall_api
+
+    client = rockfall_api.app.test_client()
+    readings = load_readings(max(batch_sizes), seed)
+    models = load_pickles()
+    results = []
+    for batch_size in batch_sizes:
+        for name, fn in build_cases(batch_size, readings, models, client, rockfall_api).items():
+            if only and name not in only:
+                continue
+            for threads in threads_list:
+                lat_ms, wall = measure(fn, threads, min_time, max_calls)
+                row = {
+                    'case': name,
+                    'batch_size': batch_size,
+                    'threads': threads,
+                    'calls': int(len(lat_ms)),
+                    'p50_ms': round(float(np.percentile(lat_ms, 50)), 4),
+                    'p95_ms': round(float(np.percentile(lat_ms, 95)), 4),
+                    'mean_ms': round(float(lat_ms.mean()), 4),
+                    'rows_per_s': round(len(lat_ms) * batch_size / wall, 1),
+                }
+                results.append(row)
+                log(f"{name:34s} batch {batch_size:5d} threads {threads:2d}  p50 {row['p50_ms']:9.3f} ms  "
+                    f"p95 {row['p95_ms']:9.3f} ms  {row['rows_per_s']:12.1f} rows/s")
+    environment = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'machine': platform.machine(),
+        'cpu': cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'model_version': rockfall_api.live_models.version,
+    }
+    environment['fingerprint'] = fingerprint(environment)
+    return {
+        'environment': environment,
+        'settings': {'batch_sizes': batch_sizes, 'threads': threads_list, 'min_time': min_time, 'seed': seed},
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE, min_delta_ms=MIN_DELTA_MS):
+    """Cases whose median latency regressed beyond ``tolerance`` relative to the baseline."""
+    reference = {(r['case'], r['batch_size'], r['threads']): r for r in baseline['results']}
+    regressions = []
+    for row in report['results']:
+        base = reference.get((row['case'], row['batch_size'], row['threads']))
+        if base is None:
+            continue
+        delta = row['p50_ms'] - base['p50_ms']
+        if delta > min_delta_ms and row['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+            regressions.append(dict(row, baseline_p50_ms=base['p50_ms'],
+                                    ratio=round(row['p50_ms'] / base['p50_ms'], 2)))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the rockfall scoring pipeline')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--threads', type=int, nargs='+', default=DEFAULT_THREADS)
+    parser.add_argument('--min-time', type=float, default=0.5, help='Target seconds per case and thread')
+    parser.add_argument('--max-calls', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', help='Run only these case names')
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--baseline', help='Fail (exit 1) when a case regresses against this report')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--min-delta-ms', type=float, default=MIN_DELTA_MS,
+                        help='Ignore slowdowns smaller than this (timer noise on sub-millisecond cases)')
+    parser.add_argument('--update-baseline', metavar='PATH', help='Store this run as the new baseline')
+    parser.add_argument('--allow-cross-host', action='store_true',
+                        help='Compare against a baseline recorded on other hardware or library versions anyway')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.batch_sizes, args.threads, args.min_time, args.max_calls, args.seed, args.only)
+    for path in (args.output, args.update_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        recorded = baseline['environment'].get('fingerprint')
+        if recorded != report['environment']['fingerprint']:
+            differences = [f"{key} {baseline['environment'].get(key)} -> {report['environment'][key]}"
+                           for key in FINGERPRINT_KEYS if baseline['environment'].get(key) != report['environment'][key]]
+            print(f"Baseline {args.baseline} was recorded in another environment: {'; '.join(differences)}")
+            if not args.allow_cross_host:
+                print("Latencies are not comparable across hosts; record a baseline here with --update-baseline")
+                sys.exit(2)
+        if baseline['environment'].get('model_version') != report['environment']['model_version']:
+            print("Note: baseline was recorded against different model artifacts")
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} batch {r['batch_size']} threads {r['threads']}: "
+                  f"p50 {r['p50_ms']:.3f} ms vs {r['baseline_p50_ms']:.3f} ms ({r['ratio']}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
@@ -0,0 +1,95 @@
+# Bytes per reading and encode time of every response format the API offers for scored batches
+# Usage: python benchmark_wire_format.py --batch-sizes 1 100 1000 --output wire_formats.json
+import argparse
+import json
+import os
+import warnings
+
+os.environ.setdefault('ROCKFALL_CACHE_SIZE', '0')
+
+import numpy as np
+
+warnings.filterwarnings('ignore')
+
+from benchmark_pipeline import DEFAULT_BATCH_SIZES, load_readings, measure
+from features import build_feature_matrix
+import wire_format
+
+# What a client keeping only the risk ladder would ask for with ?fields=
+RISK_FIELDS = ['count', 'predictions.binary_result.risk_level', 'predictions.binary_result.confidence']
+
+
+def build_modes(api, binary_scores, mc_scores):
+    """{mode: zero-argument callable returning the encoded body}, each starting from the same scores."""
+    meta = {'count': len(binary_scores['prediction']), 'model_version': api.live_models.version,
+            'timestamp': '2024-01-01T00:00:00'}
+    if mc_scores is not None:
+        meta['mc_classes'] = [str(c) for c in api.live_models.predictor.label_encoder.classes_]
+
+    def rows():
+        return dict(meta, predictions=api.format_predictions(binary_scores, mc_scores))
+
+    def columns(fields=None):
+        return wire_format.select_columns(api.prediction_columns(binary_scores, mc_scores), fields, api.COMPACT_FIELDS)
+
+    modes = {
+        # What /predict/batch sent before: per-reading objects through the stdlib encoder
+        'json_stdlib': lambda: json.dumps(rows(), sort_keys=True, separators=(',', ':')).encode(),
+        'json': lambda: wire_format.dumps(rows(), sort_keys=True),
+        'json_fields': lambda: wire_format.dumps(wire_format.project(rows(), RISK_FIELDS), sort_keys=True),
+        'compact': lambda: wire_format.encode_compact_json(columns(), meta),
+        'compact_fields': lambda: wire_format.encode_compact_json(columns(['risk_level', 'binary_confidence']), meta),
+    }
+    if 'msgpack' in wire_format.available_formats():
+        modes['msgpack'] = lambda: wire_format.encode_msgpack(columns(), meta)
+    if 'arrow' in wire_format.available_formats():
+        modes['arrow'] = lambda: wire_format.encode_arrow(columns(), meta)
+    return modes
+
+
+def run(batch_sizes, min_time, max_calls, seed, log=print):
+    import rockfall_api
+
+    readings = load_readings(max(batch_sizes), seed)
+    results = []
+    for batch_size in batch_sizes:
+        binary_scores, mc_scores = rockfall_api.score_features(build_feature_matrix(readings[:batch_size]))
+        for mode, encode in build_modes(rockfall_api, binary_scores, mc_scores).items():
+            size = len(encode())
+            lat_ms, _ = measure(encode, 1, min_time, max_calls)
+            row = {
+                'mode': mode,
+                'batch_size': batch_size,
+                'bytes': size,
+                'bytes_per_reading': round(size / batch_size, 1),
+                'encode_p50_ms': round(float(np.percentile(lat_ms, 50)), 4),
+                'encode_us_per_reading': round(float(np.percentile(lat_ms, 50)) * 1e3 / batch_size, 3),
+            }
+            results.append(row)
+            log(f"{mode:15s} batch {batch_size:5d}  {row['bytes_per_reading']:8.1f} B/reading  "
+                f"encode p50 {row['encode_p50_ms']:8.3f} ms  {row['encode_us_per_reading']:8.3f} us/reading")
+
+    # /simulate-and-predict echoes its input; ?fields=prediction,timestamp leaves it out
+    client = rockfall_api.app.test_client()
+    for mode, query in (('simulate_json', ''), ('simulate_json_fields', '?fields=prediction,model_version,timestamp')):
+        size = np.mean([len(client.get(f'/simulate-and-predict{query}').data) for _ in range(50)])
+        results.append({'mode': mode, 'batch_size': 1, 'bytes': round(float(size), 1),
+                        'bytes_per_reading': round(float(size), 1)})
+        log(f"{mode:21s} {size:8.1f} B/reading")
+    return {'formats': wire_format.available_formats(), 'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure response size and encode time per wire format')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--min-time', type=float, default=0.3, help='Target seconds per mode and batch size')
+    parser.add_argument('--max-calls', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report here')
+    args = parser.parse_args()
+
+    report = run(args.batch_sizes, args.min_time, args.max_calls, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
@@ -0,0 +1,106 @@
+# Fan-out of scored readings to many streaming clients (SSE / NDJSON)
+import queue
+import threading
+import time
+
+from wire_format import dumps
+
+
+def sse_format(event):
+    return f"data: {dumps(event).decode()}\n\n"
+
+
+def ndjson_format(event):
+    return dumps(event).decode() + "\n"
+
+
+SSE_HEARTBEAT = ": keep-alive\n\n"
+
+
+class Broadcaster:
+    """Delivers every published event to all current subscribers.
+
+    Each subscriber gets a bounded queue; a client that falls behind loses its
+    oldest events instead of stalling the publisher. New subscribers receive
+    the most recent event straight away so screens don't start blank.
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self.latest = None
+        self.published = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._has_subscribers = threading.Event()
+        self._producer = None
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            if self.latest is not None:
+                q.put_nowait(self.latest)
+            self._subscribers.add(q)
+            self._has_subscribers.set()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+            if not self._subscribers:
+                self._has_subscribers.clear()
+
+    def publish(self, event):
+        with self._lock:
+            self.latest = event
+            self.published += 1
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            while True:
+                try:
+                    q.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def wait_for_subscribers(self, timeout=None):
+        return self._has_subscribers.wait(timeout)
+
+    def listen(self, formatter=sse_format, heartbeat=15.0, heartbeat_line=SSE_HEARTBEAT):
+        """Generator of formatted events for one client; emits a heartbeat when idle so proxies keep it open."""
+        q = self.subscribe()
+        try:
+            while True:
+                try:
+                    event = q.get(timeout=heartbeat)
+                except queue.Empty:
+                    if heartbeat_line:
+                        yield heartbeat_line
+                    continue
+                yield formatter(event)
+        finally:
+            self.unsubscribe(q)
+
+    def run_periodic(self, produce, interval):
+        """Start (once) a daemon thread publishing produce() every interval seconds while anyone is listening."""
+        with self._lock:
+            if self._producer is not None:
+                return
+            self._producer = threading.Thread(target=self._produce_loop, args=(produce, interval), daemon=True)
+            self._producer.start()
+
+    def _produce_loop(self, produce, interval):
+        while True:
+            self.wait_for_subscribers()
+            started = time.monotonic()
+            try:
+                self.publish(produce())
+            except Exception as e:
+                print(f"Stream producer error: {e}")
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,338 @@
+# Offline bulk scoring of archived sensor logs, streamed in chunks through the packed models by worker processes
+# Usage: python bulk_score.py archive.csv --out scored --chunk-size 200000 --workers 8
+#        python bulk_score.py ../dataset/generated --out scored      (every CSV/Parquet file of a directory)
+#        Rerun the same command after a failure to resume; --restart discards the finished parts.
+import argparse
+import csv
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURES_BASE, FEATURES_REQUIRED, build_feature_matrix
+from model_registry import REGISTRY_DIR, ModelRegistry, warm
+from model_store import ModelStore
+from predictor import RockfallPredictor
+from risk_policy import POLICY_FILE, RiskPolicy
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+BEST_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best_models')
+MANIFEST_FILE = '_manifest.json'
+
+# Input columns copied to the output (when present) so scores can be joined back to the archive
+PASSTHROUGH_COLUMNS = ['timestamp', 'mine_id', 'sector_id']
+
+INVALID = 'INVALID'
+
+
+def open_store(model_dir=None, version=None, registry_root=REGISTRY_DIR):
+    """The models to score with: one registry version, or the artifacts of a model directory."""
+    if version is not None:
+        return ModelRegistry(registry_root).store(version)
+    return ModelStore.from_dir(model_dir or BEST_MODELS_DIR)
+
+
+def input_files(path):
+    if not os.path.isdir(path):
+        return [path]
+    files = sorted(p for p in glob.glob(os.path.join(path, '*'))
+                   if p.endswith(('.csv', '.parquet')) and not os.path.basename(p).startswith(('_', '.')))
+    if not files:
+        raise FileNotFoundError(f"No CSV or Parquet files in {path}")
+    return files
+
+
+def iter_chunks(path, chunk_size, columns, skip_chunks=0):
+    """Yield DataFrames of at most ``chunk_size`` rows of one file, reading only ``columns``.
+
+    Chunk boundaries depend only on the file and ``chunk_size``, so a resumed
+    run sees the same chunks. The first ``skip_chunks`` chunks are not
+    yielded; CSV rows skipped that way are not even parsed.
+    """
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise ImportError("pyarrow is required to read Parquet input")
+        parquet = pq.ParquetFile(path)
+        present = [c for c in columns if c in parquet.schema_arrow.names]
+        for i, batch in enumerate(parquet.iter_batches(batch_size=chunk_size, columns=present)):
+            if i >= skip_chunks:
+                yield batch.to_pandas()
+        return
+    wanted = set(columns)
+    with open(path, newline='') as f:
+        header = next(csv.reader([f.readline()]))
+        # Skipped lines are consumed raw; a skiprows range would make pandas build a set of every row number
+        for _ in itertools.islice(f, skip_chunks * chunk_size):
+            pass
+        yield from pd.read_csv(f, header=None, names=header, usecols=lambda name: name in wanted,
+                               chunksize=chunk_size)
+
+
+def score_frame(predictor, df, passthrough=PASSTHROUGH_COLUMNS, policy=None):
+    """Output rows for one input chunk, in input order.
+
+    Risk levels come from the same policy the API serves (per mine when the
+    chunk has a mine_id column). Rows with an empty required sensor field
+    are kept with risk level INVALID and NaN scores, so one bad reading does
+    not fail its chunk.
+    """
+    policy = policy or RiskPolicy.load()
+    missing = [name for name in FEATURES_REQUIRED if name not in df.columns]
+    if missing:
+        raise KeyError(f"Missing sensor fields: {', '.join(missing)}")
+    n_rows = len(df)
+    valid = df[FEATURES_REQUIRED].notna().all(axis=1).to_numpy()
+    out = {name: df[name].to_numpy() for name in passthrough if name in df.columns}
+
+    probability = np.full(n_rows, np.nan)
+    prediction = np.full(n_rows, -1, dtype=np.int8)
+    scores = None
+    if valid.any():
+        scores = predictor.score(build_feature_matrix(df if valid.all() else df[valid]))
+        probability[valid] = scores['binary']['probability']
+        prediction[valid] = scores['binary']['prediction']
+    out['binary_prediction'] = prediction
+    out['binary_probability'] = probability.astype(np.float32)
+    mine_ids = df['mine_id'].astype(str).to_numpy() if 'mine_id' in df.columns else None
+    out['risk_level'] = np.where(valid, policy.classify(probability, mine_ids)['risk_level'], INVALID)
+
+    if predictor.has_multiclass:
+        classes = predictor.label_encoder.classes_
+        labels = np.full(n_rows, '', dtype=object)
+        confidence = np.full(n_rows, np.nan, dtype=np.float32)
+        class_probs = np.full((n_rows, len(classes)), np.nan, dtype=np.float32)
+        if scores is not None:
+            labels[valid] = scores['multiclass']['prediction_label'].astype(str)
+            confidence[valid] = scores['multiclass']['confidence']
+            class_probs[valid] = scores['multiclass']['probabilities']
+        out['mc_label'] = labels
+        out['mc_confidence'] = confidence
+        for i, name in enumerate(classes):
+            out[f'mc_probability_{name}'] = class_probs[:, i]
+    return pd.DataFrame(out)
+
+
+def write_part(df, path, fmt):
+    # Write under a temporary name so a killed run never leaves a truncated part behind
+    staging = path + '.tmp'
+    if fmt == 'parquet':
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), staging)
+    else:
+        df.to_csv(staging, index=False)
+    os.replace(staging, path)
+
+
+def summarize(df):
+    return {
+        'rows': len(df),
+        'invalid': int((df['risk_level'] == INVALID).sum()),
+        'risk_level': {str(k): int(v) for k, v in df['risk_level'].value_counts().items()},
+    }
+
+
+_PREDICTOR = None
+_POLICY = None
+
+
+def _init_worker(model_dir, version, registry_root, policy_config):
+    # Forked workers inherit the parent's warmed predictor: the forests' node arrays stay shared copy-on-write and
+    # the packed sidecars (used for chunks under PACKED_BATCH_LIMIT rows) are the same mmap'd pages. Spawned workers
+    # load their own copy
+    global _PREDICTOR, _POLICY
+    if _PREDICTOR is None:
+        _PREDICTOR = RockfallPredictor.from_store(open_store(model_dir, version, registry_root))
+    if _POLICY is None:
+        _POLICY = RiskPolicy(policy_config)
+
+
+def _score_chunk(job):
+    name, df, path, fmt, passthrough = job
+    start = time.perf_counter()
+    out = score_frame(_PREDICTOR, df, passthrough, _POLICY)
+    write_part(out, path, fmt)
+    return name, dict(summarize(out), seconds=round(time.perf_counter() - start, 3))
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _write_manifest(out_dir, manifest):
+    fd, staging = tempfile.mkstemp(prefix='.manifest-', dir=out_dir)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staging, os.path.join(out_dir, MANIFEST_FILE))
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux; children covers worker processes that have exited
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(self_rss / 1024, 1), round(children_rss / 1024, 1)
+
+
+def bulk_score(input_path, out_dir, chunk_size=200_000, workers=None, fmt=None, model_dir=None, version=None,
+               registry_root=REGISTRY_DIR, passthrough=PASSTHROUGH_COLUMNS, restart=False, policy_path=POLICY_FILE,
+               log=print):
+    """Score every row of ``input_path`` into ``out_dir`` as one part file per input chunk plus a _manifest.json.
+
+    The parent reads one chunk at a time and keeps at most two chunks per
+    worker in flight; workers build the features, score the chunk and write
+    its part themselves. So memory stays at a few chunks whatever the input
+    size. The manifest records every finished chunk; rerunning with the same
+    settings skips those and continues where the failed run stopped.
+    """
+    fmt = fmt or ('parquet' if pq is not None else 'csv')
+    if fmt == 'parquet' and pq is None:
+        raise ImportError("pyarrow is required for Parquet output; use fmt='csv'")
+    workers = workers if workers is not None else os.cpu_count() or 1
+    files = input_files(input_path)
+
+    store = open_store(model_dir, version, registry_root)
+    if not store.has_binary:
+        raise FileNotFoundError("No binary model to score with")
+    # Refresh the packed sidecars and load everything once here, before the workers fork
+    store.export()
+    if not warm(store):
+        raise ValueError(f"Model version {store.version} failed to load")
+    global _PREDICTOR, _POLICY
+    _PREDICTOR = RockfallPredictor.from_store(store)
+    _POLICY = RiskPolicy.load(policy_path)
+    # Overrides are per mine, so their mine_id is read even when it is not passed through
+    columns = FEATURES_BASE + list(passthrough)
+    if _POLICY.mine_index and 'mine_id' not in columns:
+        columns.append('mine_id')
+    settings = {
+        'inputs': [_signature(path) for path in files],
+        'chunk_size': chunk_size,
+        'model_version': store.version,
+        'format': fmt,
+        'passthrough': list(passthrough),
+        'risk_policy': _POLICY.config,
+    }
+
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    os.makedirs(out_dir, exist_ok=True)
+    # Only this tool's own files are removed: staging leftovers always, finished parts on --restart
+    for path in glob.glob(os.path.join(out_dir, 'part-*.tmp')) + \
+            (glob.glob(os.path.join(out_dir, 'part-*')) + [manifest_path] if restart else []):
+        if os.path.exists(path):
+            os.remove(path)
+    manifest = {'settings': settings, 'status': 'running', 'chunks': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous['settings'] != settings:
+            raise ValueError(f"{out_dir} holds a run with different inputs, models or settings; "
+                             "use another --out or pass --restart")
+        manifest['chunks'] = {name: summary for name, summary in previous['chunks'].items()
+                              if os.path.exists(os.path.join(out_dir, f'{name}.{fmt}'))}
+        if manifest['chunks']:
+            log(f"Resuming: {len(manifest['chunks'])} chunks "
+                f"({sum(s['rows'] for s in manifest['chunks'].values()):,} rows) already scored")
+    _write_manifest(out_dir, manifest)
+
+    def jobs():
+        for file_index, path in enumerate(files):
+            # Finished chunks that form a prefix of the file are skipped without being read
+            skip = 0
+            while f'part-{file_index:05d}-{skip:06d}' in manifest['chunks']:
+                skip += 1
+            for chunk_index, df in enumerate(iter_chunks(path, chunk_size, columns, skip),
+                                             start=skip):
+                name = f'part-{file_index:05d}-{chunk_index:06d}'
+                if name not in manifest['chunks']:
+                    yield name, df, os.path.join(out_dir, f'{name}.{fmt}'), fmt, passthrough
+
+    start = time.perf_counter()
+    scored = 0
+
+    def finished(name, summary):
+        nonlocal scored
+        manifest['chunks'][name] = summary
+        _write_manifest(out_dir, manifest)
+        scored += summary['rows']
+        elapsed = time.perf_counter() - start
+        log(f"  {name}: {summary['rows']:,} rows in {summary['seconds']:.2f}s | "
+            f"{scored:,} rows this run, {scored / elapsed:,.0f} rows/s")
+
+    try:
+        if workers <= 1:
+            for job in jobs():
+                finished(*_score_chunk(job))
+        else:
+            context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(model_dir, version, registry_root, _POLICY.config)) as executor:
+                pending = set()
+                for job in jobs():
+                    if len(pending) >= 2 * workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            finished(*future.result())
+                    pending.add(executor.submit(_score_chunk, job))
+                for future in pending:
+                    finished(*future.result())
+    except BaseException:
+        manifest['status'] = 'failed'
+        _write_manifest(out_dir, manifest)
+        log(f"Stopped with {len(manifest['chunks'])} chunks scored; rerun the same command to resume")
+        raise
+
+    elapsed = time.perf_counter() - start
+    chunks = manifest['chunks'].values()
+    risk_levels = {}
+    for summary in chunks:
+        for level, count in summary['risk_level'].items():
+            risk_levels[level] = risk_levels.get(level, 0) + count
+    parent_mb, workers_mb = _peak_rss_mb()
+    manifest.update({
+        'status': 'complete',
+        'rows': sum(s['rows'] for s in chunks),
+        'invalid': sum(s['invalid'] for s in chunks),
+        'risk_level': risk_levels,
+        'last_run': {'rows': scored, 'seconds': round(elapsed, 2), 'rows_per_s': round(scored / max(elapsed, 1e-9), 1),
+                     'workers': workers, 'peak_rss_mb': {'parent': parent_mb, 'worker': workers_mb}},
+    })
+    _write_manifest(out_dir, manifest)
+    log(f"Scored {scored:,} rows in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):,.0f} rows/s); "
+        f"{manifest['rows']:,} rows in {out_dir}. Peak RSS: parent {parent_mb} MB, worker {workers_mb} MB")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score archived sensor readings in bulk')
+    parser.add_argument('input', help='CSV or Parquet file, or a directory of them')
+    parser.add_argument('--out', required=True, help='Output directory (part files + _manifest.json)')
+    parser.add_argument('--chunk-size', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count; 1 = inline)')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default=None)
+    parser.add_argument('--model-dir', default=None, help='Model artifacts directory (default: best_models)')
+    parser.add_argument('--model-version', default=None, help='Score with this model registry version instead')
+    parser.add_argument('--registry', default=os.environ.get('ROCKFALL_MODEL_REGISTRY', REGISTRY_DIR))
+    parser.add_argument('--passthrough', nargs='*', default=PASSTHROUGH_COLUMNS,
+                        help='Input columns copied to the output when present')
+    parser.add_argument('--restart', action='store_true', help='Discard finished parts in --out and start over')
+    parser.add_argument('--risk-policy', default=os.environ.get('ROCKFALL_RISK_POLICY', POLICY_FILE),
+                        help='Risk policy JSON (cut points per level, optionally per mine)')
+    args = parser.parse_args()
+
+    manifest = bulk_score(args.input, args.out, chunk_size=args.chunk_size, workers=args.workers, fmt=args.format,
+                          model_dir=args.model_dir, version=args.model_version, registry_root=args.registry,
+                          passthrough=args.passthrough, restart=args.restart,
+                          policy_path=args.risk_policy)
+    print(f"Risk levels: {manifest['risk_level']}")
@@ -0,0 +1,173 @@
+# Column-major on-disk dataset shared by preprocessing, training and tuning
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from features import FEATURES_TEMPORAL, STREAM_COLUMNS, feature_columns
+from temporal_features import add_temporal_features
+from time_utils import to_epoch
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rockfall_dataset')
+
+# Which scaling statistics each split is standardised with (fit on that task's training rows)
+SPLIT_SCALING = {
+    'binary_train': 'binary', 'binary_test': 'binary',
+    'multiclass_train': 'multiclass', 'multiclass_test': 'multiclass',
+}
+
+
+def write_dataset_store(path, X, targets, splits, classes=None, streams=None):
+    """Write features, targets and split indices once; every split/scaled view is derived on read.
+
+    ``X`` is stored as a single Fortran-ordered ``features.npy`` (each column
+    contiguous on disk), targets and split row indices as one ``.npy`` each.
+    Standardisation statistics are computed from each task's training split
+    and kept in ``meta.json`` instead of storing scaled copies. ``streams``
+    (a frame with STREAM_COLUMNS, one row per row of ``X``) is kept as
+    ``stream_*.npy`` so the rolling temporal features can be replayed.
+    """
+    X = pd.DataFrame(X, columns=feature_columns) if not isinstance(X, pd.DataFrame) else X[feature_columns]
+    values = np.asfortranarray(X.to_numpy(dtype=np.float64))
+
+    scaling = {}
+    for split, group in SPLIT_SCALING.items():
+        if split.endswith('_train') and split in splits:
+            rows = values[np.sort(splits[split])]
+            scaler = StandardScaler().fit(rows)
+            scaling[group] = {'mean': scaler.mean_.tolist(), 'scale': scaler.scale_.tolist(),
+                              'var': scaler.var_.tolist(), 'n_samples_seen': int(scaler.n_samples_seen_)}
+
+    # Build in a sibling directory and swap it in, so readers never see a half-written store
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.dataset-', dir=parent)
+    np.save(os.path.join(staging, 'features.npy'), values)
+    for name, target in targets.items():
+        np.save(os.path.join(staging, f'target_{name}.npy'), np.asarray(target))
+    for name, rows in splits.items():
+        np.save(os.path.join(staging, f'split_{name}.npy'), np.asarray(rows, dtype=np.int64))
+    if streams is not None:
+        np.save(os.path.join(staging, 'stream_timestamp.npy'),
+                np.array([to_epoch(ts) for ts in streams['timestamp']], dtype=np.float64))
+        for name in STREAM_COLUMNS[1:]:
+            np.save(os.path.join(staging, f'stream_{name}.npy'), streams[name].astype(str).to_numpy(dtype=str))
+    with open(os.path.join(staging, 'meta.json'), 'w') as f:
+        json.dump({
+            'n_rows': len(values),
+            'feature_columns': list(X.columns),
+            'targets': list(targets),
+            'splits': list(splits),
+            'classes': {name: [str(c) for c in values_] for name, values_ in (classes or {}).items()},
+            'scaling': scaling,
+            'streams': list(STREAM_COLUMNS) if streams is not None else [],
+        }, f, indent=2)
+
+    if os.path.exists(path):
+        retired = tempfile.mkdtemp(prefix='.dataset-old-', dir=parent)
+        os.replace(path, os.path.join(retired, 'store'))
+        os.replace(staging, path)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, path)
+
+
+class DatasetStore:
+    """Read side of write_dataset_store; arrays are memory-mapped and only touched when asked for."""
+
+    def __init__(self, path=DATASET_DIR, mmap_mode='r'):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.feature_columns = self.meta['feature_columns']
+        self._features = None
+        self._temporal = None
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name), mmap_mode=self.mmap_mode)
+
+    @property
+    def features(self):
+        """The full (n_rows, n_features) matrix, memory-mapped without a copy."""
+        if self._features is None:
+            self._features = self._load('features.npy')
+        return self._features
+
+    def column(self, name):
+        """One feature column as a contiguous zero-copy view."""
+        return self.features[:, self.feature_columns.index(name)]
+
+    def split(self, name):
+        return self._load(f'split_{name}.npy')
+
+    def target(self, name, split=None):
+        target = self._load(f'target_{name}.npy')
+        return target if split is None else np.asarray(target[self.split(split)])
+
+    def classes(self, name):
+        return self.meta['classes'].get(name)
+
+    def matrix(self, split=None, columns=None, scaled=False):
+        """Feature rows of ``split`` (all rows when None), optionally only ``columns`` and standardised.
+
+        With no split, no column selection and no scaling this is the memory
+        map itself; otherwise only the requested rows/columns are read.
+        """
+        col_idx = None if columns is None else [self.feature_columns.index(c) for c in columns]
+        values = self.features
+        if col_idx is not None:
+            values = values[:, col_idx]
+        if split is not None:
+            values = values[self.split(split)]
+        if scaled:
+            stats = self.meta['scaling'][SPLIT_SCALING[split]] if split is not None else None
+            if stats is None:
+                raise ValueError("Scaling needs a split to pick the training statistics")
+            mean, scale = np.asarray(stats['mean']), np.asarray(stats['scale'])
+            if col_idx is not None:
+                mean, scale = mean[col_idx], scale[col_idx]
+            values = (values - mean) / scale
+        return values
+
+    def frame(self, split=None, columns=None):
+        """matrix() as a DataFrame with the training column names (what the served models were fit on)."""
+        return pd.DataFrame(self.matrix(split, columns), columns=columns or self.feature_columns, copy=False)
+
+    def scaler(self, group):
+        """A fitted StandardScaler equivalent to the lazy scaling applied for ``group`` splits."""
+        stats = self.meta['scaling'][group]
+        scaler = StandardScaler()
+        scaler.mean_ = np.asarray(stats['mean'])
+        scaler.scale_ = np.asarray(stats['scale'])
+        scaler.var_ = np.asarray(stats['var'])
+        scaler.n_samples_seen_ = stats['n_samples_seen']
+        scaler.n_features_in_ = len(stats['mean'])
+        scaler.feature_names_in_ = np.asarray(self.feature_columns, dtype=object)
+        return scaler
+
+    def streams(self, split=None):
+        """STREAM_COLUMNS of ``split`` (timestamps as epoch seconds), or None for a store written without them."""
+        if not self.meta.get('streams'):
+            return None
+        rows = slice(None) if split is None else self.split(split)
+        return pd.DataFrame({name: np.asarray(self._load(f'stream_{name}.npy')[rows]) for name in STREAM_COLUMNS})
+
+    def temporal_frame(self, split=None):
+        """frame() with FEATURES_TEMPORAL appended, as serving would have computed them.
+
+        Every stored reading is replayed through its (mine, sector) stream in
+        time order once, whatever the split, so a row's windows also hold the
+        other split's earlier readings, just like the live streams do.
+        """
+        streams = self.streams()
+        if streams is None:
+            raise ValueError(f"Dataset store {self.path} has no {'/'.join(STREAM_COLUMNS)} columns")
+        if self._temporal is None:
+            self._temporal = add_temporal_features(streams, np.asarray(self.features))
+        rows = slice(None) if split is None else self.split(split)
+        return self.frame(split).assign(**dict(zip(FEATURES_TEMPORAL, self._temporal[rows].T)))
@@ -0,0 +1,154 @@
+# Shared feature engineering for training, serving and dataset generation
+import numpy as np
+import pandas as pd
+
+FEATURES_BASE = [
+    'slope_height_m', 'slope_angle_deg', 'cohesion_kpa', 'friction_angle_deg',
+    'unit_weight_kn_m3', 'rqd_percent', 'joint_spacing_m', 'rainfall_mm',
+    'temperature_range_c', 'groundwater_depth_m', 'freeze_thaw_cycles',
+    'blasting_distance_m', 'vibration_intensity', 'days_since_blast',
+    'mining_depth_m', 'days_since_rain', 'season_encoded'
+]
+
+FEATURES_DERIVED = [
+    'stability_index', 'weather_risk_score', 'operational_stress',
+    'geological_weakness', 'slope_steepness_factor'
+]
+
+feature_columns = FEATURES_BASE + FEATURES_DERIVED
+
+# Optional rolling aggregates per sensor stream (temporal_features.py), appended after feature_columns
+FEATURES_TEMPORAL = [
+    'rainfall_24h_mm', 'rainfall_7d_mm', 'vibration_max_7d',
+    'groundwater_depth_ewma', 'freeze_thaw_ewma'
+]
+
+temporal_feature_columns = feature_columns + FEATURES_TEMPORAL
+
+# Columns that place a reading in its sensor stream: the time axis and the (mine, sector) key
+STREAM_COLUMNS = ['timestamp', 'mine_id', 'sector_id']
+
+# Base readings the derived formulas depend on; these have no sensible default
+FEATURES_REQUIRED = [
+    'slope_height_m', 'slope_angle_deg', 'cohesion_kpa', 'friction_angle_deg',
+    'unit_weight_kn_m3', 'rqd_percent', 'joint_spacing_m', 'rainfall_mm',
+    'temperature_range_c', 'blasting_distance_m', 'vibration_intensity',
+    'days_since_blast', 'days_since_rain'
+]
+
+# Every other base reading falls back to 0 when absent
+FEATURE_DEFAULT = 0.0
+
+
+def _column_getter(data):
+    """Return (n_rows, getter) where getter(name) gives a float64 column or None if absent."""
+    if isinstance(data, pd.DataFrame):
+        return len(data), lambda name: (
+            pd.to_numeric(data[name], errors='coerce').to_numpy(dtype=np.float64)
+            if name in data.columns else None
+        )
+
+    if isinstance(data, np.ndarray) and data.dtype.names is not None:
+        data = data.reshape(-1)
+        return len(data), lambda name: (
+            data[name].astype(np.float64) if name in data.dtype.names else None
+        )
+
+    if isinstance(data, dict):
+        data = [data]
+    if isinstance(data, (list, tuple)):
+        records = data
+        present = set().union(*(r.keys() for r in records)) if records else set()
+
+        def getter(name):
+            if name not in present:
+                return None
+            return np.fromiter(
+                (np.nan if r.get(name) is None else r.get(name) for r in records),
+                dtype=np.float64, count=len(records)
+            )
+        return len(records), getter
+
+    raise TypeError(f"Unsupported feature input type: {type(data).__name__}")
+
+
+def derive_features(col, out=None):
+    """Compute the five derived features from a name -> column mapping, in FEATURES_DERIVED order."""
+    n = len(col['slope_height_m'])
+    if out is None:
+        out = np.empty((n, len(FEATURES_DERIVED)), dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight_height = col['unit_weight_kn_m3'] * col['slope_height_m']
+        slope_rad = np.radians(col['slope_angle_deg'])
+        out[:, 0] = (col['cohesion_kpa'] + weight_height * np.tan(np.radians(col['friction_angle_deg']))) / \
+                    (weight_height * np.sin(slope_rad))
+        out[:, 1] = (col['rainfall_mm'] * col['temperature_range_c']) / (col['days_since_rain'] + 1)
+        out[:, 2] = col['vibration_intensity'] / (col['blasting_distance_m'] + 1) * \
+                    (60 - col['days_since_blast']) / 60
+        out[:, 3] = (100 - col['rqd_percent']) / col['joint_spacing_m']
+        out[:, 4] = np.tan(slope_rad) * col['slope_height_m']
+    return out
+
+
+def build_feature_matrix(data):
+    """Build a C-contiguous float64 matrix in feature_columns order.
+
+    Accepts a single reading dict, a list of dicts, a DataFrame or a structured
+    NumPy array. Raises KeyError when a field the derived features need is
+    missing and ValueError when it is present but empty.
+    """
+    n, get = _column_getter(data)
+    matrix = np.empty((n, len(feature_columns)), dtype=np.float64)
+
+    col = {}
+    missing = []
+    for i, name in enumerate(FEATURES_BASE):
+        values = get(name)
+        if values is None:
+            if name in FEATURES_REQUIRED:
+                missing.append(name)
+                continue
+            matrix[:, i] = FEATURE_DEFAULT
+        else:
+            matrix[:, i] = values
+        col[name] = matrix[:, i]
+    if missing:
+        raise KeyError(f"Missing sensor fields: {', '.join(missing)}")
+
+    base = matrix[:, :len(FEATURES_BASE)]
+    nan_mask = np.isnan(base)
+    if nan_mask.any():
+        required_idx = [FEATURES_BASE.index(name) for name in FEATURES_REQUIRED]
+        bad = nan_mask[:, required_idx].any(axis=0)
+        if bad.any():
+            names = [FEATURES_REQUIRED[i] for i in np.flatnonzero(bad)]
+            raise ValueError(f"Empty values for sensor fields: {', '.join(names)}")
+        base[nan_mask] = FEATURE_DEFAULT
+
+    derive_features(col, out=matrix[:, len(FEATURES_BASE):])
+    return matrix
+
+
+def columns_for(n_columns):
+    """Column names of a feature matrix: feature_columns, or temporal_feature_columns when it is wider."""
+    if n_columns == len(feature_columns):
+        return feature_columns
+    if n_columns == len(temporal_feature_columns):
+        return temporal_feature_columns
+    raise ValueError(f"Feature matrix has {n_columns} columns, expected {len(feature_columns)} "
+                     f"or {len(temporal_feature_columns)}")
+
+
+def build_feature_frame(data):
+    """build_feature_matrix wrapped in a DataFrame with the training column names."""
+    return pd.DataFrame(build_feature_matrix(data), columns=feature_columns, copy=False)
+
+
+def add_derived_features(df):
+    """Append the derived feature columns to a DataFrame of base readings, in place."""
+    col = {name: df[name].to_numpy(dtype=np.float64) for name in FEATURES_REQUIRED}
+    derived = derive_features(col)
+    for i, name in enumerate(FEATURES_DERIVED):
+        df[name] = derived[:, i]
+    return df
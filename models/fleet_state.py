@@ -0,0 +1,163 @@
+# Latest scores for every (mine, sector) of the fleet, kept in flat arrays indexed by a dense slot id
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from features import build_feature_matrix
+from time_utils import to_epoch
+
+DEFAULT_SECTOR = 'DEFAULT'
+
+
+class FleetState:
+    """Per-(mine, sector) scoring state for many tenants.
+
+    Every sector gets a dense slot id the first time it reports; its latest
+    binary probability, multiclass label and confidence, timestamp and
+    reading count live at that slot in flat NumPy arrays that grow by
+    doubling. Each mine keeps the slot ids of its sectors, so "current risk
+    for every sector of mine X" is one fancy-index gather of O(sectors)
+    without touching the models. ``ingest`` scores an interleaved batch from
+    any number of mines with a single call to ``predictor`` (or the one
+    passed per batch, e.g. the model version pinned by the request).
+    Multiclass labels are stored decoded (as codes into a table of label
+    names seen so far), so a later model version with other classes cannot
+    relabel what an earlier one scored.
+    """
+
+    def __init__(self, predictor=None, initial_capacity=1024):
+        self.predictor = predictor
+        self._lock = threading.RLock()
+        self._mines = {}      # mine_id -> {sector_id: slot}
+        self._mine_slots = {}  # mine_id -> int64 array of slots, in sector registration order
+        self._size = 0
+        self._label_codes = {}
+        # Label names by code, with 'N/A' last so the -1 of an unscored slot gathers it
+        self._label_table = np.array(['N/A'], dtype=object)
+        self._allocate(initial_capacity)
+
+    def _allocate(self, capacity):
+        old = getattr(self, '_columns', None)
+        columns = {
+            # float64 so the risk ladder classifies borderline scores exactly as the per-reading path does
+            'binary_probability': np.full(capacity, np.nan, dtype=np.float64),
+            'binary_prediction': np.full(capacity, -1, dtype=np.int8),
+            'mc_label': np.full(capacity, -1, dtype=np.int16),
+            'mc_confidence': np.full(capacity, np.nan, dtype=np.float32),
+            'timestamp': np.full(capacity, -np.inf, dtype=np.float64),
+            'readings': np.zeros(capacity, dtype=np.int64),
+        }
+        if old is not None:
+            for name, values in columns.items():
+                values[:self._size] = old[name][:self._size]
+        self._columns = columns
+        self.capacity = capacity
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def mines(self):
+        return list(self._mines)
+
+    def _label_codes_for(self, labels):
+        """Code per multiclass label, adding unseen names to the label table (caller holds the lock)."""
+        names, inverse = np.unique(np.asarray(labels).astype(str), return_inverse=True)
+        names = names.tolist()
+        added = [name for name in names if name not in self._label_codes]
+        if added:
+            for name in added:
+                self._label_codes[name] = len(self._label_codes)
+            self._label_table = np.array(list(self._label_codes) + ['N/A'], dtype=object)
+        return np.array([self._label_codes[name] for name in names], dtype=np.int16)[inverse]
+
+    def _gather(self, slots):
+        state = {name: values[slots] for name, values in self._columns.items()}
+        state['mc_label'] = self._label_table[state['mc_label']]
+        return state
+
+    def _slots_for(self, mine_ids, sector_ids):
+        """Slot id per reading, registering unseen sectors (caller holds the lock)."""
+        slots = np.empty(len(mine_ids), dtype=np.int64)
+        for i, (mine_id, sector_id) in enumerate(zip(mine_ids, sector_ids)):
+            sectors = self._mines.setdefault(mine_id, {})
+            slot = sectors.get(sector_id)
+            if slot is None:
+                if self._size == self.capacity:
+                    self._allocate(self.capacity * 2)
+                slot = sectors[sector_id] = self._size
+                self._size += 1
+                self._mine_slots.pop(mine_id, None)
+            slots[i] = slot
+        return slots
+
+    def ingest(self, readings, mine_id=None, features=None, predictor=None):
+        """Score a batch of reading dicts and fold them into the fleet state.
+
+        Readings carry ``mine_id`` (or take the ``mine_id`` argument) and an
+        optional ``sector_id``. Within the batch, and against what is already
+        stored, only the newest reading of a sector becomes its current
+        state; older ones are still scored and returned. ``features`` is the
+        readings' feature matrix when the caller already built it. Returns
+        the predictor's (binary, multiclass) scores in input order.
+        """
+        if not readings:
+            raise ValueError("No readings provided")
+        mine_ids = [str(mine_id if mine_id is not None else r.get('mine_id') or '') for r in readings]
+        if not all(mine_ids):
+            raise ValueError("Every reading needs a mine_id")
+        sector_ids = [str(r.get('sector_id') or DEFAULT_SECTOR) for r in readings]
+        now = datetime.now().timestamp()
+        timestamps = np.array([to_epoch(r.get('timestamp')) or now for r in readings], dtype=np.float64)
+
+        if features is None:
+            features = build_feature_matrix(readings)
+        scores = (predictor or self.predictor).score(features)
+        binary, multiclass = scores['binary'], scores['multiclass']
+
+        with self._lock:
+            slots = self._slots_for(mine_ids, sector_ids)
+            columns = self._columns
+            # Last reading per slot in (slot, timestamp) order, kept only if it is not older than the stored one
+            order = np.lexsort((timestamps, slots))
+            last = order[np.r_[slots[order][1:] != slots[order][:-1], True]]
+            last = last[timestamps[last] >= columns['timestamp'][slots[last]]]
+            target = slots[last]
+
+            columns['binary_probability'][target] = binary['probability'][last]
+            columns['binary_prediction'][target] = binary['prediction'][last]
+            if multiclass is not None:
+                columns['mc_label'][target] = self._label_codes_for(multiclass['prediction_label'][last])
+                columns['mc_confidence'][target] = multiclass['confidence'][last]
+            columns['timestamp'][target] = timestamps[last]
+            np.add.at(columns['readings'], slots, 1)
+        return binary, multiclass
+
+    def _slots_of(self, mine_id):
+        slots = self._mine_slots.get(mine_id)
+        if slots is None:
+            slots = self._mine_slots[mine_id] = np.fromiter(self._mines[mine_id].values(), dtype=np.int64)
+        return slots
+
+    def mine_state(self, mine_id):
+        """Column arrays (plus ``sector_id``) for every sector of one mine; KeyError for unknown mines."""
+        with self._lock:
+            if mine_id not in self._mines:
+                raise KeyError(mine_id)
+            slots = self._slots_of(mine_id)
+            state = self._gather(slots)
+            state['sector_id'] = list(self._mines[mine_id])
+        return state
+
+    def sector_state(self, mine_id, sector_id):
+        with self._lock:
+            slot = self._mines[mine_id][sector_id]
+            state = self._gather([slot])
+        state['sector_id'] = [sector_id]
+        return state
+
+    def fleet_state(self):
+        """{mine_id: column arrays} for every mine, gathered under one lock."""
+        with self._lock:
+            return {mine_id: self.mine_state(mine_id) for mine_id in self._mines}
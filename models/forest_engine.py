@@ -0,0 +1,189 @@
+# Array-based inference engine for fitted RandomForestClassifier models
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Rows scored per traversal pass; bounds the (rows x trees x classes) leaf gather
+ROW_CHUNK = 2048
+
+LEAF = -1
+
+
+class PackedForest:
+    """A fitted forest flattened into packed node arrays.
+
+    All trees share one set of node arrays; ``roots`` holds each tree's first
+    node and ``children`` holds interleaved (left, right) pointers. Leaves have
+    ``feature == LEAF`` and ``value`` holds per-leaf class probabilities.
+    """
+
+    ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots', 'classes_')
+    engine = 'forest'
+
+    def __init__(self, feature, threshold, children, value, roots, classes_, max_depth,
+                 n_features_in_, feature_names_in_=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes_
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features_in_)
+        self.feature_names_in_ = feature_names_in_
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def _as_matrix(self, X):
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names_in_ is not None:
+                X = X[list(self.feature_names_in_)]
+            X = X.to_numpy()
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but the forest expects {self.n_features_in_}")
+        # sklearn compares float32-cast inputs against the thresholds; do the same so splits agree
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_samples, n_estimators)."""
+        X = self._as_matrix(X)
+        return self._apply(X)
+
+    def _apply(self, X):
+        n, n_features = X.shape
+        n_trees = len(self.roots)
+        X_flat = X.ravel()
+        node = np.tile(self.roots, n)
+        row_offset = np.repeat(np.arange(n, dtype=np.int32) * n_features, n_trees)
+
+        # Walk one level per pass, dropping (row, tree) pairs as soon as they reach a leaf
+        active = np.flatnonzero(np.take(self.feature, node) != LEAF)
+        while active.size:
+            current = np.take(node, active)
+            x = np.take(X_flat, np.take(row_offset, active) + np.take(self.feature, current))
+            current = np.take(self.children, 2 * current + (x > np.take(self.threshold, current)))
+            node[active] = current
+            active = active[np.take(self.feature, current) != LEAF]
+        return node.reshape(n, n_trees)
+
+    def predict_proba(self, X):
+        X = self._as_matrix(X)
+        proba = np.empty((X.shape[0], len(self.classes_)), dtype=np.float64)
+        for start in range(0, X.shape[0], ROW_CHUNK):
+            leaves = self._apply(X[start:start + ROW_CHUNK])
+            proba[start:start + ROW_CHUNK] = np.take(self.value, leaves, axis=0).mean(axis=1)
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path):
+        """Write one .npy per array plus meta.json, so the arrays can be memory-mapped back."""
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        meta = {
+            'engine': self.engine,
+            'max_depth': self.max_depth,
+            'n_features_in_': self.n_features_in_,
+            'feature_names_in_': None if self.feature_names_in_ is None else list(self.feature_names_in_),
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Load a saved forest; with mmap_mode='r' every process maps the same page-cache copy."""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in cls.ARRAYS}
+        names = meta['feature_names_in_']
+        return cls(max_depth=meta['max_depth'], n_features_in_=meta['n_features_in_'],
+                   feature_names_in_=np.asarray(names) if names is not None else None, **arrays)
+
+
+def float32_thresholds(threshold):
+    """The largest float32 at or below each threshold.
+
+    Inputs are compared as float32, and for a float32 ``x``, ``x > t`` holds
+    exactly when ``x`` is above the float32 value below ``t``. So every split
+    goes the same way as with the float64 threshold, in half the bytes.
+    """
+    threshold = np.asarray(threshold, dtype=np.float64)
+    rounded = threshold.astype(np.float32)
+    above = rounded.astype(np.float64) > threshold
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def export_forest(model, dtype=np.float64):
+    """Flatten a fitted RandomForestClassifier (or single-output tree ensemble) into a PackedForest.
+
+    ``dtype=np.float32`` stores thresholds (rounded down, so splits are
+    unchanged) and leaf probabilities as float32: half the node bytes, with
+    probabilities differing from sklearn's by float32 rounding only.
+    """
+    estimators = getattr(model, 'estimators_', None)
+    if not estimators:
+        raise ValueError("Model is not a fitted tree ensemble")
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Multi-output forests are not supported")
+
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        n = tree.node_count
+        ids = np.arange(n)
+        is_leaf = tree.children_left == -1
+
+        left = np.where(is_leaf, ids, tree.children_left) + offset
+        right = np.where(is_leaf, ids, tree.children_right) + offset
+
+        value = tree.value[:, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1.0
+        value = value / totals
+        if value.shape[1] != len(model.classes_):
+            raise ValueError("Tree class count does not match the forest's classes_")
+
+        features.append(np.where(is_leaf, LEAF, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        children.append(np.column_stack([left, right]).ravel().astype(np.int32))
+        values.append(value)
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    threshold = np.concatenate(thresholds).astype(np.float64)
+    if np.dtype(dtype) == np.float32:
+        threshold = float32_thresholds(threshold)
+    names = getattr(model, 'feature_names_in_', None)
+    return PackedForest(
+        feature=np.concatenate(features),
+        threshold=threshold,
+        children=np.concatenate(children),
+        value=np.concatenate(values).astype(dtype),
+        roots=np.asarray(roots, dtype=np.int32),
+        classes_=np.asarray(model.classes_.tolist()),
+        max_depth=max_depth,
+        n_features_in_=model.n_features_in_,
+        feature_names_in_=np.asarray(names.tolist(), dtype=str) if names is not None else None,
+    )
@@ -0,0 +1,221 @@
+# Fixed-capacity columnar ring buffer for dashboard prediction history
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from features import FEATURES_BASE
+from risk_policy import RISK_LEVELS
+from time_utils import to_epoch
+
+MAX_CLASSES = 4
+LABEL_WIDTH = 16
+
+# (column, dtype, per-row shape)
+SCHEMA = (
+    [('timestamp', np.float64, ()), ('mine_id', f'S{LABEL_WIDTH}', ())]
+    + [(name, np.float64, ()) for name in FEATURES_BASE]
+    + [
+        ('binary_prediction', np.int8, ()),
+        ('binary_confidence', np.float64, ()),
+        ('risk_level', np.int8, ()),
+        ('mc_label', f'S{LABEL_WIDTH}', ()),
+        ('mc_confidence', np.float64, ()),
+        ('mc_probabilities', np.float64, (MAX_CLASSES,)),
+    ]
+)
+
+MAGIC = 0x524B4849  # "RKHI"
+HEADER = np.dtype([('magic', np.int64), ('capacity', np.int64), ('head', np.int64), ('count', np.int64)])
+
+
+def record_from_columns(columns, i):
+    """Row ``i`` of SCHEMA columns (a column dict or a structured array) as a dashboard record."""
+    timestamp = datetime.fromtimestamp(float(columns['timestamp'][i])).isoformat()
+    sensor_data = {'timestamp': timestamp, 'mine_id': columns['mine_id'][i].decode()}
+    for name in FEATURES_BASE:
+        value = float(columns[name][i])
+        sensor_data[name] = None if np.isnan(value) else value
+
+    probabilities = columns['mc_probabilities'][i]
+    binary_prediction = int(columns['binary_prediction'][i])
+    binary_confidence = float(columns['binary_confidence'][i])
+    mc_confidence = float(columns['mc_confidence'][i])
+    return {
+        'timestamp': timestamp,
+        'sensor_data': sensor_data,
+        'prediction': {
+            'binary_result': {
+                'prediction': None if binary_prediction < 0 else binary_prediction,
+                'confidence': 0.0 if np.isnan(binary_confidence) else binary_confidence,
+                'risk_level': RISK_LEVELS[int(columns['risk_level'][i])],
+            },
+            'multiclass_result': {
+                'prediction_label': columns['mc_label'][i].decode(),
+                'confidence': 0.0 if np.isnan(mc_confidence) else mc_confidence,
+                'probabilities': probabilities[~np.isnan(probabilities)].tolist(),
+            },
+        },
+    }
+
+
+class HistoryStore:
+    """Bounded history of scored readings stored column by column.
+
+    Appends are O(1) and overwrite the oldest row once ``capacity`` is reached.
+    With ``path`` set the columns live in a memory-mapped file, so every
+    worker process on the host reads and writes the same history and it
+    survives restarts; writers serialise on an flock of that file.
+    """
+
+    def __init__(self, capacity=20000, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        if path is None:
+            self.header = np.zeros(1, dtype=HEADER)
+            self.header['magic'] = MAGIC
+            self.header['capacity'] = capacity
+            self.columns = {name: np.zeros((capacity,) + shape, dtype=dtype) for name, dtype, shape in SCHEMA}
+            self._file = None
+        else:
+            self._open_mapped(capacity, path)
+
+    @property
+    def capacity(self):
+        return int(self.header['capacity'][0])
+
+    def __len__(self):
+        return int(self.header['count'][0])
+
+    def _open_mapped(self, capacity, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a+b')
+        with self._exclusive():
+            size = os.fstat(self._file.fileno()).st_size
+            if size >= HEADER.itemsize:
+                header = np.memmap(path, dtype=HEADER, mode='r', shape=(1,))
+                if int(header['magic'][0]) == MAGIC:
+                    capacity = int(header['capacity'][0])
+                del header
+            total = HEADER.itemsize + sum(np.dtype(dtype).itemsize * int(np.prod(shape, dtype=np.int64)) * capacity
+                                          for _, dtype, shape in SCHEMA)
+            if size != total:
+                self._file.truncate(0)
+                self._file.truncate(total)
+            self.header = np.memmap(path, dtype=HEADER, mode='r+', shape=(1,))
+            if int(self.header['magic'][0]) != MAGIC:
+                self.header['magic'] = MAGIC
+                self.header['capacity'] = capacity
+                self.header['head'] = 0
+                self.header['count'] = 0
+
+            self.columns = {}
+            offset = HEADER.itemsize
+            for name, dtype, shape in SCHEMA:
+                column = np.memmap(path, dtype=dtype, mode='r+', offset=offset, shape=(capacity,) + shape)
+                self.columns[name] = column
+                offset += column.nbytes
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock:
+            if self._file is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if self._file is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def append(self, record):
+        """Store one /simulate-and-predict style record ({'sensor_data', 'prediction', 'timestamp'})."""
+        sensor = record.get('sensor_data') or {}
+        prediction = record.get('prediction') or {}
+        binary = prediction.get('binary_result') or {}
+        multiclass = prediction.get('multiclass_result') or {}
+
+        timestamp = to_epoch(record.get('timestamp') or sensor.get('timestamp'))
+        probabilities = np.full(MAX_CLASSES, np.nan)
+        mc_probs = (multiclass.get('probabilities') or [])[:MAX_CLASSES]
+        probabilities[:len(mc_probs)] = mc_probs
+        risk_level = binary.get('risk_level', 'UNKNOWN')
+        binary_prediction = binary.get('prediction')
+
+        row = {
+            'timestamp': timestamp if timestamp is not None else datetime.now().timestamp(),
+            'mine_id': str(sensor.get('mine_id', '')).encode()[:LABEL_WIDTH],
+            'binary_prediction': -1 if binary_prediction is None else binary_prediction,
+            'binary_confidence': binary.get('confidence', np.nan),
+            'risk_level': RISK_LEVELS.index(risk_level) if risk_level in RISK_LEVELS else 0,
+            'mc_label': str(multiclass.get('prediction_label', 'N/A')).encode()[:LABEL_WIDTH],
+            'mc_confidence': multiclass.get('confidence', np.nan),
+            'mc_probabilities': probabilities,
+        }
+        for name in FEATURES_BASE:
+            value = sensor.get(name)
+            row[name] = np.nan if value is None else value
+
+        with self._exclusive():
+            head = int(self.header['head'][0])
+            for name, value in row.items():
+                self.columns[name][head] = value
+            self.header['head'] = (head + 1) % self.capacity
+            self.header['count'] = min(len(self) + 1, self.capacity)
+
+    def _ordered_index(self):
+        count = len(self)
+        head = int(self.header['head'][0])
+        return (head - count + np.arange(count)) % self.capacity
+
+    def query(self, since=None, until=None, limit=None, downsample=None):
+        """Rows oldest-first as dashboard records.
+
+        ``since``/``until`` are ISO timestamps or epoch seconds; ``limit`` keeps
+        the most recent N matches; ``downsample`` splits the time range into N
+        equal-width buckets (``since``..``until``, or the span of the matches)
+        and keeps the highest-risk reading of each non-empty bucket, so peaks
+        are not lost and stay in the window they happened in.
+        """
+        with self._exclusive():
+            index = self._ordered_index()
+            snapshot = {name: column[index] for name, column in self.columns.items()}
+
+        timestamps = snapshot['timestamp']
+        mask = np.ones(len(timestamps), dtype=bool)
+        since, until = to_epoch(since), to_epoch(until)
+        if since is not None:
+            mask &= timestamps >= since
+        if until is not None:
+            mask &= timestamps <= until
+        selected = np.flatnonzero(mask)
+
+        # Readings can be appended slightly out of order by different workers
+        selected = selected[np.argsort(timestamps[selected], kind='stable')]
+        if limit is not None:
+            selected = selected[-int(limit):] if int(limit) > 0 else selected[:0]
+        if downsample is not None and 0 < int(downsample) < len(selected):
+            # With a limit the range starts at the oldest reading kept, not at ``since``
+            selected = self._downsample(selected, timestamps, snapshot['binary_confidence'], int(downsample),
+                                        since if limit is None else None, until)
+
+        return [record_from_columns(snapshot, i) for i in selected]
+
+    @staticmethod
+    def _downsample(selected, timestamps, confidence, buckets, since=None, until=None):
+        times = timestamps[selected]
+        start = times[0] if since is None else since
+        end = times[-1] if until is None else until
+        width = (end - start) / buckets
+        if width > 0:
+            bucket = np.clip(((times - start) // width).astype(np.int64), 0, buckets - 1)
+        else:
+            bucket = np.zeros(len(times), dtype=np.int64)
+        conf = np.nan_to_num(confidence[selected], nan=-1.0)
+        # Sort by (bucket, confidence) and keep the last row of each bucket; positions back in time order
+        order = np.lexsort((conf, bucket))
+        last = np.flatnonzero(np.diff(bucket[order], append=buckets))
+        return selected[np.sort(order[last])]
@@ -0,0 +1,276 @@
+# Serving engine for KNeighborsClassifier winners: scaler baked in, cluster index built at export
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+# Up to this many reference rows an exact blocked matrix-product scan is fast enough
+BRUTE_FORCE_LIMIT = 50000
+# Query rows per distance block; bounds the (rows x reference rows) distance matrix
+QUERY_CHUNK = 256
+# Clusters scanned per query by the inverted-file index; export raises it until the index reaches MIN_RECALL
+DEFAULT_N_PROBE = 16
+# Neighbour recall against exact search the index must reach at export, or the model is served exactly
+MIN_RECALL = 0.99
+# Reference rows used as leave-one-out queries when measuring that recall
+RECALL_SAMPLE = 500
+
+
+class PackedKNN:
+    """A fitted k-nearest-neighbours classifier with its StandardScaler folded in.
+
+    Raw (unscaled) feature rows go in; they are standardised with the baked
+    ``mean``/``scale`` and compared against ``data``, the training rows
+    already in scaled space. Small reference sets are scanned exactly with
+    blocked BLAS distance products. Large ones carry an inverted-file index
+    built at export: ``data`` is sorted by k-means cell (``centroids``,
+    ``offsets``) and a query only scans its ``n_probe`` nearest cells, which
+    makes the search approximate but keeps its cost near-constant in n.
+    ``recall`` is the index's measured neighbour recall (1.0 when exact).
+    """
+
+    ARRAYS = ('mean', 'scale', 'data', 'sq_norms', 'labels', 'classes_')
+    INDEX_ARRAYS = ('centroids', 'offsets')
+    engine = 'knn'
+
+    def __init__(self, mean, scale, data, sq_norms, labels, classes_, n_neighbors, weights, n_features_in_,
+                 feature_names_in_=None, centroids=None, offsets=None, n_probe=DEFAULT_N_PROBE, recall=1.0):
+        self.mean = mean
+        self.scale = scale
+        self.data = data
+        self.sq_norms = sq_norms
+        self.labels = labels
+        self.classes_ = classes_
+        self.n_neighbors = int(n_neighbors)
+        self.weights = weights
+        self.n_features_in_ = int(n_features_in_)
+        self.feature_names_in_ = feature_names_in_
+        self.centroids = centroids
+        self.offsets = offsets
+        self.n_probe = int(n_probe)
+        self.recall = float(recall)
+
+    @property
+    def n_samples_fit(self):
+        return len(self.data)
+
+    @property
+    def indexed(self):
+        return self.centroids is not None
+
+    @property
+    def nbytes(self):
+        names = self.ARRAYS + (self.INDEX_ARRAYS if self.indexed else ())
+        return sum(getattr(self, name).nbytes for name in names)
+
+    def _as_scaled(self, X):
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names_in_ is not None:
+                X = X[list(self.feature_names_in_)]
+            X = X.to_numpy()
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but the model expects {self.n_features_in_}")
+        return (X - self.mean) / self.scale
+
+    def _brute_kneighbors(self, X):
+        k = self.n_neighbors
+        dist = np.empty((len(X), k))
+        ind = np.empty((len(X), k), dtype=np.intp)
+        for start in range(0, len(X), QUERY_CHUNK):
+            block = X[start:start + QUERY_CHUNK]
+            # |x - r|^2 = |x|^2 - 2 x.r + |r|^2, one matrix product per block
+            d2 = np.einsum('ij,ij->i', block, block)[:, None] - 2.0 * (block @ self.data.T) + self.sq_norms
+            nearest = np.argpartition(d2, k - 1, axis=1)[:, :k]
+            nearest_d2 = np.take_along_axis(d2, nearest, axis=1)
+            order = np.argsort(nearest_d2, axis=1, kind='stable')
+            ind[start:start + QUERY_CHUNK] = np.take_along_axis(nearest, order, axis=1)
+            dist[start:start + QUERY_CHUNK] = np.sqrt(np.maximum(np.take_along_axis(nearest_d2, order, axis=1), 0))
+        return dist, ind
+
+    def _indexed_kneighbors(self, X):
+        k = self.n_neighbors
+        n_probe = min(self.n_probe, len(self.centroids))
+        x_sq = np.einsum('ij,ij->i', X, X)
+        centroid_d2 = x_sq[:, None] - 2.0 * (X @ self.centroids.T) + np.einsum('ij,ij->i', self.centroids,
+                                                                                self.centroids)
+        probes = np.argpartition(centroid_d2, n_probe - 1, axis=1)[:, :n_probe]
+
+        dist = np.empty((len(X), k))
+        ind = np.empty((len(X), k), dtype=np.intp)
+        starts, ends = self.offsets[probes], self.offsets[probes + 1]
+        for i in range(len(X)):
+            # Row ids of every point in the probed cells, built without a Python loop over cells
+            lengths = ends[i] - starts[i]
+            total = int(lengths.sum())
+            if total < k:
+                dist[i:i + 1], ind[i:i + 1] = self._brute_kneighbors(X[i:i + 1])
+                continue
+            candidates = np.repeat(starts[i] - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+            d2 = x_sq[i] - 2.0 * (self.data[candidates] @ X[i]) + self.sq_norms[candidates]
+            nearest = np.argpartition(d2, k - 1)[:k]
+            nearest = nearest[np.argsort(d2[nearest], kind='stable')]
+            ind[i] = candidates[nearest]
+            dist[i] = np.sqrt(np.maximum(d2[nearest], 0))
+        return dist, ind
+
+    def kneighbors(self, X):
+        """(distances, indices) of the n_neighbors nearest training rows for raw feature rows X."""
+        X = self._as_scaled(X)
+        if self.indexed:
+            return self._indexed_kneighbors(X)
+        return self._brute_kneighbors(X)
+
+    def predict_proba(self, X):
+        dist, ind = self.kneighbors(X)
+        neighbour_labels = np.take(self.labels, ind)
+        if self.weights == 'distance':
+            with np.errstate(divide='ignore'):
+                weights = 1.0 / dist
+            # Exact matches take all the weight, as in scikit-learn
+            exact = np.isinf(weights)
+            exact_rows = exact.any(axis=1)
+            weights[exact_rows] = exact[exact_rows]
+        else:
+            weights = np.ones_like(dist)
+
+        n_classes = len(self.classes_)
+        flat = (np.arange(len(ind))[:, None] * n_classes + neighbour_labels).ravel()
+        proba = np.bincount(flat, weights=weights.ravel(), minlength=len(ind) * n_classes).reshape(len(ind), n_classes)
+        totals = proba.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1.0
+        return proba / totals
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path):
+        """One .npy per array (index included) plus meta.json, so everything can be memory-mapped back."""
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS + (self.INDEX_ARRAYS if self.indexed else ()):
+            np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        meta = {
+            'engine': self.engine,
+            'n_neighbors': self.n_neighbors,
+            'weights': self.weights,
+            'indexed': self.indexed,
+            'n_probe': self.n_probe,
+            'recall': self.recall,
+            'n_features_in_': self.n_features_in_,
+            'feature_names_in_': None if self.feature_names_in_ is None else list(self.feature_names_in_),
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        names = cls.ARRAYS + (cls.INDEX_ARRAYS if meta['indexed'] else ())
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+                  for name in names}
+        feature_names = meta['feature_names_in_']
+        return cls(n_neighbors=meta['n_neighbors'], weights=meta['weights'], n_features_in_=meta['n_features_in_'],
+                   feature_names_in_=np.asarray(feature_names) if feature_names is not None else None,
+                   n_probe=meta['n_probe'], recall=meta.get('recall', 1.0), **arrays)
+
+
+def build_ivf_index(data, n_cells=None, random_state=0):
+    """k-means cells for an inverted-file index: (cell order of the rows, centroids, cell offsets)."""
+    n_cells = n_cells or int(np.clip(np.sqrt(len(data)), 16, 4096))
+    sample = data
+    if len(data) > 64 * n_cells:
+        sample = data[np.random.default_rng(random_state).choice(len(data), 64 * n_cells, replace=False)]
+    kmeans = MiniBatchKMeans(n_clusters=n_cells, batch_size=8192, n_init=1, max_iter=50,
+                             random_state=random_state).fit(sample)
+    cells = np.concatenate([kmeans.predict(data[start:start + 65536]) for start in range(0, len(data), 65536)])
+    order = np.argsort(cells, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=n_cells))]).astype(np.int64)
+    return order, kmeans.cluster_centers_.astype(np.float64), offsets
+
+
+def index_recall(packed, sample_size=RECALL_SAMPLE, random_state=0):
+    """Share of the exact n_neighbors the index returns, over reference rows queried leave-one-out."""
+    rows = np.random.default_rng(random_state).choice(len(packed.data), min(sample_size, len(packed.data)),
+                                                      replace=False)
+    queries = packed.data[rows]
+    k = packed.n_neighbors
+    # One extra neighbour on both sides, so dropping the query's own row still leaves k to compare
+    packed.n_neighbors = k + 1
+    try:
+        _, exact = packed._brute_kneighbors(queries)
+        _, approx = packed._indexed_kneighbors(queries)
+    finally:
+        packed.n_neighbors = k
+    hits = 0
+    for row, exact_row, approx_row in zip(rows, exact, approx):
+        truth = exact_row[exact_row != row][:k]
+        hits += len(np.intersect1d(truth, approx_row[approx_row != row][:k]))
+    return hits / (k * len(rows))
+
+
+def tune_n_probe(packed, min_recall=MIN_RECALL, log=print):
+    """Double n_probe until the index reaches ``min_recall``; drop the index if even a wide probe cannot."""
+    n_cells = len(packed.centroids)
+    while True:
+        packed.recall = index_recall(packed)
+        if packed.recall >= min_recall:
+            log(f"KNN index: recall {packed.recall:.3f} at n_probe={packed.n_probe} of {n_cells} cells")
+            return packed
+        # Beyond a quarter of the cells the index scans too much of the data to beat the exact scan
+        if packed.n_probe * 2 > n_cells // 4:
+            break
+        packed.n_probe *= 2
+    log(f"KNN index: recall {packed.recall:.3f} at n_probe={packed.n_probe} is below {min_recall}; "
+        f"serving exact search")
+    packed.centroids = packed.offsets = None
+    packed.recall = 1.0
+    return packed
+
+
+def export_knn(model, scaler, n_probe=DEFAULT_N_PROBE, n_cells=None, min_recall=MIN_RECALL):
+    """Pack a fitted KNeighborsClassifier trained on ``scaler``-transformed features.
+
+    Reference sets above BRUTE_FORCE_LIMIT rows get an inverted-file index,
+    probed widely enough to reach ``min_recall`` against exact search.
+    """
+    if not hasattr(model, '_fit_X') or not hasattr(model, 'n_neighbors'):
+        raise ValueError("Model is not a fitted KNeighborsClassifier")
+    if model.effective_metric_ != 'euclidean':
+        raise ValueError(f"Only euclidean KNN is supported, got {model.effective_metric_}")
+    if model.weights not in ('uniform', 'distance'):
+        raise ValueError("Callable neighbour weights are not supported")
+    if getattr(model, 'outputs_2d_', False):
+        raise ValueError("Multi-output KNN is not supported")
+
+    data = np.asarray(model._fit_X, dtype=np.float64)
+    labels = np.asarray(model._y, dtype=np.int32)
+    centroids = offsets = None
+    if len(data) > BRUTE_FORCE_LIMIT:
+        order, centroids, offsets = build_ivf_index(data, n_cells)
+        data, labels = data[order], labels[order]
+    data = np.ascontiguousarray(data)
+
+    names = getattr(scaler, 'feature_names_in_', None)
+    if names is None:
+        names = getattr(model, 'feature_names_in_', None)
+    packed = PackedKNN(
+        mean=np.asarray(scaler.mean_, dtype=np.float64),
+        scale=np.asarray(scaler.scale_, dtype=np.float64),
+        data=data,
+        sq_norms=np.einsum('ij,ij->i', data, data),
+        labels=labels,
+        classes_=np.asarray(model.classes_.tolist()),
+        n_neighbors=model.n_neighbors,
+        weights=model.weights,
+        n_features_in_=model.n_features_in_,
+        feature_names_in_=np.asarray(list(names), dtype=str) if names is not None else None,
+        centroids=centroids,
+        offsets=offsets,
+        n_probe=n_probe,
+    )
+    return tune_n_probe(packed, min_recall) if packed.indexed else packed
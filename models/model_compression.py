@@ -0,0 +1,374 @@
+# Compression stage for the tuned forests: pruned, depth/leaf-limited and distilled candidates against the teacher
+# Usage: python model_compression.py --model-dir . --out compressed --latency-budget-us 300
+#        python model_compression.py --model-dir best_models --out compressed --max-size-kb 500
+import argparse
+import copy
+import json
+import os
+import pickle
+import shutil
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.model_selection import train_test_split
+
+from features import FEATURES_BASE, FEATURES_TEMPORAL, build_feature_matrix, feature_columns
+from model_store import (BINARY_MODEL_FILE, BINARY_SCALER_FILE, LABEL_ENCODER_FILE, MULTICLASS_MODEL_FILE, SCALER_FILE,
+                         export_engine)
+from predictor import PACKED_BATCH_LIMIT
+
+# Refits of the teacher's own parameters with one limit added
+PRUNE_TREES = [10, 25, 50]
+CCP_ALPHAS = [0.001, 0.005]
+MAX_DEPTHS = [6, 10]
+MAX_LEAF_NODES = [32, 128]
+
+# Students fit on the teacher's predict_proba over the transfer set
+STUDENTS = {
+    'distill_rf': lambda: RandomForestClassifier(n_estimators=25, max_depth=8, random_state=42),
+    'distill_gbm': lambda: HistGradientBoostingClassifier(max_iter=100, max_leaf_nodes=15, learning_rate=0.1,
+                                                          random_state=42),
+}
+TRANSFER_ROWS = 20000
+# Base readings with at most this many distinct values (season, freeze-thaw counts) are resampled, never jittered
+DISCRETE_LEVELS = 12
+
+# Share of the training split held out to rank candidates; the test split is only scored for the chosen one
+VALIDATION_FRACTION = 0.2
+# Single-row timings closer than this are timer noise; ranking treats them as equal and prefers smaller models
+LATENCY_RESOLUTION_US = 25.0
+
+SINGLE_ROW_REPEATS = 200
+BATCH_ROWS = 1000
+BATCH_REPEATS = 5
+
+MODEL_FILES = {'binary': BINARY_MODEL_FILE, 'multiclass': MULTICLASS_MODEL_FILE}
+REPORT_FILE = 'compression_report.json'
+
+
+def truncate_forest(model, n_trees):
+    """The first ``n_trees`` trees of a fitted forest, without refitting."""
+    pruned = copy.copy(model)
+    pruned.n_estimators = n_trees
+    pruned.estimators_ = model.estimators_[:n_trees]
+    return pruned
+
+
+def transfer_set(X, n_rows, seed=42):
+    """Training rows plus perturbed copies for the teacher to label.
+
+    Each synthetic row starts from a random training row, swaps some base
+    readings for another row's and jitters the continuous ones by 5% of
+    their spread, clipped to the observed range. The derived features are
+    rebuilt from the new readings, so rows stay consistent with what
+    serving computes.
+    """
+    rng = np.random.default_rng(seed)
+    base = X[FEATURES_BASE].to_numpy(dtype=np.float64)
+    n_new = max(n_rows - len(X), 0)
+    source = rng.integers(0, len(X), n_new)
+    synthetic = base[source].copy()
+
+    swap = rng.random(synthetic.shape) < 0.15
+    donors = base[rng.integers(0, len(X), n_new)]
+    synthetic[swap] = donors[swap]
+    for i in range(base.shape[1]):
+        column = base[:, i]
+        if len(np.unique(column)) > DISCRETE_LEVELS:
+            noise = rng.normal(0, 0.05 * column.std(), n_new)
+            synthetic[:, i] = np.clip(synthetic[:, i] + noise, column.min(), column.max())
+
+    rows = pd.DataFrame(build_feature_matrix(pd.DataFrame(synthetic, columns=FEATURES_BASE)), columns=feature_columns)
+    for name in X.columns:
+        if name in FEATURES_TEMPORAL:
+            # Rolling aggregates have no sensor reading to rebuild them from; they follow their source row
+            rows[name] = X[name].to_numpy()[source]
+    return pd.concat([X, rows[list(X.columns)]], ignore_index=True)
+
+
+def distill(student, teacher, X_transfer):
+    """Fit ``student`` to the teacher's class probabilities (soft targets).
+
+    Every transfer row appears once per class, weighted by the teacher's
+    probability for that class. Trees then learn the teacher's average
+    probabilities in their leaves, and boosting's log loss becomes cross
+    entropy against them.
+    """
+    proba = teacher.predict_proba(X_transfer)
+    n_rows, n_classes = proba.shape
+    X_soft = pd.DataFrame(np.repeat(X_transfer.to_numpy(), n_classes, axis=0), columns=X_transfer.columns)
+    y_soft = np.tile(teacher.classes_, n_rows)
+    return student.fit(X_soft, y_soft, sample_weight=proba.ravel())
+
+
+def build_candidates(teacher, X_train, y_train, transfer_rows=TRANSFER_ROWS, log=print):
+    """{name: fitted model} for every compression of ``teacher``; the teacher itself is included."""
+    candidates = {'teacher': teacher}
+    params = teacher.get_params()
+    for n_trees in PRUNE_TREES:
+        if n_trees < len(teacher.estimators_):
+            candidates[f'trees_{n_trees}'] = truncate_forest(teacher, n_trees)
+
+    refits = [(f'ccp_{alpha}', {'ccp_alpha': alpha}) for alpha in CCP_ALPHAS]
+    refits += [(f'depth_{depth}', {'max_depth': depth}) for depth in MAX_DEPTHS
+               if params.get('max_depth') is None or depth < params['max_depth']]
+    refits += [(f'leaves_{leaves}', {'max_leaf_nodes': leaves}) for leaves in MAX_LEAF_NODES]
+    for name, limit in refits:
+        start = time.perf_counter()
+        candidates[name] = clone(teacher).set_params(n_jobs=-1, **limit).fit(X_train, y_train)
+        candidates[name].set_params(n_jobs=params.get('n_jobs'))
+        log(f"  {name}: refit in {time.perf_counter() - start:.1f}s")
+
+    X_transfer = transfer_set(X_train, transfer_rows)
+    for name, make_student in STUDENTS.items():
+        start = time.perf_counter()
+        candidates[name] = distill(make_student(), teacher, X_transfer)
+        log(f"  {name}: distilled on {len(X_transfer):,} rows in {time.perf_counter() - start:.1f}s")
+    return candidates
+
+
+def _median_seconds(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def _score_auc(y_test, proba, binary):
+    try:
+        if binary:
+            auc = float(roc_auc_score(y_test, proba[:, 1]))
+        else:
+            auc = float(roc_auc_score(y_test, proba, multi_class='ovr'))
+    except (IndexError, ValueError):
+        # A model or test split with a single class
+        return None
+    return None if np.isnan(auc) else auc
+
+
+def evaluate(name, model, teacher_pred, X_test, y_test, binary):
+    """Quality, size and serving latency of one candidate.
+
+    Single rows are timed on the engine RockfallPredictor would serve them
+    with: the packed forest (float64 and float32) when the model exports,
+    sklearn otherwise. Batches above PACKED_BATCH_LIMIT always go to sklearn.
+    """
+    proba = model.predict_proba(X_test)
+    pred = model.classes_[proba.argmax(axis=1)]
+    row = {
+        'candidate': name,
+        'accuracy': float(accuracy_score(y_test, pred)),
+        'auc': _score_auc(y_test, proba, binary),
+        'fidelity': float(np.mean(pred == teacher_pred)),
+        'n_trees': len(getattr(model, 'estimators_', [])) or None,
+        'pickle_kb': round(len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1024, 1),
+    }
+
+    # The API hands the packed engines feature matrices; sklearn gets the named-column frame the predictor builds
+    X_single = X_test.iloc[:1]
+    X_single_matrix = X_single.to_numpy(dtype=np.float64)
+    X_batch = X_test.iloc[np.arange(BATCH_ROWS) % len(X_test)]
+    try:
+        packed = {dtype: export_engine(model, dtype=dtype) for dtype in ('float64', 'float32')}
+    except ValueError:
+        packed = {}
+    if packed:
+        row.update({
+            'n_nodes': packed['float64'].n_nodes,
+            'max_depth': packed['float64'].max_depth,
+            'packed_kb': round(packed['float64'].nbytes / 1024, 1),
+            'packed_f32_kb': round(packed['float32'].nbytes / 1024, 1),
+            'single_row_us': round(_median_seconds(lambda: packed['float64'].predict_proba(X_single_matrix),
+                                                   SINGLE_ROW_REPEATS) * 1e6, 1),
+            'single_row_f32_us': round(_median_seconds(lambda: packed['float32'].predict_proba(X_single_matrix),
+                                                       SINGLE_ROW_REPEATS) * 1e6, 1),
+        })
+    else:
+        row.update({
+            'n_nodes': None, 'max_depth': None, 'packed_kb': None, 'packed_f32_kb': None,
+            'single_row_us': round(_median_seconds(lambda: model.predict_proba(X_single),
+                                                   SINGLE_ROW_REPEATS) * 1e6, 1),
+            'single_row_f32_us': None,
+        })
+    row['batch_us_per_row'] = round(_median_seconds(lambda: model.predict_proba(X_batch), BATCH_REPEATS)
+                                    * 1e6 / len(X_batch), 2)
+    return row
+
+
+def validation_split(X_train, y_train, fraction=VALIDATION_FRACTION, seed=42):
+    """(X_fit, y_fit, X_val, y_val): a stratified slice of the training split held out for ranking."""
+    stratify = y_train if len(np.unique(y_train)) > 1 else None
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=fraction, random_state=seed,
+                                                  stratify=stratify)
+    return X_fit.reset_index(drop=True), y_fit, X_val.reset_index(drop=True), y_val
+
+
+def compress(task, teacher, X_fit, y_fit, X_val, y_val, transfer_rows=TRANSFER_ROWS, log=print):
+    """({name: model}, validation report DataFrame) for one task's teacher.
+
+    The teacher was fit on the whole training split, validation rows
+    included, so candidates are built from a copy refit on ``X_fit`` only;
+    every row of the report is then scored on rows none of them saw.
+    """
+    binary = task == 'binary'
+    log(f"\nCompressing the {task} model ({len(teacher.estimators_)} trees)...")
+    start = time.perf_counter()
+    n_jobs = teacher.get_params().get('n_jobs')
+    selection_teacher = clone(teacher).set_params(n_jobs=-1).fit(X_fit, y_fit).set_params(n_jobs=n_jobs)
+    log(f"  teacher: refit on {len(X_fit):,} rows for selection in {time.perf_counter() - start:.1f}s")
+    candidates = build_candidates(selection_teacher, X_fit, y_fit, transfer_rows, log)
+    teacher_pred = selection_teacher.predict(X_val)
+    rows = []
+    for name, model in candidates.items():
+        row = dict(evaluate(name, model, teacher_pred, X_val, y_val, binary), task=task)
+        rows.append(row)
+        auc = f"{row['auc']:.3f}" if row['auc'] is not None else '  n/a'
+        log(f"  {name:12s} acc {row['accuracy']:.3f}  auc {auc}  fidelity {row['fidelity']:.3f}  "
+            f"1 row {row['single_row_us']:8.1f} us  batch {row['batch_us_per_row']:6.2f} us/row  "
+            f"pickle {row['pickle_kb']:9.1f} KB")
+    return candidates, pd.DataFrame(rows)
+
+
+def pick(report, latency_budget_us=None, max_size_kb=None, batch_budget_us=None, metric=None):
+    """The best candidate within the budgets: highest AUC (accuracy when AUC is missing), then fidelity, then speed.
+
+    A candidate's single-row latency is its packed float64 time, or float32
+    when that is faster by more than LATENCY_RESOLUTION_US; the chosen one
+    records the precision as ``packed_dtype``. Packed single rows cost one
+    pass per tree level, so depth sets that latency while the tree count
+    sets the per-row batch cost. Latencies within LATENCY_RESOLUTION_US of
+    each other tie, and ties go to the smaller model. Falls back to the
+    teacher (``fits`` False) when nothing is within the budgets.
+    """
+    table = report.copy()
+    f32_faster = table['single_row_f32_us'].notna() & (
+        table['single_row_f32_us'] < table['single_row_us'] - LATENCY_RESOLUTION_US)
+    table['packed_dtype'] = np.where(f32_faster, 'float32', 'float64')
+    table['latency_us'] = np.where(f32_faster, table['single_row_f32_us'], table['single_row_us'])
+    table['size_kb'] = np.where(f32_faster, table['packed_f32_kb'], table['packed_kb'].fillna(table['pickle_kb']))
+    metric = metric or ('auc' if table['auc'].notna().all() else 'accuracy')
+
+    fits = np.ones(len(table), dtype=bool)
+    if latency_budget_us is not None:
+        fits &= table['latency_us'] <= latency_budget_us
+    if max_size_kb is not None:
+        fits &= table['size_kb'] <= max_size_kb
+    if batch_budget_us is not None:
+        fits &= table['batch_us_per_row'] <= batch_budget_us
+    if not fits.any():
+        return dict(table[table['candidate'] == 'teacher'].iloc[0].to_dict(), fits=False)
+    table['latency_rank'] = (table['latency_us'] / LATENCY_RESOLUTION_US).round()
+    ranked = table[fits].sort_values([metric, 'fidelity', 'latency_rank', 'size_kb', 'latency_us'],
+                                     ascending=[False, False, True, True, True], kind='stable')
+    return dict(ranked.iloc[0].drop('latency_rank').to_dict(), fits=True)
+
+
+def write_model_dir(out_dir, chosen, models, source_dir):
+    """Write the chosen models as a model directory ModelStore.from_dir and ModelRegistry.publish accept."""
+    os.makedirs(out_dir, exist_ok=True)
+    for task, choice in chosen.items():
+        joblib.dump(models[task][choice['candidate']], os.path.join(out_dir, MODEL_FILES[task]))
+    for name in (LABEL_ENCODER_FILE, SCALER_FILE, BINARY_SCALER_FILE):
+        if os.path.exists(os.path.join(source_dir, name)):
+            shutil.copy2(os.path.join(source_dir, name), os.path.join(out_dir, name))
+
+
+def run_compression(teachers, splits, out_dir, source_dir, latency_budget_us=None, max_size_kb=None,
+                    batch_budget_us=None, transfer_rows=TRANSFER_ROWS, log=print):
+    """Compress every task's teacher, write the report and the picked models to ``out_dir``.
+
+    ``teachers`` is {task: fitted forest}; ``splits`` is {task: (X_train,
+    y_train, X_test, y_test)}. Candidates are ranked on a validation slice
+    of the training split (the results table) and the chosen one is written
+    exactly as it was scored, i.e. built from the teacher refit without the
+    validation rows; picking ``teacher`` keeps the original model. The
+    written model is scored on the test split, reported under ``chosen`` as
+    ``test_*``. Returns {'results', 'chosen'}, also saved as
+    compression_report.json next to a compression_results.csv table.
+    """
+    models, tables, chosen = {}, [], {}
+    for task, teacher in teachers.items():
+        if not getattr(teacher, 'estimators_', None):
+            log(f"The {task} model is not a tree ensemble; nothing to compress")
+            continue
+        X_train, y_train, X_test, y_test = splits[task]
+        candidates, table = compress(task, teacher, *validation_split(X_train, y_train),
+                                     transfer_rows=transfer_rows, log=log)
+        tables.append(table)
+        choice = pick(table, latency_budget_us, max_size_kb, batch_budget_us)
+        if not choice['fits']:
+            log(f"No {task} candidate is within the budgets; keeping the teacher")
+
+        name = choice['candidate']
+        # Rebuilding the pick from the original teacher would give a different forest (or soft targets)
+        # than the one that was ranked, so the ranked object itself is what gets written
+        models[task] = {name: teacher if name == 'teacher' else candidates[name]}
+        final = evaluate(name, models[task][name], teacher.predict(X_test), X_test, y_test, task == 'binary')
+        chosen[task] = dict(choice, **{f'test_{key}': final[key] for key in ('accuracy', 'auc', 'fidelity')})
+        test_auc = f", AUC {final['auc']:.3f}" if final['auc'] is not None else ''
+        log(f"Picked {name} for {task}: validation accuracy {choice['accuracy']:.3f}; "
+            f"test accuracy {final['accuracy']:.3f}{test_auc}, "
+            f"{choice['latency_us']:.1f} us per row ({choice['packed_dtype']} packed), {choice['size_kb']:.1f} KB")
+
+    write_model_dir(out_dir, chosen, models, source_dir)
+    results = pd.concat(tables, ignore_index=True)
+    results.to_csv(os.path.join(out_dir, 'compression_results.csv'), index=False)
+    report = {
+        'latency_budget_us': latency_budget_us,
+        'max_size_kb': max_size_kb,
+        'batch_budget_us': batch_budget_us,
+        'packed_batch_limit': PACKED_BATCH_LIMIT,
+        'validation_fraction': VALIDATION_FRACTION,
+        'chosen': {task: {key: (None if pd.isna(value) else value) for key, value in choice.items()}
+                   for task, choice in chosen.items()},
+        'results': json.loads(results.to_json(orient='records')),
+    }
+    with open(os.path.join(out_dir, REPORT_FILE), 'w') as f:
+        json.dump(report, f, indent=2, default=float)
+    if any(choice['packed_dtype'] == 'float32' for choice in chosen.values()):
+        log("Serve with ROCKFALL_PACKED_DTYPE=float32 for the picked latency")
+    log(f"Compressed models and report written to {out_dir}")
+    return report
+
+
+if __name__ == "__main__":
+    import warnings
+
+    from dataset_store import DatasetStore
+
+    warnings.filterwarnings('ignore')
+
+    parser = argparse.ArgumentParser(description='Prune, limit and distill the tuned forests for serving')
+    parser.add_argument('--model-dir', default=os.path.abspath(os.path.dirname(__file__)),
+                        help='Directory holding the tuned (teacher) models')
+    parser.add_argument('--out', default=os.path.join(os.path.abspath(os.path.dirname(__file__)), 'compressed'))
+    parser.add_argument('--latency-budget-us', type=float, default=None, help='Single-row predict_proba budget')
+    parser.add_argument('--max-size-kb', type=float, default=None, help='Serving model size budget')
+    parser.add_argument('--batch-budget-us', type=float, default=None, help='Per-row budget for large batches')
+    parser.add_argument('--transfer-rows', type=int, default=TRANSFER_ROWS, help='Distillation transfer set size')
+    args = parser.parse_args()
+
+    store = DatasetStore()
+    teachers, splits = {}, {}
+    for task, target, name in (('binary', 'rockfall_binary', 'binary'), ('multiclass', 'risk_level', 'multiclass')):
+        path = os.path.join(args.model_dir, MODEL_FILES[task])
+        if not os.path.exists(path):
+            print(f"No {task} model in {args.model_dir}; skipping")
+            continue
+        teachers[task] = joblib.load(path)
+        # Teachers trained with ROCKFALL_TEMPORAL_FEATURES=1 need the replayed rolling aggregates too
+        frame = store.temporal_frame if any(column in FEATURES_TEMPORAL for column in
+                                            getattr(teachers[task], 'feature_names_in_', [])) else store.frame
+        X_train, X_test = frame(f'{name}_train'), frame(f'{name}_test')
+        splits[task] = (X_train, store.target(target, f'{name}_train'), X_test, store.target(target, f'{name}_test'))
+
+    run_compression(teachers, splits, args.out, args.model_dir, args.latency_budget_us, args.max_size_kb,
+                    args.batch_budget_us, args.transfer_rows)
@@ -0,0 +1,314 @@
+# Versioned, content-addressed model registry and zero-downtime swapping of the served version
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from model_store import (BINARY_MODEL_FILE, BINARY_SCALER_FILE, LABEL_ENCODER_FILE, MODEL_KINDS,
+                         MULTICLASS_MODEL_FILE, SCALER_FILE, ModelStore)
+
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'registry')
+MANIFEST_FILE = 'manifest.json'
+
+# Artifacts that make up one version; the binary model is the only required one
+ARTIFACT_FILES = {
+    'binary': BINARY_MODEL_FILE,
+    'multiclass': MULTICLASS_MODEL_FILE,
+    'label_encoder': LABEL_ENCODER_FILE,
+    'scaler': SCALER_FILE,
+    'binary_scaler': BINARY_SCALER_FILE,
+}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Model versions on disk, addressed by the content of their artifacts.
+
+    Each artifact is stored once under ``objects/<sha256>/<file name>`` and
+    never modified afterwards. A version is the set of artifact digests; its
+    id is a hash of that set, so publishing identical files twice yields the
+    same version. ``manifest.json`` lists every version and names the
+    ``current`` one; it is rewritten atomically under an flock, so readers
+    always see either the old or the new manifest.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'current': None, 'versions': {}}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        fd, staging = tempfile.mkstemp(prefix='.manifest-', dir=self.root)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(staging, self.manifest_path)
+
+    def current(self):
+        return self.manifest()['current']
+
+    def _store_object(self, path, name, digest):
+        target_dir = os.path.join(self.root, 'objects', digest)
+        target = os.path.join(target_dir, name)
+        if not os.path.exists(target):
+            os.makedirs(target_dir, exist_ok=True)
+            fd, staging = tempfile.mkstemp(prefix=f'.{name}-', dir=target_dir)
+            os.close(fd)
+            shutil.copyfile(path, staging)
+            os.replace(staging, target)
+        return os.path.relpath(target, self.root)
+
+    def publish(self, model_dir, activate=True, note=''):
+        """Copy the artifacts in ``model_dir`` into the registry; returns the version id."""
+        artifacts = {}
+        for kind, name in ARTIFACT_FILES.items():
+            path = os.path.join(model_dir, name)
+            if os.path.exists(path):
+                digest = file_digest(path)
+                artifacts[kind] = {'path': self._store_object(path, name, digest), 'sha256': digest,
+                                   'size': os.path.getsize(path)}
+        if 'binary' not in artifacts:
+            raise FileNotFoundError(f"No {BINARY_MODEL_FILE} in {model_dir}")
+
+        identity = '|'.join(f"{kind}:{artifacts[kind]['sha256']}" for kind in sorted(artifacts))
+        version = hashlib.sha256(identity.encode()).hexdigest()[:12]
+        with self._locked():
+            manifest = self.manifest()
+            manifest['versions'].setdefault(version, {
+                'created': datetime.now().isoformat(),
+                'source': os.path.abspath(model_dir),
+                'note': note,
+                'artifacts': artifacts,
+            })
+            if activate:
+                manifest['current'] = version
+            self._write_manifest(manifest)
+        print(f"Published model version {version}" + (" (current)" if activate else ""))
+        return version
+
+    def activate(self, version):
+        """Point ``current`` at an already published version (e.g. to roll back)."""
+        with self._locked():
+            manifest = self.manifest()
+            if version not in manifest['versions']:
+                raise KeyError(f"Unknown model version {version}")
+            manifest['current'] = version
+            self._write_manifest(manifest)
+
+    def verify(self, version):
+        """Raise ValueError if any artifact of ``version`` no longer matches its recorded digest."""
+        for kind, artifact in self.manifest()['versions'][version]['artifacts'].items():
+            if file_digest(os.path.join(self.root, artifact['path'])) != artifact['sha256']:
+                raise ValueError(f"Artifact {kind} of model version {version} is corrupted")
+
+    def store(self, version=None):
+        """A ModelStore over one version's artifacts (the current one by default)."""
+        manifest = self.manifest()
+        version = version or manifest['current']
+        if version is None:
+            raise LookupError("The registry has no current model version")
+        artifacts = manifest['versions'][version]['artifacts']
+        paths = {kind: os.path.join(self.root, artifacts[kind]['path']) if kind in artifacts else None
+                 for kind in ARTIFACT_FILES}
+        # Sidecars live per version: a KNN export bakes in that version's scalers
+        return ModelStore(paths['binary'], paths['multiclass'], paths['label_encoder'],
+                          packed_dir=os.path.join(self.root, 'versions', version, 'packed'),
+                          scaler_path=paths['scaler'], version=version, binary_scaler_path=paths['binary_scaler'])
+
+
+def warm(store):
+    """Load everything a request could need so it never unpickles on the request path; False if unusable."""
+    if not store.has_binary:
+        return False
+    for kind in MODEL_KINDS:
+        if kind == 'multiclass' and not store.has_multiclass:
+            continue
+        # Large batches are scored by the sklearn model even when a packed engine exists
+        store.packed(kind)
+        if store.model(kind) is None:
+            return False
+    if store.has_multiclass and store.label_encoder is None:
+        return False
+    for kind in MODEL_KINDS:
+        store.scaler_for(kind)
+    store.version
+    return True
+
+
+class ServedVersion:
+    """One installed model version and the number of requests currently using it."""
+
+    __slots__ = ('version', 'predictor', 'inflight')
+
+    def __init__(self, version, predictor):
+        self.version = version
+        self.predictor = predictor
+        self.inflight = 0
+
+
+class LiveModels:
+    """The model version requests are scored with, swapped by reference.
+
+    ``install`` builds and warms a predictor for a new ModelStore on the
+    calling (background) thread, then replaces ``active`` in one assignment.
+    Requests ``acquire`` the active version and keep using it until they
+    ``release`` it, so a request never mixes two versions. The replaced
+    version stops using the shared prediction cache at once and is dropped
+    when its last in-flight request finishes (or after ``drain_timeout``).
+    """
+
+    def __init__(self, make_predictor, drain_timeout=30.0, log=print):
+        self.make_predictor = make_predictor
+        self.drain_timeout = drain_timeout
+        self.log = log
+        self.active = None
+        self.retired = []
+        self._cond = threading.Condition()
+        self._install_lock = threading.Lock()
+
+    @property
+    def version(self):
+        active = self.active
+        return active.version if active is not None else None
+
+    @property
+    def predictor(self):
+        return self.active.predictor
+
+    def acquire(self):
+        with self._cond:
+            served = self.active
+            served.inflight += 1
+        return served
+
+    def release(self, served):
+        with self._cond:
+            served.inflight -= 1
+            if served.inflight == 0:
+                self._cond.notify_all()
+
+    def install(self, store):
+        """Warm ``store`` and make it the active version; a store that fails to load never replaces one that works."""
+        with self._install_lock:
+            if self.active is not None and store.version == self.active.version:
+                return False
+            if not warm(store) and self.active is not None:
+                raise ValueError(f"Model version {store.version} failed to load; keeping {self.active.version}")
+            served = ServedVersion(store.version, self.make_predictor(store))
+            with self._cond:
+                previous, self.active = self.active, served
+            if previous is not None:
+                previous.predictor.cache = None
+                self.retired.append(previous)
+                threading.Thread(target=self._drain, args=(previous,), daemon=True).start()
+            self.log(f"Serving model version {served.version}")
+            return True
+
+    def _drain(self, served):
+        with self._cond:
+            drained = self._cond.wait_for(lambda: served.inflight == 0, timeout=self.drain_timeout)
+        self.retired.remove(served)
+        self.log(f"Model version {served.version} " +
+                 ("drained" if drained else f"retired with {served.inflight} requests still running"))
+
+
+class RegistryWatcher:
+    """Polls the registry manifest and installs a newly activated version off the request path."""
+
+    def __init__(self, registry, live, interval=5.0, log=print):
+        self.registry = registry
+        self.live = live
+        self.interval = interval
+        self.log = log
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = None
+        # (manifest signature, version) whose verify/install raised; not retried until the manifest changes
+        self.failed = None
+
+    def check(self, force=False):
+        """Install the registry's current version if it changed; returns the version now served.
+
+        A version that fails to verify or install is remembered with the
+        manifest it came from and not re-hashed on every poll; it is retried
+        once the manifest changes, or with ``force=True``.
+        """
+        try:
+            stat = os.stat(self.registry.manifest_path)
+        except FileNotFoundError:
+            return self.live.version
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._seen and not force:
+            return self.live.version
+        version = self.registry.current()
+        if version is not None and version != self.live.version:
+            try:
+                self.registry.verify(version)
+                self.live.install(self.registry.store(version))
+            except Exception:
+                self._seen = signature
+                self.failed = (signature, version)
+                raise
+        self._seen = signature
+        self.failed = None
+        return self.live.version
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.log(f"Model registry check failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='model-registry-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == "__main__":
+    # python model_registry.py publish [model_dir] | activate <version> | list
+    import sys
+    registry = ModelRegistry(os.environ.get('ROCKFALL_MODEL_REGISTRY', REGISTRY_DIR))
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+    if command == 'publish':
+        model_dir = sys.argv[2] if len(sys.argv) > 2 else \
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best_models')
+        registry.publish(model_dir, note=' '.join(sys.argv[3:]))
+    elif command == 'activate':
+        registry.activate(sys.argv[2])
+        print(f"Current model version: {sys.argv[2]}")
+    else:
+        manifest = registry.manifest()
+        for version, entry in sorted(manifest['versions'].items(), key=lambda item: item[1]['created']):
+            marker = '*' if version == manifest['current'] else ' '
+            print(f"{marker} {version}  {entry['created']}  {entry['source']}  {entry['note']}")
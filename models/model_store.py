@@ -0,0 +1,305 @@
+# Lazy, memory-mapped model loading shared by the API workers and offline tools
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import joblib
+
+from forest_engine import PackedForest, export_forest
+from knn_engine import PackedKNN, export_knn
+
+BINARY_MODEL_FILE = 'rockfall_binary_model.pkl'
+MULTICLASS_MODEL_FILE = 'rockfall_multiclass_model.pkl'
+LABEL_ENCODER_FILE = 'rockfall_label_encoder.pkl'
+# StandardScaler per task: each is fit on its own training split, as the scaled-feature models were
+SCALER_FILE = 'rockfall_scaler.pkl'
+BINARY_SCALER_FILE = 'rockfall_binary_scaler.pkl'
+SCALER_KEYS = {'binary': 'binary_scaler', 'multiclass': 'scaler'}
+PACKED_DIR = 'packed'
+# Held (flock) by whichever worker is exporting into a packed directory
+EXPORT_LOCK_FILE = '.export.lock'
+# Seconds before a model or sidecar that failed to load is tried again
+LOAD_RETRY_INTERVAL = 30.0
+
+MODEL_KINDS = ('binary', 'multiclass')
+
+ENGINES = {'forest': PackedForest, 'knn': PackedKNN}
+
+# 'float32' halves the packed forest node arrays (see forest_engine.export_forest); splits are unchanged
+PACKED_DTYPE = os.environ.get('ROCKFALL_PACKED_DTYPE', 'float64')
+
+
+def load_engine(path, mmap_mode='r'):
+    """Load a packed sidecar written by PackedForest.save or PackedKNN.save."""
+    with open(os.path.join(path, 'meta.json')) as f:
+        engine = json.load(f).get('engine', 'forest')
+    return ENGINES[engine].load(path, mmap_mode=mmap_mode)
+
+
+def export_engine(model, scaler=None, dtype=PACKED_DTYPE):
+    """Pack a fitted model for serving; raises ValueError for model types with no packed engine."""
+    try:
+        return export_forest(model, dtype=dtype)
+    except ValueError:
+        if not hasattr(model, 'n_neighbors'):
+            raise
+    if scaler is None:
+        # Another task's scaler has the wrong mean/scale, so no engine rather than a silently shifted one
+        raise ValueError("KNN model has no scaler for its task; run dataset/pre_processed.py to save it")
+    # KNN winners were fit on standardised features, so the scaler is baked into the engine
+    return export_knn(model, scaler)
+
+
+class ModelStore:
+    """Loads models on first use instead of at import time.
+
+    Forests (and KNN models, with their task's scaler baked in) are served from packed
+    ``.npy`` sidecars opened with ``mmap_mode='r'``, so N workers on one host
+    share a single page-cache copy of the arrays. The sklearn pickles are only unpickled when something
+    actually needs them (large batches, the label encoder, re-exporting stale
+    sidecars).
+    """
+
+    def __init__(self, binary_path, multiclass_path=None, label_encoder_path=None, packed_dir=None,
+                 scaler_path=None, version=None, binary_scaler_path=None):
+        self.paths = {'binary': binary_path, 'multiclass': multiclass_path, 'label_encoder': label_encoder_path,
+                      'scaler': scaler_path, 'binary_scaler': binary_scaler_path}
+        self.packed_dir = packed_dir or os.path.join(os.path.dirname(os.path.abspath(binary_path)), PACKED_DIR)
+        self._objects = {}
+        self._failed = {}
+        self._lock = threading.RLock()
+        self.generation = 0
+        # Registry versions are content hashes fixed at publish time; plain directories derive one from file stats
+        self._fixed_version = version
+        self._version = version
+
+    @classmethod
+    def from_dir(cls, model_dir):
+        return cls(os.path.join(model_dir, BINARY_MODEL_FILE),
+                   os.path.join(model_dir, MULTICLASS_MODEL_FILE),
+                   os.path.join(model_dir, LABEL_ENCODER_FILE),
+                   packed_dir=os.path.join(model_dir, PACKED_DIR),
+                   scaler_path=os.path.join(model_dir, SCALER_FILE),
+                   binary_scaler_path=os.path.join(model_dir, BINARY_SCALER_FILE))
+
+    @classmethod
+    def from_objects(cls, binary_model, multiclass_model=None, label_encoder=None, scaler=None, binary_scaler=None):
+        """A store around already-loaded models; packed engines are exported in memory on first use."""
+        store = cls.__new__(cls)
+        store.paths = {'binary': None, 'multiclass': None, 'label_encoder': None, 'scaler': None,
+                       'binary_scaler': None}
+        store.packed_dir = None
+        store._objects = {'binary': binary_model, 'multiclass': multiclass_model, 'label_encoder': label_encoder,
+                          'scaler': scaler, 'binary_scaler': binary_scaler}
+        store._failed = {}
+        store._lock = threading.RLock()
+        store.generation = 0
+        store._fixed_version = None
+        store._version = None
+        return store
+
+    def _get(self, key, loader):
+        if key in self._objects:
+            return self._objects[key]
+        with self._lock:
+            if key in self._objects:
+                return self._objects[key]
+            # A failure (e.g. a sidecar being swapped by another worker) is not cached: retried after a pause
+            if time.monotonic() - self._failed.get(key, -LOAD_RETRY_INTERVAL) < LOAD_RETRY_INTERVAL:
+                return None
+            try:
+                self._objects[key] = loader()
+            except Exception as e:
+                self._failed[key] = time.monotonic()
+                print(f"Failed loading {key} (retrying in {LOAD_RETRY_INTERVAL:.0f}s): {e}")
+                return None
+            self._failed.pop(key, None)
+        return self._objects[key]
+
+    @property
+    def version(self):
+        """Short id of the loaded model files; changes whenever reload() picks up new artifacts."""
+        version = self._version
+        if version is None:
+            with self._lock:
+                if self._version is None:
+                    parts = [str(self.generation)]
+                    for key in ('binary', 'multiclass', 'label_encoder', 'scaler', 'binary_scaler'):
+                        path = self.paths.get(key)
+                        if path and os.path.exists(path):
+                            stat = os.stat(path)
+                            parts.append(f'{key}:{stat.st_size}:{stat.st_mtime_ns}')
+                    self._version = hashlib.sha1('|'.join(parts).encode()).hexdigest()[:12]
+                version = self._version
+        return version
+
+    def reload(self):
+        """Forget every file-backed model so the next request loads the artifacts currently on disk."""
+        with self._lock:
+            self._objects = {key: obj for key, obj in self._objects.items()
+                             if self.paths.get(key.replace('_packed', '')) is None}
+            self._failed = {}
+            self.generation += 1
+            self._version = self._fixed_version
+        return self.version
+
+    def _available(self, key):
+        if key in self._objects:
+            return self._objects[key] is not None
+        path = self.paths.get(key)
+        return path is not None and os.path.exists(path)
+
+    @property
+    def has_binary(self):
+        return self._available('binary')
+
+    @property
+    def has_multiclass(self):
+        return self._available('multiclass') and self._available('label_encoder')
+
+    def model(self, kind):
+        """The sklearn estimator for 'binary' or 'multiclass' (unpickled on first call)."""
+        def load():
+            model = joblib.load(self.paths[kind])
+            print(f"{kind.capitalize()} model loaded from {self.paths[kind]}")
+            return model
+        return self._get(kind, load)
+
+    @property
+    def label_encoder(self):
+        return self._get('label_encoder', lambda: joblib.load(self.paths['label_encoder']))
+
+    def scaler_for(self, kind):
+        """The StandardScaler the 'binary' or 'multiclass' scaled-feature models (KNN, logistic regression) used."""
+        key = SCALER_KEYS[kind]
+        if not self._available(key):
+            return None
+        return self._get(key, lambda: joblib.load(self.paths[key]))
+
+    @property
+    def scaler(self):
+        """The multiclass scaler (the only one older model directories have)."""
+        return self.scaler_for('multiclass')
+
+    def packed(self, kind):
+        """The packed engine for 'binary' or 'multiclass', memory-mapped from its sidecar when possible."""
+        return self._get(f'{kind}_packed', lambda: self._load_packed(kind))
+
+    def _sidecar_path(self, kind):
+        return os.path.join(self.packed_dir, kind)
+
+    def _source_signature(self, kind):
+        stat = os.stat(self.paths[kind])
+        signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if PACKED_DTYPE != 'float64':
+            # Switching precision re-exports the sidecars; float64 keeps the signature older sidecars carry
+            signature['dtype'] = PACKED_DTYPE
+        scaler_path = self.paths.get(SCALER_KEYS[kind])
+        if scaler_path and os.path.exists(scaler_path):
+            # A KNN sidecar bakes in its task's scaler, so a new scaler also makes it stale
+            scaler_stat = os.stat(scaler_path)
+            signature['scaler'] = {'size': scaler_stat.st_size, 'mtime_ns': scaler_stat.st_mtime_ns}
+        return signature
+
+    def _sidecar_fresh(self, kind):
+        source_file = os.path.join(self._sidecar_path(kind), 'source.json')
+        if not os.path.exists(source_file):
+            return False
+        if self.paths[kind] is None or not os.path.exists(self.paths[kind]):
+            return True
+        with open(source_file) as f:
+            return json.load(f) == self._source_signature(kind)
+
+    def _load_packed(self, kind):
+        if self.packed_dir is None:
+            model = self.model(kind)
+            if model is None:
+                return None
+            try:
+                return export_engine(model, self.scaler_for(kind))
+            except ValueError:
+                return None
+        if not self._sidecar_fresh(kind):
+            try:
+                if not self._export_sidecar(kind):
+                    return None
+            except ValueError as e:
+                # No packed engine for this model type (e.g. logistic regression); callers use the sklearn model
+                print(f"Serving {kind} without a packed engine: {e}")
+                return None
+        # Resolved once, so meta.json and every array come from the same export even if it is swapped meanwhile;
+        # an export retired between resolving and opening it is resolved again
+        for attempt in range(3):
+            try:
+                return load_engine(os.path.realpath(self._sidecar_path(kind)), mmap_mode='r')
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+                time.sleep(0.05)
+
+    @contextmanager
+    def _export_lock(self):
+        os.makedirs(self.packed_dir, exist_ok=True)
+        with open(os.path.join(self.packed_dir, EXPORT_LOCK_FILE), 'a+b') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _export_sidecar(self, kind):
+        """Export ``kind`` unless another worker did while this one waited; False if there is no model."""
+        with self._export_lock():
+            if self._sidecar_fresh(kind):
+                return True
+            model = self.model(kind)
+            if model is None:
+                return False
+            self._write_sidecar(kind, export_engine(model, self.scaler_for(kind)))
+        return True
+
+    def _write_sidecar(self, kind, packed):
+        # Called under _export_lock. Each export is its own directory and ``kind`` is a symlink swapped onto
+        # the new one with a single rename, so the sidecar path always resolves to a complete export
+        target = self._sidecar_path(kind)
+        staging = tempfile.mkdtemp(prefix=f'.{kind}-', dir=self.packed_dir)
+        packed.save(staging)
+        with open(os.path.join(staging, 'source.json'), 'w') as f:
+            json.dump(self._source_signature(kind), f)
+        link = f'{staging}.link'
+        os.symlink(os.path.basename(staging), link)
+
+        previous = None
+        if os.path.islink(target):
+            previous = os.path.realpath(target)
+        elif os.path.isdir(target):
+            # Sidecar written before exports were symlinked: moved aside once, then replaced by the link
+            previous = tempfile.mkdtemp(prefix=f'.{kind}-old-', dir=self.packed_dir)
+            os.replace(target, os.path.join(previous, kind))
+        os.replace(link, target)
+        if previous is not None:
+            # Workers that already mapped the old arrays keep them; the files go once they unmap
+            shutil.rmtree(previous, ignore_errors=True)
+        print(f"Packed {kind} {getattr(packed, 'engine', 'forest')} written to {target}")
+
+    def export(self):
+        """Write (or refresh) the packed sidecars for every forest/KNN model in the store."""
+        for kind in MODEL_KINDS:
+            if self.paths.get(kind) and os.path.exists(self.paths[kind]) and not self._sidecar_fresh(kind):
+                try:
+                    self._export_sidecar(kind)
+                except ValueError as e:
+                    print(f"Skipping {kind}: {e}")
+
+
+if __name__ == "__main__":
+    # Run once after training/tuning so API workers start straight from the mmap-able sidecars
+    import sys
+    model_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'best_models')
+    ModelStore.from_dir(model_dir).export()
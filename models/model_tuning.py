@@ -1,52 +1,52 @@
 import os
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import GridSearchCV, train_test_split
 from sklearn.metrics import accuracy_score, roc_auc_score, classification_report
 from sklearn.preprocessing import LabelEncoder
 import joblib
 
+from dataset_store import DatasetStore
+from features import feature_columns, temporal_feature_columns, FEATURES_TEMPORAL, STREAM_COLUMNS
+from tuning_engine import TuningTask, tune_tasks
+
 print("=== STEP 6: HYPERPARAMETER TUNING FOR BINARY AND MULTICLASS ===")
 
 # Paths
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-dataset_path = os.path.join(project_root, 'dataset', 'rockfall_synthetic_dataset.csv')
 models_dir = os.path.join(project_root, 'models')
 os.makedirs(models_dir, exist_ok=True)
+# Fold scores from earlier runs; a rerun only fits configs (or data) it has not seen
+tuning_cache_dir = os.environ.get('ROCKFALL_TUNING_CACHE', os.path.join(models_dir, 'tuning_cache'))
 
-# Load dataset
-df = pd.read_csv(dataset_path)
-
-# Feature columns
-feature_columns = [
-    'slope_height_m', 'slope_angle_deg', 'cohesion_kpa', 'friction_angle_deg',
-    'unit_weight_kn_m3', 'rqd_percent', 'joint_spacing_m', 'rainfall_mm',
-    'temperature_range_c', 'groundwater_depth_m', 'freeze_thaw_cycles',
-    'blasting_distance_m', 'vibration_intensity', 'days_since_blast',
-    'mining_depth_m', 'days_since_rain', 'season_encoded',
-    'stability_index', 'weather_risk_score', 'operational_stress',
-    'geological_weakness', 'slope_steepness_factor'
-]
-
-X = df[feature_columns]
+# Load the preprocessed dataset store (step 4); features were computed with the serving code path
+store = DatasetStore()
 
-# Prepare binary target
-y_binary = df['rockfall_binary']
-
-# Prepare multiclass target and encode
-y_multiclass = df['risk_level']
+# Multiclass labels are stored encoded; rebuild the encoder from the stored class names
 le = LabelEncoder()
-y_multiclass_encoded = le.fit_transform(y_multiclass)
-
-# Split binary data
-X_train_bin, X_test_bin, y_train_bin, y_test_bin = train_test_split(
-    X, y_binary, test_size=0.3, random_state=42, stratify=y_binary
-)
-
-# Split multiclass data
-X_train_mc, X_test_mc, y_train_mc, y_test_mc = train_test_split(
-    X, y_multiclass_encoded, test_size=0.3, random_state=42, stratify=y_multiclass_encoded
-)
+le.classes_ = np.asarray(store.classes('risk_level'), dtype=object)
+
+# Binary and multiclass splits (same stratified 70/30 splits as preprocessing)
+X_train_bin, X_test_bin = store.frame('binary_train'), store.frame('binary_test')
+y_train_bin = store.target('rockfall_binary', 'binary_train')
+y_test_bin = store.target('rockfall_binary', 'binary_test')
+
+X_train_mc, X_test_mc = store.frame('multiclass_train'), store.frame('multiclass_test')
+y_train_mc = store.target('risk_level', 'multiclass_train')
+y_test_mc = store.target('risk_level', 'multiclass_test')
+
+# Optional rolling-window aggregates; models trained with them must be served with ROCKFALL_TEMPORAL_FEATURES=1 too
+use_temporal = os.environ.get('ROCKFALL_TEMPORAL_FEATURES') == '1'
+model_columns = temporal_feature_columns if use_temporal else feature_columns
+
+if use_temporal:
+    # Without a time axis and stream ids every aggregate would be the reading's own value, while serving feeds
+    # real 24h/7d sums and maxima: the model would be trained on one distribution and served another
+    if store.streams() is None:
+        raise SystemExit("ROCKFALL_TEMPORAL_FEATURES=1 needs timestamped training readings, but the dataset store "
+                         f"has no {'/'.join(STREAM_COLUMNS)} columns; rerun data_generation.py and pre_processed.py")
+    print(f"Adding temporal features: {', '.join(FEATURES_TEMPORAL)}")
+    X_train_bin, X_test_bin = store.temporal_frame('binary_train'), store.temporal_frame('binary_test')
+    X_train_mc, X_test_mc = store.temporal_frame('multiclass_train'), store.temporal_frame('multiclass_test')
 
 # Hyperparameter grid
 rf_param_grid = {
@@ -56,21 +56,25 @@ rf_param_grid = {
     'min_samples_leaf': [1, 2, 4]
 }
 
-# Function to tune and evaluate RF model
-def tune_rf(X_train, y_train, X_test, y_test, task_name, scoring='accuracy', binary=False):
-    print(f"\nTuning Random Forest for {task_name}...")
-    rf_grid = GridSearchCV(
-        RandomForestClassifier(random_state=42),
-        rf_param_grid,
-        cv=5,
-        scoring=scoring,
-        n_jobs=-1
-    )
-    rf_grid.fit(X_train, y_train)
-    print(f"Best parameters for {task_name}: {rf_grid.best_params_}")
-    print(f"Best CV score for {task_name}: {rf_grid.best_score_:.3f}")
-
-    best_model = rf_grid.best_estimator_
+# Successive halving for both tasks at once in one process pool: every round keeps the best third
+# of the configs and triples the training rows, so only a handful of configs ever see the full folds
+print("\nTuning Random Forest for binary and multiclass tasks...")
+tuned = tune_tasks(
+    [TuningTask('binary', X_train_bin, y_train_bin, scoring='accuracy'),
+     TuningTask('multiclass', X_train_mc, y_train_mc, scoring='accuracy')],
+    rf_param_grid,
+    cv=5,
+    factor=3,
+    cache_dir=tuning_cache_dir
+)
+pd.concat([t['results'] for t in tuned.values()]).to_csv(os.path.join(models_dir, 'tuning_results.csv'), index=False)
+
+# Function to evaluate a tuned RF model
+def evaluate_rf(tuning, X_test, y_test, task_name, binary=False):
+    print(f"\nBest parameters for {task_name}: {tuning['best_params']}")
+    print(f"Best CV score for {task_name}: {tuning['best_score']:.3f}")
+
+    best_model = tuning['best_estimator']
     y_pred = best_model.predict(X_test)
     accuracy = accuracy_score(y_test, y_pred)
 
@@ -90,13 +94,13 @@ def tune_rf(X_train, y_train, X_test, y_test, task_name, scoring='accuracy', bin
         print(f"{task_name} Classification Report:\n{classification_report(y_test, y_pred, target_names=[str(c) for c in le.classes_])}")
         return best_model, accuracy
 
-# Tune binary model
-best_rf_tuned_bin, bin_accuracy, bin_auc = tune_rf(X_train_bin, y_train_bin, X_test_bin, y_test_bin,
-                                                  'Binary Classification (Rockfall/No Rockfall)', binary=True)
+# Evaluate binary model
+best_rf_tuned_bin, bin_accuracy, bin_auc = evaluate_rf(tuned['binary'], X_test_bin, y_test_bin,
+                                                      'Binary Classification (Rockfall/No Rockfall)', binary=True)
 
-# Tune multiclass model
-best_rf_tuned_mc, mc_accuracy = tune_rf(X_train_mc, y_train_mc, X_test_mc, y_test_mc,
-                                       'Multiclass Classification (Risk Levels)')
+# Evaluate multiclass model
+best_rf_tuned_mc, mc_accuracy = evaluate_rf(tuned['multiclass'], X_test_mc, y_test_mc,
+                                           'Multiclass Classification (Risk Levels)')
 
 # Save models and label encoder
 joblib.dump(best_rf_tuned_bin, os.path.join(models_dir, 'rockfall_binary_model.pkl'))
@@ -105,9 +109,26 @@ joblib.dump(le, os.path.join(models_dir, 'rockfall_label_encoder.pkl'))
 
 print("\nBest models and label encoder saved successfully.")
 
+# Ship the tuned models: API workers watching this registry load and swap to the new version without a restart
+if os.environ.get('ROCKFALL_MODEL_REGISTRY'):
+    from model_registry import ModelRegistry
+    ModelRegistry(os.environ['ROCKFALL_MODEL_REGISTRY']).publish(models_dir, note='model_tuning.py')
+
+# Compression stage: pruned, depth/leaf-limited and distilled versions of the tuned forests, scored for accuracy/AUC
+# against latency and size. The models fitting ROCKFALL_LATENCY_BUDGET_US go to models/compressed (publish that
+# directory to serve them); ROCKFALL_COMPRESS=0 skips the stage
+if os.environ.get('ROCKFALL_COMPRESS', '1') != '0':
+    from model_compression import run_compression
+    latency_budget = os.environ.get('ROCKFALL_LATENCY_BUDGET_US')
+    run_compression({'binary': best_rf_tuned_bin, 'multiclass': best_rf_tuned_mc},
+                    {'binary': (X_train_bin, y_train_bin, X_test_bin, y_test_bin),
+                     'multiclass': (X_train_mc, y_train_mc, X_test_mc, y_test_mc)},
+                    os.path.join(models_dir, 'compressed'), models_dir,
+                    latency_budget_us=float(latency_budget) if latency_budget else None)
+
 # Feature importance from multiclass tuned model
 feature_importance = pd.DataFrame({
-    'feature': feature_columns,
+    'feature': model_columns,
     'importance': best_rf_tuned_mc.feature_importances_
 }).sort_values('importance', ascending=False)
 
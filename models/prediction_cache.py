@@ -0,0 +1,86 @@
+# LRU/TTL cache of per-reading model outputs, keyed on quantized base sensor values
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PredictionCache:
+    """Maps (model kind, model version, quantized reading) to that row's predict_proba output.
+
+    Only the 17 base readings go into the key; the derived features are pure
+    functions of them. Values are rounded to ``decimals`` places first, so
+    readings that differ below sensor resolution share an entry. Entries older
+    than ``ttl`` seconds are treated as misses, and the least recently used
+    entry is evicted beyond ``max_entries``. A change of model version drops
+    everything.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300.0, decimals=3, max_batch_rows=1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.decimals = decimals
+        # Larger batches skip the cache: per-row lookups would cost more than the vectorized forest pass
+        self.max_batch_rows = max_batch_rows
+        self.version = None
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), max_entries=self.max_entries, version=self.version)
+
+    def bind(self, version):
+        """Invalidate every entry if the models were reloaded since the last call."""
+        if version == self.version:
+            return
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.stats['invalidations'] += 1
+                self._entries.clear()
+                self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.stats['invalidations'] += 1
+
+    def keys(self, tag, base_matrix):
+        # + 0.0 folds -0.0 into 0.0 so both round to the same bytes
+        quantized = np.ascontiguousarray(np.round(base_matrix, self.decimals) + 0.0)
+        return [(tag, row.tobytes()) for row in quantized]
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and now - entry[1] > self.ttl:
+                    del self._entries[key]
+                    self.stats['expired'] += 1
+                    entry = None
+                if entry is None:
+                    self.stats['misses'] += 1
+                    found.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    found.append(entry[0])
+        return found
+
+    def put_many(self, keys, values):
+        now = time.monotonic()
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
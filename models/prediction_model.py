@@ -1,8 +1,9 @@
 import os
 
-import joblib
-import numpy as np
-import pandas as pd
+from features import FEATURES_BASE, FEATURES_DERIVED, build_feature_frame, build_feature_matrix, feature_columns
+from model_store import ModelStore
+from predictor import RockfallPredictor
+from risk_policy import POLICY_FILE, PolicyFile
 
 print("=== STEP 7: CREATING PREDICTION SYSTEM ===")
 
@@ -23,101 +24,51 @@ if not os.path.exists(multiclass_model_path):
 if not os.path.exists(label_encoder_path):
     label_encoder_path = os.path.join(base_path, 'rockfall_label_encoder.pkl')
 
-print("Loading binary model from:", binary_model_path)
-print("Loading multiclass model from:", multiclass_model_path)
-print("Loading label encoder from:", label_encoder_path)
-
-# Load models and encoder
-best_binary_model = joblib.load(binary_model_path)
-best_multiclass_model = joblib.load(multiclass_model_path)
-le = joblib.load(label_encoder_path)
-
-feature_columns = [
-    'slope_height_m', 'slope_angle_deg', 'cohesion_kpa', 'friction_angle_deg',
-    'unit_weight_kn_m3', 'rqd_percent', 'joint_spacing_m', 'rainfall_mm',
-    'temperature_range_c', 'groundwater_depth_m', 'freeze_thaw_cycles',
-    'blasting_distance_m', 'vibration_intensity', 'days_since_blast',
-    'mining_depth_m', 'days_since_rain', 'season_encoded',
-    'stability_index', 'weather_risk_score', 'operational_stress',
-    'geological_weakness', 'slope_steepness_factor'
-]
+print("Binary model path:", binary_model_path)
+print("Multiclass model path:", multiclass_model_path)
+print("Label encoder path:", label_encoder_path)
 
-def calculate_derived_features(input_features):
-    stability_index = (input_features.get('cohesion_kpa', 30) +
-                       input_features.get('unit_weight_kn_m3', 24) *
-                       input_features.get('slope_height_m', 50) *
-                       np.tan(np.radians(input_features.get('friction_angle_deg', 35)))) / \
-                      (input_features.get('unit_weight_kn_m3', 24) *
-                       input_features.get('slope_height_m', 50) *
-                       np.sin(np.radians(input_features.get('slope_angle_deg', 45))))
-
-    weather_risk = (input_features.get('rainfall_mm', 10) *
-                    input_features.get('temperature_range_c', 15)) / \
-                   (input_features.get('days_since_rain', 5) + 1)
-
-    operational_stress = input_features.get('vibration_intensity', 3) / \
-                         (input_features.get('blasting_distance_m', 100) + 1) * \
-                         (60 - input_features.get('days_since_blast', 7)) / 60
-
-    geological_weakness = (100 - input_features.get('rqd_percent', 60)) / \
-                         input_features.get('joint_spacing_m', 1.5)
+# Models are loaded on first prediction; forests are served from memory-mapped packed sidecars
+model_store = ModelStore(binary_model_path, multiclass_model_path, label_encoder_path)
+predictor = RockfallPredictor.from_store(model_store)
 
-    slope_steepness = np.tan(np.radians(input_features.get('slope_angle_deg', 45))) * \
-                      input_features.get('slope_height_m', 50)
+# Same cut points and wording as the API; edits to the policy file apply on the next call
+risk_policy = PolicyFile(os.environ.get('ROCKFALL_RISK_POLICY', POLICY_FILE))
 
-    return {
-        'stability_index': stability_index,
-        'weather_risk_score': weather_risk,
-        'operational_stress': operational_stress,
-        'geological_weakness': geological_weakness,
-        'slope_steepness_factor': slope_steepness
-    }
+def calculate_derived_features(input_features):
+    """Derived features of one reading (a dict) as floats, or of a batch as one array per feature."""
+    derived = build_feature_matrix(input_features)[:, len(FEATURES_BASE):]
+    if isinstance(input_features, dict):
+        return {name: float(derived[0, i]) for i, name in enumerate(FEATURES_DERIVED)}
+    return {name: derived[:, i] for i, name in enumerate(FEATURES_DERIVED)}
 
 def prepare_feature_dataframe(input_features):
-    base_features = {k: input_features.get(k, 0) for k in feature_columns[:-5]}
-    derived_features = calculate_derived_features(input_features)
-    all_features = {**base_features, **derived_features}
-    df = pd.DataFrame([all_features], columns=feature_columns)
-    return df
+    return build_feature_frame(input_features)
 
 def predict_rockfall_risk_binary(input_features):
-    feature_df = prepare_feature_dataframe(input_features)
-    prediction = best_binary_model.predict(feature_df)[0]
-    prob = best_binary_model.predict_proba(feature_df)[0][1]
-
-    if prob > 0.8:
-        risk_level = "CRITICAL"
-        recommendation = "Immediate evacuation required. Stop all operations."
-        color = "red"
-    elif prob > 0.6:
-        risk_level = "HIGH"
-        recommendation = "High risk detected. Consider evacuation."
-        color = "orange"
-    elif prob > 0.4:
-        risk_level = "MEDIUM"
-        recommendation = "Moderate risk. Increase monitoring."
-        color = "yellow"
-    else:
-        risk_level = "LOW"
-        recommendation = "Low risk. Continue regular monitoring."
-        color = "green"
+    scores = predictor.score_binary(build_feature_matrix(input_features))
+    prediction = scores['prediction'][0]
+    prob = float(scores['probability'][0])
+
+    mine_id = input_features.get('mine_id') if isinstance(input_features, dict) else None
+    risk = risk_policy.current.classify(prob, mine_id)
 
     return {
         'prediction': int(prediction),
-        'risk_level': risk_level,
+        'risk_level': str(risk['risk_level'][0]),
         'confidence': float(prob),
-        'recommendation': recommendation,
-        'color': color,
-        'alert_required': prob > 0.5
+        'recommendation': str(risk['recommendation'][0]),
+        'color': str(risk['color'][0]),
+        'alert_required': bool(risk['alert'][0])
     }
 
 def predict_rockfall_risk_multiclass(input_features):
-    feature_df = prepare_feature_dataframe(input_features)
-    prediction_encoded = best_multiclass_model.predict(feature_df)[0]
-    probabilities = best_multiclass_model.predict_proba(feature_df)[0]
-    prediction_label = le.inverse_transform([prediction_encoded])[0]
+    scores = predictor.score_multiclass(build_feature_matrix(input_features))
+    prediction_encoded = scores['prediction_encoded'][0]
+    probabilities = scores['probabilities'][0]
+    prediction_label = scores['prediction_label'][0]
 
-    confidence = float(max(probabilities))
+    confidence = float(scores['confidence'][0])
 
     return {
         'prediction_encoded': int(prediction_encoded),
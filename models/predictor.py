@@ -0,0 +1,156 @@
+# Unified scoring layer: one predict_proba per model, classes and labels derived from it
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURES_BASE, FEATURES_TEMPORAL, build_feature_matrix, columns_for, feature_columns
+from knn_engine import PackedKNN
+from model_store import ModelStore
+
+# Up to this many rows the packed forest beats sklearn's per-call overhead; larger batches use sklearn
+PACKED_BATCH_LIMIT = 256
+
+
+class RockfallPredictor:
+    """Scores feature matrices with the binary and multiclass models.
+
+    Each model's predict_proba runs once per call; the predicted class is the
+    argmax of those probabilities and the multiclass label is decoded from it
+    through the label encoder. Models come from a ModelStore, so nothing is
+    loaded until the first request needs it. With a PredictionCache, rows
+    already scored by the current model version skip the forests entirely.
+    An optional ``timer`` (``timer(stage)`` returning a context manager, e.g.
+    metrics.StageTimer) is wrapped around the cache lookup, DataFrame
+    building, predict_proba and label decoding stages.
+    """
+
+    def __init__(self, binary_model=None, multiclass_model=None, label_encoder=None, use_packed=True,
+                 store=None, cache=None, timer=None):
+        self.store = store if store is not None else \
+            ModelStore.from_objects(binary_model, multiclass_model, label_encoder)
+        self.use_packed = use_packed
+        self.cache = cache
+        self.timer = timer if timer is not None else _untimed
+
+    @classmethod
+    def from_store(cls, store, use_packed=True, cache=None, timer=None):
+        return cls(store=store, use_packed=use_packed, cache=cache, timer=timer)
+
+    @property
+    def available(self):
+        return self.store.has_binary
+
+    @property
+    def has_multiclass(self):
+        return self.store.has_multiclass
+
+    @property
+    def label_encoder(self):
+        return self.store.label_encoder
+
+    def _predict_proba(self, kind, features):
+        if isinstance(features, pd.DataFrame):
+            frame, matrix = features, None
+        else:
+            frame, matrix = None, np.asarray(features, dtype=np.float64)
+            if matrix.ndim == 1:
+                matrix = matrix.reshape(1, -1)
+
+        n_rows = len(frame) if frame is not None else matrix.shape[0]
+        # Read once: a hot swap detaches the cache from the outgoing predictor while its requests finish
+        cache = self.cache
+        if cache is None or n_rows > cache.max_batch_rows:
+            return self._evaluate(kind, frame, matrix, n_rows)
+
+        with self.timer('cache_lookup'):
+            version = self.store.version
+            cache.bind(version)
+            base = _key_columns(frame, matrix)
+            keys = cache.keys((kind, version), base)
+            cached = cache.get_many(keys)
+
+        # Score each distinct missing reading once, then fill every row that shares its key
+        pending = {}
+        for i, entry in enumerate(cached):
+            if entry is None:
+                pending.setdefault(keys[i], i)
+        if pending:
+            rows = list(pending.values())
+            subset_frame = frame.iloc[rows] if frame is not None else None
+            subset_matrix = matrix[rows] if matrix is not None else None
+            probabilities, classes = self._evaluate(kind, subset_frame, subset_matrix, len(rows))
+            entries = [(row, classes) for row in np.array(probabilities, copy=True)]
+            cache.put_many(pending.keys(), entries)
+            fresh = dict(zip(pending.keys(), entries))
+            cached = [entry if entry is not None else fresh[key] for key, entry in zip(keys, cached)]
+
+        return np.vstack([entry[0] for entry in cached]), cached[0][1]
+
+    def _evaluate(self, kind, frame, matrix, n_rows):
+        packed = self.store.packed(kind) if self.use_packed else None
+        # The packed KNN applies the training scaler the bare sklearn model lacks, so it serves every batch size
+        if packed is not None and (n_rows <= PACKED_BATCH_LIMIT or isinstance(packed, PackedKNN)):
+            with self.timer(f'predict_proba_{kind}'):
+                return packed.predict_proba(frame if frame is not None else matrix), packed.classes_
+
+        model = self.store.model(kind)
+        if model is None:
+            raise RuntimeError(f"{kind} model not loaded")
+        if frame is None:
+            with self.timer('dataframe'):
+                frame = pd.DataFrame(matrix, columns=columns_for(matrix.shape[1]), copy=False)
+        with self.timer(f'predict_proba_{kind}'):
+            return model.predict_proba(frame), model.classes_
+
+    def score_binary(self, features):
+        probabilities, classes = self._predict_proba('binary', features)
+        return {
+            'prediction': classes[probabilities.argmax(axis=1)],
+            'probability': probabilities[:, 1],
+            'probabilities': probabilities
+        }
+
+    def score_multiclass(self, features):
+        probabilities, classes = self._predict_proba('multiclass', features)
+        encoded = classes[probabilities.argmax(axis=1)]
+        with self.timer('label_decode'):
+            labels = self.label_encoder.inverse_transform(encoded)
+        return {
+            'prediction_encoded': encoded,
+            'prediction_label': labels,
+            'confidence': probabilities.max(axis=1),
+            'probabilities': probabilities
+        }
+
+    def score(self, features):
+        """Binary and (when available) multiclass scores for every row of a feature matrix."""
+        return {
+            'binary': self.score_binary(features),
+            'multiclass': self.score_multiclass(features) if self.has_multiclass else None
+        }
+
+    def score_readings(self, readings):
+        """Build features from raw sensor readings (dict, records, DataFrame) and score them."""
+        return self.score(build_feature_matrix(readings))
+
+
+def _key_columns(frame, matrix):
+    """What identifies a row for the cache: the raw readings plus any rolling temporal aggregates."""
+    if frame is not None:
+        names = FEATURES_BASE + [name for name in FEATURES_TEMPORAL if name in frame.columns]
+        return frame[names].to_numpy(dtype=np.float64)
+    if matrix.shape[1] > len(feature_columns):
+        return np.hstack([matrix[:, :len(FEATURES_BASE)], matrix[:, len(feature_columns):]])
+    return matrix[:, :len(FEATURES_BASE)]
+
+
+def _untimed(stage):
+    return nullcontext()
+
+
+def slice_scores(scores, start, stop):
+    """Rows [start, stop) of a score dict (or None) as returned by RockfallPredictor."""
+    if scores is None:
+        return None
+    return {key: value[start:stop] for key, value in scores.items()}
@@ -0,0 +1,175 @@
+# Probability -> risk level policy loaded from config (optionally per mine) and applied to whole probability vectors
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'risk_policy.json')
+UNKNOWN = 'UNKNOWN'
+# Every level name the history and shared-memory rings can store, as its index; a policy may use any of them
+RISK_LEVELS = [UNKNOWN, 'LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+
+# Keys a per-mine entry may override; the level names are shared so levels compare across mines
+LADDER_KEYS = ('cuts', 'recommendations', 'colors', 'alert_level')
+
+
+class RiskPolicy:
+    """Cut points, recommendations and colors for every risk level, with per-mine overrides.
+
+    A probability strictly above ``cuts[i]`` is at least ``levels[i + 1]``,
+    so ``np.searchsorted(cuts, probs, side='left')`` is the level index of a
+    whole vector at once. Each ladder (the default one, then one per mine
+    override) is a row of the recommendation/color tables, and a batch's
+    strings are one fancy-index gather. NaN probabilities map to UNKNOWN.
+
+    Config (risk_policy.json)::
+
+        {"levels": [...], "cuts": [...], "recommendations": [...], "colors": [...],
+         "alert_level": "HIGH", "mines": {"MINE_007": {"cuts": [0.05, 0.2, 0.3]}}}
+    """
+
+    def __init__(self, config, source=None):
+        self.config = config
+        self.source = source
+        self.levels = [str(level) for level in config['levels']]
+        if len(set(self.levels)) != len(self.levels) or UNKNOWN in self.levels:
+            raise ValueError("Risk levels must be distinct names other than UNKNOWN")
+        unstorable = [level for level in self.levels if level not in RISK_LEVELS]
+        if unstorable:
+            # The rings keep a level as its RISK_LEVELS index and would record these as UNKNOWN
+            raise ValueError(f"Risk levels {', '.join(unstorable)} are not in {', '.join(RISK_LEVELS[1:])}")
+        self.unknown_code = len(self.levels)
+
+        mines = config.get('mines') or {}
+        self.mine_index = {str(mine_id): i + 1 for i, mine_id in enumerate(mines)}
+        ladders = [self._ladder(config, 'default')]
+        for mine_id, override in mines.items():
+            unknown = set(override) - set(LADDER_KEYS)
+            if unknown:
+                raise ValueError(f"Mine {mine_id} overrides unsupported keys: {', '.join(sorted(unknown))}")
+            ladders.append(self._ladder(dict({k: config[k] for k in LADDER_KEYS if k in config}, **override), mine_id))
+
+        self.cuts = [cuts for cuts, _, _, _ in ladders]
+        # Extra last column for UNKNOWN. Object arrays: gathering and tolist() copy pointers, not fixed-width strings
+        self.recommendations = np.array([recs + [''] for _, recs, _, _ in ladders], dtype=object)
+        self.colors = np.array([colors + ['gray'] for _, _, colors, _ in ladders], dtype=object)
+        self.alert_codes = np.array([alert for _, _, _, alert in ladders], dtype=np.intp)
+        self.level_names = np.array(self.levels + [UNKNOWN], dtype=object)
+
+    def _ladder(self, entry, name):
+        cuts = np.asarray(entry['cuts'], dtype=np.float64)
+        n_levels = len(self.levels)
+        if cuts.ndim != 1 or len(cuts) != n_levels - 1:
+            raise ValueError(f"Ladder {name}: {n_levels} levels need {n_levels - 1} cut points")
+        if np.any(np.diff(cuts) <= 0) or np.any((cuts < 0) | (cuts > 1)):
+            raise ValueError(f"Ladder {name}: cut points must be increasing probabilities")
+        recommendations = [str(r) for r in entry.get('recommendations', [''] * n_levels)]
+        colors = [str(c) for c in entry.get('colors', [''] * n_levels)]
+        if len(recommendations) != n_levels or len(colors) != n_levels:
+            raise ValueError(f"Ladder {name}: need one recommendation and one color per level")
+        alert_level = entry.get('alert_level')
+        if alert_level is not None and alert_level not in self.levels:
+            raise ValueError(f"Ladder {name}: unknown alert_level {alert_level}")
+        alert_code = self.levels.index(alert_level) if alert_level is not None else n_levels
+        return cuts, recommendations, colors, alert_code
+
+    @classmethod
+    def load(cls, path=POLICY_FILE):
+        with open(path) as f:
+            return cls(json.load(f), source=path)
+
+    def ladder_index(self, mine_ids, n_rows):
+        """Ladder row per reading: 0 (default) unless its mine has an override."""
+        if mine_ids is None or not self.mine_index:
+            return np.zeros(n_rows, dtype=np.intp)
+        if isinstance(mine_ids, str):
+            return np.full(n_rows, self.mine_index.get(mine_ids, 0), dtype=np.intp)
+        unique, inverse = np.unique(np.asarray(mine_ids, dtype=str), return_inverse=True)
+        return np.array([self.mine_index.get(m, 0) for m in unique], dtype=np.intp)[inverse]
+
+    def codes(self, probs, mine_ids=None):
+        """Level index per probability (``unknown_code`` for NaN); ``mine_ids`` is one id or one per row."""
+        probs = np.atleast_1d(np.asarray(probs, dtype=np.float64))
+        ladder = self.ladder_index(mine_ids, len(probs))
+        if len(self.cuts) == 1 or not ladder.any():
+            codes = np.searchsorted(self.cuts[0], probs, side='left')
+        else:
+            codes = np.empty(len(probs), dtype=np.intp)
+            for i in np.unique(ladder):
+                rows = ladder == i
+                codes[rows] = np.searchsorted(self.cuts[i], probs[rows], side='left')
+        codes[np.isnan(probs)] = self.unknown_code
+        return codes, ladder
+
+    def classify(self, probs, mine_ids=None):
+        """Arrays of level code, risk_level, recommendation, color and alert for a probability vector."""
+        codes, ladder = self.codes(probs, mine_ids)
+        if ladder.any():
+            rows = (ladder, codes)
+            alert_codes = self.alert_codes[ladder]
+        else:
+            # One ladder for the whole batch: gather from its row alone
+            rows = (0, codes)
+            alert_codes = self.alert_codes[0]
+        return {
+            'code': codes,
+            'risk_level': self.level_names[codes],
+            'recommendation': self.recommendations[rows],
+            'color': self.colors[rows],
+            'alert': (codes >= alert_codes) & (codes != self.unknown_code),
+        }
+
+
+class PolicyFile:
+    """The RiskPolicy in a JSON file, swapped for the new one when the file changes.
+
+    ``current`` stats the file at most every ``check_interval`` seconds, so
+    an edit takes effect without a restart or a background thread. A new
+    version that fails to parse or validate is logged and the previous
+    policy stays in force; ``reload()`` raises instead.
+    """
+
+    def __init__(self, path=POLICY_FILE, check_interval=2.0, log=print):
+        self.path = path
+        self.check_interval = check_interval
+        self.log = log
+        self._lock = threading.Lock()
+        self._seen = None
+        self._checked = 0.0
+        self.loaded_at = None
+        self.reload()
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self):
+        with self._lock:
+            signature = self._signature()
+            policy = RiskPolicy.load(self.path)
+            self._policy, self._seen = policy, signature
+            self._checked = time.monotonic()
+            self.loaded_at = time.time()
+        return policy
+
+    def check(self):
+        """Reload if the file changed since it was last read; returns the policy now in force."""
+        self._checked = time.monotonic()
+        try:
+            signature = self._signature()
+            if signature != self._seen:
+                # Remembered before parsing, so a bad edit is reported once rather than on every check
+                self._seen = signature
+                self.reload()
+                self.log(f"Risk policy reloaded from {self.path}")
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.log(f"Keeping the current risk policy; {self.path} is invalid: {e}")
+        return self._policy
+
+    @property
+    def current(self):
+        if time.monotonic() - self._checked >= self.check_interval:
+            return self.check()
+        return self._policy
@@ -0,0 +1,132 @@
+# Opt-in sampling profiler that keeps stack traces of slow requests
+import collections
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.005
+# Finer sampling costs the serving threads more GIL time than the traces are worth
+MIN_INTERVAL = 0.002
+DEFAULT_SLOW_THRESHOLD = 0.25
+MAX_STACK_DEPTH = 48
+
+
+def _fold(frame):
+    """A frame's stack in flamegraph 'folded' form: root;...;leaf, one file:function:line per level."""
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight requests from a background thread.
+
+    Nothing runs until ``start()``: while stopped, ``begin()`` is a single
+    attribute check, so the hook can stay in the request path permanently.
+    While running, a daemon thread wakes every ``interval`` seconds and reads
+    ``sys._current_frames()`` for the threads registered by ``begin()``.
+    Requests that take at least ``slow_threshold`` seconds keep their folded
+    stack counts in a bounded list of recent traces.
+
+    Requests are told apart by the thread serving them, so traces are only
+    meaningful for the threaded Flask server (one request per thread). The
+    ASGI app runs every request on the event-loop thread and does not
+    register them.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, slow_threshold=DEFAULT_SLOW_THRESHOLD, max_traces=20):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.traces = collections.deque(maxlen=max_traces)
+        self.samples = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+        self._retired = None
+
+    @property
+    def enabled(self):
+        return self._thread is not None
+
+    def start(self, interval=None, slow_threshold=None):
+        """Start sampling; raises ValueError for an interval under MIN_INTERVAL or a negative threshold."""
+        interval = self.interval if interval is None else float(interval)
+        slow_threshold = self.slow_threshold if slow_threshold is None else float(slow_threshold)
+        if not interval >= MIN_INTERVAL:
+            raise ValueError(f"Sampling interval must be at least {MIN_INTERVAL * 1000:g} ms")
+        if not slow_threshold >= 0:
+            raise ValueError("Slow-request threshold must not be negative")
+        self.interval, self.slow_threshold = interval, slow_threshold
+        # A sampler stopped a moment ago may still be finishing its last pass; never run two at once
+        with self._lock:
+            retired = self._retired
+        if retired is not None:
+            retired.join()
+        with self._lock:
+            if self._thread is None:
+                # Each sampler gets its own stop event, so a stop() racing this start() only ends the old one
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), name='sampling-profiler',
+                                                daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._stop.set()
+                self._retired = thread
+            self._active.clear()
+        if thread is not None:
+            thread.join()
+
+    def begin(self, label):
+        """Register the calling thread's request; returns a token for end(), or None when disabled."""
+        if self._thread is None:
+            return None
+        ident = threading.get_ident()
+        record = {'label': label, 'stacks': collections.Counter(), 'started': time.time()}
+        with self._lock:
+            self._active[ident] = record
+        return ident, record
+
+    def end(self, token, duration):
+        if token is None:
+            return
+        ident, record = token
+        with self._lock:
+            if self._active.get(ident) is record:
+                del self._active[ident]
+        if duration >= self.slow_threshold:
+            self.traces.append({
+                'label': record['label'],
+                'started': record['started'],
+                'duration_ms': round(duration * 1000, 2),
+                'samples': sum(record['stacks'].values()),
+                'stacks': [{'stack': stack, 'samples': count} for stack, count in record['stacks'].most_common(25)],
+            })
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, record in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        record['stacks'][_fold(frame)] += 1
+                self.samples += 1
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'interval_ms': self.interval * 1000,
+            'slow_threshold_ms': self.slow_threshold * 1000,
+            'samples': self.samples,
+            'slow_traces': list(self.traces),
+        }
@@ -0,0 +1,239 @@
+# Shared-memory ring of scored readings: API workers write, the co-located dashboard reads without HTTP
+# Usage: python shm_ring.py rockfall_scored            (capacity, records written, newest record)
+#        python shm_ring.py rockfall_scored --unlink
+import argparse
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from features import FEATURES_BASE
+from history_store import LABEL_WIDTH, MAX_CLASSES, RISK_LEVELS, SCHEMA, record_from_columns
+from time_utils import to_epoch
+
+# One scored reading: the HistoryStore columns plus when a worker wrote it. Aligned, so every slot's
+# sequence word sits on an 8-byte boundary and is stored in one piece
+RECORD = np.dtype([(name, dtype, shape) for name, dtype, shape in SCHEMA] + [('scored_at', np.float64)], align=True)
+SLOT = np.dtype([('seq', np.int64), ('record', RECORD)], align=True)
+
+MAGIC = 0x524B5347  # "RKSG"
+# ``token`` is random per created block, so a reader can tell a recreated ring from the one it mapped
+HEADER = np.dtype([('magic', np.int64), ('capacity', np.int64), ('slot_size', np.int64), ('head', np.int64),
+                   ('token', np.int64)])
+SLOTS_OFFSET = 64
+
+DEFAULT_CAPACITY = 4096
+# How long an attaching process waits for the creator to finish writing the header
+ATTACH_TIMEOUT = 1.0
+
+_RISK_CODES = {name: i for i, name in enumerate(RISK_LEVELS)}
+
+
+def _shared_memory(name, create=False, size=0):
+    # The ring outlives any one worker, so no process's resource tracker may unlink it at exit
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _labels(values, n):
+    if values is None:
+        return np.zeros(n, dtype=f'S{LABEL_WIDTH}')
+    encoded = np.char.encode(np.asarray(values).astype(str), 'utf-8')
+    return encoded.astype(f'S{LABEL_WIDTH}')
+
+
+def scored_rows(features, binary_scores, mc_scores=None, risk_levels=None, mine_ids=None, timestamps=None):
+    """RECORD rows for a scored batch, built column by column from the predictor's score arrays.
+
+    ``features`` is the batch's feature matrix (base readings first);
+    ``mine_ids`` and ``timestamps`` are one value per row or None. Readings
+    without a timestamp take the time they were scored.
+    """
+    n = len(binary_scores['probability'])
+    rows = np.zeros(n, dtype=RECORD)
+    now = time.time()
+    rows['scored_at'] = now
+    if timestamps is None:
+        rows['timestamp'] = now
+    else:
+        epochs = [to_epoch(value) for value in timestamps]
+        rows['timestamp'] = [now if epoch is None else epoch for epoch in epochs]
+    rows['mine_id'] = _labels(mine_ids, n)
+    base = np.asarray(features)[:, :len(FEATURES_BASE)]
+    for i, name in enumerate(FEATURES_BASE):
+        rows[name] = base[:, i]
+
+    rows['binary_prediction'] = binary_scores['prediction']
+    rows['binary_confidence'] = binary_scores['probability']
+    if risk_levels is not None:
+        names, inverse = np.unique(np.asarray(risk_levels).astype(str), return_inverse=True)
+        rows['risk_level'] = np.array([_RISK_CODES.get(name, 0) for name in names], dtype=np.int8)[inverse]
+
+    rows['mc_probabilities'] = np.nan
+    if mc_scores is None:
+        rows['mc_label'] = b'N/A'
+        rows['mc_confidence'] = np.nan
+    else:
+        rows['mc_label'] = _labels(mc_scores['prediction_label'], n)
+        rows['mc_confidence'] = mc_scores['confidence']
+        probabilities = np.asarray(mc_scores['probabilities'])[:, :MAX_CLASSES]
+        rows['mc_probabilities'][:, :probabilities.shape[1]] = probabilities
+    return rows
+
+
+class ScoredRing:
+    """Fixed-size records in a ``multiprocessing.shared_memory`` block, with a seqlock on every slot.
+
+    Record ``n`` lives in slot ``n % capacity``. A writer stamps the slot's
+    sequence word with ``2n + 1``, copies the record and stamps it again
+    with ``2n + 2``; the header's ``head`` (records ever written) only
+    moves once the batch is in place. Writers from every worker process
+    serialise on an flock. Readers take no lock: they copy a range of
+    slots and keep the ones whose sequence word read ``2n + 2`` both before
+    and after the copy, so a slot overwritten mid-read is dropped instead
+    of returned torn. This relies on stores becoming visible in program
+    order, as on x86.
+    """
+
+    def __init__(self, shm, writable=False):
+        self.shm = shm
+        self.name = shm.name
+        self.writable = writable
+        self.header = np.ndarray(1, dtype=HEADER, buffer=shm.buf)
+        deadline = time.monotonic() + ATTACH_TIMEOUT
+        while int(self.header['magic'][0]) != MAGIC:
+            if time.monotonic() > deadline:
+                raise ValueError(f"Shared memory {shm.name} is not a scored-reading ring")
+            time.sleep(0.01)
+        if int(self.header['slot_size'][0]) != SLOT.itemsize:
+            raise ValueError(f"Ring {shm.name} was written with another record layout; unlink it and restart")
+        self.capacity = int(self.header['capacity'][0])
+        self.token = int(self.header['token'][0])
+        self.slots = np.ndarray(self.capacity, dtype=SLOT, buffer=shm.buf, offset=SLOTS_OFFSET)
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(tempfile.gettempdir(), f'{self.name}.lock'), 'a+b') if writable else None
+
+    @classmethod
+    def open(cls, name, capacity=DEFAULT_CAPACITY):
+        """Attach to the ring ``name`` for writing, creating it if this is the first worker to start."""
+        try:
+            shm = _shared_memory(name, create=True, size=SLOTS_OFFSET + capacity * SLOT.itemsize)
+        except FileExistsError:
+            return cls(_shared_memory(name), writable=True)
+        header = np.ndarray(1, dtype=HEADER, buffer=shm.buf)
+        header['capacity'] = capacity
+        header['slot_size'] = SLOT.itemsize
+        header['head'] = 0
+        header['token'] = int.from_bytes(os.urandom(8), 'little') >> 1
+        header['magic'] = MAGIC
+        del header
+        print(f"Created shared-memory ring {name} ({capacity} records, {capacity * SLOT.itemsize / 1e6:.1f} MB)")
+        return cls(shm, writable=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Read-only use of an existing ring; raises FileNotFoundError until a worker has created it."""
+        return cls(_shared_memory(name))
+
+    @property
+    def head(self):
+        """Records written since the ring was created; also the cursor just past the newest one."""
+        return int(self.header['head'][0])
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def write(self, rows):
+        """Append RECORD rows; once the ring is full each one overwrites the oldest record."""
+        if not self.writable:
+            raise ValueError("Ring was attached read-only")
+        total = len(rows)
+        if total == 0:
+            return
+        rows = rows[-self.capacity:]
+        with self._exclusive():
+            head = self.head
+            seq = head + total - len(rows) + np.arange(len(rows), dtype=np.int64)
+            index = seq % self.capacity
+            self.slots['seq'][index] = 2 * seq + 1
+            self.slots['record'][index] = rows
+            self.slots['seq'][index] = 2 * seq + 2
+            self.header['head'] = head + total
+
+    def read(self, cursor=None, limit=None):
+        """(rows, next cursor): records from ``cursor`` on (the newest ``limit`` without one), oldest first.
+
+        Records already overwritten by newer ones are skipped; pass the
+        returned cursor back in to receive only what was written since.
+        """
+        head = self.head
+        start = head - self.capacity
+        if cursor is not None:
+            # A cursor past head belongs to a ring that has since been recreated: resume from its head
+            start = max(start, min(cursor, head))
+        if limit is not None:
+            start = max(start, head - int(limit))
+        seq = np.arange(max(start, 0), head, dtype=np.int64)
+        index = seq % self.capacity
+        before = self.slots['seq'][index]
+        rows = self.slots['record'][index]
+        after = self.slots['seq'][index]
+        intact = (before == 2 * seq + 2) & (after == before)
+        return rows[intact], head
+
+    def latest(self):
+        """The newest record as a RECORD row, or None while the ring is empty."""
+        rows, _ = self.read(limit=1)
+        return rows[0] if len(rows) else None
+
+    def records(self, cursor=None, limit=None):
+        """read() as dashboard records (the /simulate-and-predict shape) plus the next cursor."""
+        rows, cursor = self.read(cursor, limit)
+        return [record_from_columns(rows, i) for i in range(len(rows))], cursor
+
+    def close(self):
+        self.slots = self.header = None
+        self.shm.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    @staticmethod
+    def unlink(name):
+        """Remove the ring; workers still attached keep their mapping until they exit."""
+        # Tracked here on purpose: unlink() also unregisters the name from this process's resource tracker
+        shm = shared_memory.SharedMemory(name=name)
+        shm.close()
+        shm.unlink()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect or remove the shared-memory ring of scored readings')
+    parser.add_argument('name', nargs='?', default=os.environ.get('ROCKFALL_SHM_RING', 'rockfall_scored'))
+    parser.add_argument('--unlink', action='store_true', help='Remove the ring (restart the workers afterwards)')
+    args = parser.parse_args()
+
+    if args.unlink:
+        ScoredRing.unlink(args.name)
+        print(f"Removed {args.name}")
+    else:
+        ring = ScoredRing.attach(args.name)
+        newest, _ = ring.records(limit=1)
+        print(f"{args.name}: capacity {ring.capacity}, {ring.head} records written, {SLOT.itemsize} bytes per slot")
+        if newest:
+            print(newest[0])
+        ring.close()
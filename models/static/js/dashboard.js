@@ -388,19 +388,23 @@ displayLegend() {
     this.charts.sensor.update('none');
   }
 
+  handleLatest(data) {
+    if (data.sensor_data) this.updateSensorDisplay(data.sensor_data);
+    if (data.prediction && data.prediction.binary_result) this.updatePredictionDisplay(data.prediction.binary_result);
+    this.setConnectionStatus(true);
+    if (data.timestamp) {
+      this.history.push(data);
+      if (this.history.length > 50) this.history.shift();
+      this.updateCharts(this.history);
+      this.updatePredictionsTable(this.history);
+    }
+  }
+
   async fetchLatestAndUpdate() {
     try {
       const response = await fetch('/api/latest');
       const data = await response.json();
-      if (data.sensor_data) this.updateSensorDisplay(data.sensor_data);
-      if (data.prediction && data.prediction.binary_result) this.updatePredictionDisplay(data.prediction.binary_result);
-      this.setConnectionStatus(true);
-      if (data.timestamp) {
-        this.history.push(data);
-        if (this.history.length > 50) this.history.shift();
-        this.updateCharts(this.history);
-        this.updatePredictionsTable(this.history);
-      }
+      this.handleLatest(data);
     } catch (error) {
       console.error('Error fetching latest data:', error);
       this.setConnectionStatus(false);
@@ -480,9 +484,37 @@ displayLegend() {
   }
 
   startDataFetching() {
-    this.fetchLatestAndUpdate();
     this.fetchHistory();
-    setInterval(() => {
+    if (window.EventSource) {
+      this.startStream();
+    } else {
+      this.startPolling();
+    }
+  }
+
+  startStream() {
+    // Server push: one relayed upstream stream serves every screen, no per-refresh prediction
+    this.eventSource = new EventSource('/api/stream');
+    this.eventSource.onmessage = (event) => {
+      try {
+        this.handleLatest(JSON.parse(event.data));
+      } catch (error) {
+        console.error('Error handling streamed data:', error);
+      }
+    };
+    this.eventSource.onerror = () => {
+      this.setConnectionStatus(false);
+      if (this.eventSource.readyState === EventSource.CLOSED) {
+        console.warn('Stream closed, falling back to polling');
+        this.startPolling();
+      }
+    };
+  }
+
+  startPolling() {
+    if (this.pollTimer) return;
+    this.fetchLatestAndUpdate();
+    this.pollTimer = setInterval(() => {
       this.fetchLatestAndUpdate();
       this.fetchHistory();
     }, this.updateInterval);
@@ -0,0 +1,185 @@
+# Rolling-window features per sensor stream, updated in amortised O(1) per reading
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURES_TEMPORAL, build_feature_matrix, feature_columns
+from fleet_state import DEFAULT_SECTOR
+from time_utils import to_epoch
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+RAIN_SHORT_WINDOW = DAY
+RAIN_LONG_WINDOW = 7 * DAY
+VIBRATION_WINDOW = 7 * DAY
+GROUNDWATER_HALFLIFE = DAY
+FREEZE_THAW_HALFLIFE = 7 * DAY
+
+
+class WindowSum:
+    """Sum of the values seen in the last ``window`` seconds."""
+
+    __slots__ = ('window', 'items', 'total')
+
+    def __init__(self, window):
+        self.window = window
+        self.items = deque()
+        self.total = 0.0
+
+    def add(self, ts, value):
+        self.items.append((ts, value))
+        self.total += value
+        cutoff = ts - self.window
+        while self.items[0][0] <= cutoff:
+            self.total -= self.items.popleft()[1]
+        if len(self.items) == 1:
+            # Resync so float error from the running subtraction cannot accumulate
+            self.total = value
+        return self.total
+
+
+class WindowMax:
+    """Maximum over the last ``window`` seconds with a monotonic deque (values kept decreasing)."""
+
+    __slots__ = ('window', 'items')
+
+    def __init__(self, window):
+        self.window = window
+        self.items = deque()
+
+    def add(self, ts, value):
+        while self.items and self.items[-1][1] <= value:
+            self.items.pop()
+        self.items.append((ts, value))
+        cutoff = ts - self.window
+        while self.items[0][0] <= cutoff:
+            self.items.popleft()
+        return self.items[0][1]
+
+
+class Ewma:
+    """Exponentially weighted mean with a half-life in seconds, so irregular reading gaps are weighted correctly."""
+
+    __slots__ = ('halflife', 'value', 'last')
+
+    def __init__(self, halflife):
+        self.halflife = halflife
+        self.value = None
+        self.last = None
+
+    def add(self, ts, value):
+        if self.value is None:
+            self.value = value
+        else:
+            alpha = 1.0 - 2.0 ** (-(ts - self.last) / self.halflife)
+            self.value += alpha * (value - self.value)
+        self.last = ts
+        return self.value
+
+
+class SensorStream:
+    """Aggregators for one (mine, sector) stream, in FEATURES_TEMPORAL order."""
+
+    __slots__ = ('last_ts', 'rain_short', 'rain_long', 'vibration', 'groundwater', 'freeze_thaw')
+
+    def __init__(self):
+        self.last_ts = -np.inf
+        self.rain_short = WindowSum(RAIN_SHORT_WINDOW)
+        self.rain_long = WindowSum(RAIN_LONG_WINDOW)
+        self.vibration = WindowMax(VIBRATION_WINDOW)
+        self.groundwater = Ewma(GROUNDWATER_HALFLIFE)
+        self.freeze_thaw = Ewma(FREEZE_THAW_HALFLIFE)
+
+    def update(self, ts, rainfall, vibration, groundwater, freeze_thaw):
+        # Late readings are folded in at the stream's current time; the windows only move forward
+        ts = max(ts, self.last_ts)
+        self.last_ts = ts
+        return (self.rain_short.add(ts, rainfall), self.rain_long.add(ts, rainfall),
+                self.vibration.add(ts, vibration), self.groundwater.add(ts, groundwater),
+                self.freeze_thaw.add(ts, freeze_thaw))
+
+
+# Base columns the aggregators read, in SensorStream.update argument order
+SOURCE_COLUMNS = ['rainfall_mm', 'vibration_intensity', 'groundwater_depth_m', 'freeze_thaw_cycles']
+
+
+def instantaneous(rainfall, vibration, groundwater, freeze_thaw):
+    """FEATURES_TEMPORAL for a reading with no history: every aggregate is the reading's own value."""
+    return rainfall, rainfall, vibration, groundwater, freeze_thaw
+
+
+def stream_key(record, mine_id=None):
+    """(mine_id, sector_id) with FleetState's defaults, or None for a reading that belongs to no stream."""
+    mine = mine_id if mine_id is not None else record.get('mine_id')
+    if mine is None or (isinstance(mine, float) and np.isnan(mine)) or str(mine) == '':
+        return None
+    sector = record.get('sector_id')
+    if sector is None or (isinstance(sector, float) and np.isnan(sector)) or str(sector) == '':
+        sector = DEFAULT_SECTOR
+    return str(mine), str(sector)
+
+
+class TemporalFeatureEngine:
+    """Keeps a SensorStream per (mine_id, sector_id) and appends FEATURES_TEMPORAL to feature matrices.
+
+    Each reading updates its stream's running sums, monotonic-deque maxima
+    and EWMAs once, so a request costs O(readings) no matter how much
+    history the windows span. The source values are taken from the feature
+    matrix itself, i.e. after build_feature_matrix applied its defaults.
+    """
+
+    def __init__(self):
+        self.streams = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.streams)
+
+    def extend(self, readings, matrix, mine_id=None):
+        """``matrix`` (rows of ``readings``, feature_columns order) with the temporal columns appended.
+
+        ``mine_id`` overrides the readings' own, as on the /mines/<mine_id> routes.
+        """
+        records = readings.to_dict('records') if isinstance(readings, pd.DataFrame) else \
+            [readings] if isinstance(readings, dict) else readings
+        source = matrix[:, [feature_columns.index(name) for name in SOURCE_COLUMNS]].tolist()
+        now = datetime.now().timestamp()
+        out = np.empty((len(records), len(FEATURES_TEMPORAL)), dtype=np.float64)
+        with self._lock:
+            for i, (record, values) in enumerate(zip(records, source)):
+                key = stream_key(record, mine_id)
+                if key is None:
+                    out[i] = instantaneous(*values)
+                    continue
+                stream = self.streams.get(key)
+                if stream is None:
+                    stream = self.streams[key] = SensorStream()
+                ts = to_epoch(record.get('timestamp'))
+                out[i] = stream.update(now if ts is None else ts, *values)
+        return np.hstack([matrix, out])
+
+
+def add_temporal_features(df, matrix=None):
+    """Offline counterpart of TemporalFeatureEngine.extend for a training DataFrame of base readings.
+
+    With ``timestamp`` (and optionally ``mine_id``/``sector_id``) columns the
+    rows are replayed through a fresh engine in time order, which gives the
+    exact values serving would have produced. Rows without a timestamp (or
+    without a mine_id) are independent readings with no history, so each
+    aggregate is the reading's own value. Returns the temporal columns as an
+    (n_rows, 5) array.
+    """
+    if matrix is None:
+        matrix = build_feature_matrix(df)
+    if 'timestamp' not in df.columns:
+        return np.column_stack(instantaneous(*(matrix[:, feature_columns.index(c)] for c in SOURCE_COLUMNS)))
+
+    order = np.argsort(np.array([to_epoch(ts) for ts in df['timestamp']], dtype=np.float64), kind='stable')
+    extended = TemporalFeatureEngine().extend(df.iloc[order], matrix[order])
+    out = np.empty((len(df), len(FEATURES_TEMPORAL)))
+    out[order] = extended[:, -len(FEATURES_TEMPORAL):]
+    return out
@@ -0,0 +1,14 @@
+# Timestamp helpers shared by the history, fleet, temporal-feature and shared-memory stores
+from datetime import datetime
+
+
+def to_epoch(value):
+    """Seconds since the epoch for an epoch number or ISO-8601 string; None when there is no timestamp."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
@@ -0,0 +1,163 @@
+# Runs the (model x task) training grid on a process pool over shared-memory matrices
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.neighbors import KNeighborsClassifier
+
+from features import feature_columns
+
+TASKS = {
+    'binary': {'target': 'rockfall_binary', 'train': 'binary_train', 'test': 'binary_test'},
+    'multiclass': {'target': 'risk_level', 'train': 'multiclass_train', 'test': 'multiclass_test'},
+}
+
+# Models that are fit on standardised features
+SCALED_MODELS = {'K-Nearest Neighbors', 'Logistic Regression'}
+MODEL_NAMES = ['Random Forest', 'Logistic Regression', 'K-Nearest Neighbors']
+
+
+def build_model(name, task):
+    """Fresh estimator for one cell of the grid (based on research recommendations)."""
+    if name == 'Random Forest':
+        return RandomForestClassifier(random_state=42, n_estimators=100)
+    if name == 'Logistic Regression':
+        model = LogisticRegression(random_state=42, max_iter=1000)
+        # One-vs-rest for multiclass, as multi_class='ovr' did before scikit-learn removed that option
+        return OneVsRestClassifier(model) if task == 'multiclass' else model
+    if name == 'K-Nearest Neighbors':
+        return KNeighborsClassifier(n_neighbors=7)  # Based on research finding k=7 optimal
+    raise ValueError(f"Unknown model: {name}")
+
+
+def _attach(name):
+    # Pool workers share the parent's resource tracker, so attaching never hands them ownership;
+    # the parent unlinks every block when training ends
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedArrays:
+    """Named NumPy arrays copied once into shared memory blocks that worker processes map without pickling."""
+
+    def __init__(self, arrays):
+        self.blocks = {}
+        self.specs = {}
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            self.blocks[key] = shm
+            self.specs[key] = (shm.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for shm in self.blocks.values():
+            shm.close()
+            shm.unlink()
+        self.blocks = {}
+
+
+# Per-worker views of the shared blocks, set up once by the pool initializer
+_ARRAYS = {}
+_HANDLES = []
+
+
+def _init_worker(specs):
+    for key, (name, shape, dtype) in specs.items():
+        shm = _attach(name)
+        _HANDLES.append(shm)
+        _ARRAYS[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _run_job(name, task):
+    variant = 'scaled' if name in SCALED_MODELS else 'raw'
+    X_train, X_test = _ARRAYS[f'{task}/train/{variant}'], _ARRAYS[f'{task}/test/{variant}']
+    y_train, y_test = _ARRAYS[f'{task}/train/y'], _ARRAYS[f'{task}/test/y']
+    if variant == 'raw':
+        # Forests are fit on named columns like the served models expect; wrapping the view does not copy
+        X_train = pd.DataFrame(X_train, columns=feature_columns, copy=False)
+        X_test = pd.DataFrame(X_test, columns=feature_columns, copy=False)
+
+    model = build_model(name, task)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    predict_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    y_proba = model.predict_proba(X_test)
+    predict_proba_seconds = time.perf_counter() - start
+
+    auc = None
+    if task == 'binary':
+        # Handle case where only one class is present
+        try:
+            auc = roc_auc_score(y_test, y_proba[:, 1])
+        except (IndexError, ValueError):
+            auc = 0.5
+    return model, {
+        'accuracy': accuracy_score(y_test, y_pred),
+        'auc': auc,
+        'fit_seconds': fit_seconds,
+        'predict_seconds': predict_seconds,
+        'predict_proba_seconds': predict_proba_seconds,
+        'predict_us_per_row': predict_proba_seconds / max(len(y_test), 1) * 1e6,
+    }
+
+
+def train_grid(store, model_names=MODEL_NAMES, tasks=('binary', 'multiclass'), max_workers=None, log=print):
+    """Fit every (model, task) pair in parallel and return (results DataFrame, {(model, task): estimator}).
+
+    The split matrices (raw and standardised) are materialised from the
+    DatasetStore once in the parent and placed in shared memory; each worker
+    maps them instead of receiving pickled copies with every job. A failing
+    pair is reported in the results table rather than aborting the run.
+    """
+    arrays = {}
+    for task in tasks:
+        spec = TASKS[task]
+        for part in ('train', 'test'):
+            split = spec[part]
+            arrays[f'{task}/{part}/raw'] = store.matrix(split)
+            arrays[f'{task}/{part}/scaled'] = store.matrix(split, scaled=True)
+            arrays[f'{task}/{part}/y'] = store.target(spec['target'], split)
+
+    shared = SharedArrays(arrays)
+    rows, models = [], {}
+    try:
+        workers = max_workers or min(os.cpu_count() or 1, len(model_names) * len(tasks))
+        # train_models.py runs at module level, so workers must fork rather than re-import __main__
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(shared.specs,)) as executor:
+            futures = {executor.submit(_run_job, name, task): (name, task)
+                       for task in tasks for name in model_names}
+            for future in as_completed(futures):
+                name, task = futures[future]
+                row = {'model': name, 'task': task, 'n_train': len(arrays[f'{task}/train/y']),
+                       'n_test': len(arrays[f'{task}/test/y'])}
+                try:
+                    model, metrics = future.result()
+                except Exception as e:
+                    row.update(status='failed', error=str(e))
+                    log(f"{name} ({task}) failed: {e}")
+                else:
+                    models[name, task] = model
+                    row.update(metrics, status='ok', error='')
+                    log(f"{name} ({task}): accuracy {metrics['accuracy']:.3f}, "
+                        f"fit {metrics['fit_seconds']:.2f}s, predict {metrics['predict_us_per_row']:.1f} us/row")
+                rows.append(row)
+    finally:
+        shared.close()
+
+    results = pd.DataFrame(rows).sort_values(['task', 'model']).reset_index(drop=True)
+    return results, models
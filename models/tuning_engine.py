@@ -0,0 +1,225 @@
+# Successive-halving hyperparameter search shared by several tasks, with an on-disk fold cache
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, StratifiedKFold, train_test_split
+
+# Datasets are shipped to each worker once through the pool initializer, not with every job
+_DATASETS = {}
+
+
+def _init_worker(datasets):
+    global _DATASETS
+    _DATASETS = datasets
+
+
+def _fit_fold(task_name, estimator_cls, params, train_idx, test_idx, scoring):
+    X, y = _DATASETS[task_name]
+    start = time.perf_counter()
+    try:
+        model = estimator_cls(**params).fit(X[train_idx], y[train_idx])
+        fit_time = time.perf_counter() - start
+        score = float(get_scorer(scoring)(model, X[test_idx], y[test_idx]))
+    except Exception as e:
+        print(f"Fit failed for {task_name} {params}: {e}")
+        return {'score': float('nan'), 'fit_time': time.perf_counter() - start}
+    return {'score': score, 'fit_time': fit_time}
+
+
+def dataset_fingerprint(X, y):
+    """Hash of feature values, column names and targets; any change to the data gives a new key space."""
+    h = hashlib.sha1()
+    if isinstance(X, pd.DataFrame):
+        h.update(json.dumps(list(map(str, X.columns))).encode())
+    h.update(np.ascontiguousarray(np.asarray(X, dtype=np.float64)).tobytes())
+    h.update(np.ascontiguousarray(np.asarray(y)).astype(str).astype('U').tobytes())
+    return h.hexdigest()
+
+
+class FoldCache:
+    """One small JSON file per (dataset, estimator, params, fold, resource) result."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(**parts):
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json')
+
+    def get(self, key):
+        result = None
+        if self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key)) as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def put(self, key, result):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, staging = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f)
+        os.replace(staging, path)
+
+
+class TuningTask:
+    def __init__(self, name, X, y, scoring='accuracy'):
+        self.name = name
+        self.X = X
+        self.y = np.asarray(y)
+        self.scoring = scoring
+        self.fingerprint = dataset_fingerprint(X, self.y)
+
+
+def _resources(n_candidates, max_resources, min_resources, factor):
+    n_rounds = max(1, math.ceil(math.log(n_candidates, factor))) if n_candidates > 1 else 1
+    return [max(min_resources, int(max_resources / factor ** (n_rounds - 1 - r))) for r in range(n_rounds)]
+
+
+def _subsample(train_idx, y, n, seed):
+    if n >= len(train_idx):
+        return train_idx
+    try:
+        sample, _ = train_test_split(train_idx, train_size=n, stratify=y[train_idx], random_state=seed)
+    except ValueError:
+        # Too few rows per class to stratify at this size
+        sample = np.random.default_rng(seed).choice(train_idx, n, replace=False)
+    return np.sort(sample)
+
+
+def _halving(task, candidates, executor, cache, estimator_cls, base_params, cv, factor, min_resources, seed, log):
+    folds = list(StratifiedKFold(n_splits=cv).split(task.X, task.y))
+    max_resources = min(len(train) for train, _ in folds)
+    n_classes = len(np.unique(task.y))
+    floor = min(max_resources, min_resources or max(2 * cv * n_classes, 20))
+    rounds = _resources(len(candidates), max_resources, floor, factor)
+    rows = []
+
+    for r, resource in enumerate(rounds):
+        pending, scores = [], {}
+        for c, params in enumerate(candidates):
+            full_params = dict(base_params, **params)
+            for f, (train, test) in enumerate(folds):
+                key = FoldCache.key(dataset=task.fingerprint, estimator=estimator_cls.__name__, params=full_params,
+                                    cv=cv, fold=f, resource=resource, scoring=task.scoring, seed=seed)
+                result = cache.get(key)
+                if result is not None:
+                    scores[c, f] = (result, True)
+                    continue
+                sample = _subsample(train, task.y, resource, seed + f)
+                future = executor.submit(_fit_fold, task.name, estimator_cls, full_params, sample, test, task.scoring)
+                pending.append((c, f, key, future))
+
+        for c, f, key, future in pending:
+            result = future.result()
+            if not math.isnan(result['score']):
+                cache.put(key, result)
+            scores[c, f] = (result, False)
+
+        means = []
+        for c, params in enumerate(candidates):
+            fold_scores = np.array([scores[c, f][0]['score'] for f in range(cv)])
+            mean = float(np.mean(fold_scores))
+            means.append(-np.inf if math.isnan(mean) else mean)
+            rows.append({
+                'task': task.name, 'round': r, 'resource': resource, 'params': json.dumps(params, sort_keys=True),
+                'mean_score': mean, 'std_score': float(np.std(fold_scores)),
+                'mean_fit_time': float(np.mean([scores[c, f][0]['fit_time'] for f in range(cv)])),
+                'cached_folds': sum(scores[c, f][1] for f in range(cv)),
+            })
+        log(f"[{task.name}] round {r}: {len(candidates)} candidates on {resource} rows, "
+            f"{len(pending)} fits, {len(candidates) * cv - len(pending)} cached, best {max(means):.3f}")
+
+        keep = 1 if r == len(rounds) - 1 else max(1, math.ceil(len(candidates) / factor))
+        order = np.argsort(means, kind='stable')[::-1][:keep]
+        candidates = [candidates[i] for i in order]
+        best_score = means[order[0]]
+
+    return candidates[0], best_score, pd.DataFrame(rows)
+
+
+def tune_tasks(tasks, param_grid, estimator_cls=RandomForestClassifier, base_params=None, cv=5, factor=3,
+               min_resources=None, cache_dir=None, max_workers=None, seed=42, log=print):
+    """Successive halving over ``param_grid`` for every task at once, sharing one process pool.
+
+    Each round fits the surviving candidates on a stratified subsample of every
+    training fold, keeps the best 1/``factor`` and grows the subsample by
+    ``factor`` until the last round uses the full folds. Fold scores are cached
+    under ``cache_dir`` keyed on the dataset fingerprint and the full parameter
+    set, so a rerun only fits configurations it has not seen. Returns
+    {task name: {'best_params', 'best_score', 'best_estimator', 'results'}}.
+    """
+    base_params = dict(base_params if base_params is not None else {'random_state': 42})
+    candidates = list(ParameterGrid(param_grid))
+    cache = FoldCache(cache_dir)
+    datasets = {task.name: (np.asarray(task.X, dtype=np.float64), task.y) for task in tasks}
+    outcomes, errors = {}, []
+    log_lock = threading.Lock()
+
+    def task_log(message):
+        with log_lock:
+            log(message)
+
+    # The tuning scripts run at module level, so workers must fork rather than re-import __main__
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context,
+                             initializer=_init_worker, initargs=(datasets,)) as executor:
+        def run(task):
+            try:
+                outcomes[task.name] = _halving(task, candidates, executor, cache, estimator_cls, base_params,
+                                               cv, factor, min_resources, seed, task_log)
+            except Exception as e:
+                errors.append(e)
+
+        # One driver thread per task so both searches keep the pool busy between their rounds
+        drivers = [threading.Thread(target=run, args=(task,)) for task in tasks]
+        for driver in drivers:
+            driver.start()
+        for driver in drivers:
+            driver.join()
+    if errors:
+        raise errors[0]
+
+    log(f"Fold cache: {cache.hits} hits, {cache.misses} misses")
+    results = {}
+    for task in tasks:
+        best_params, best_score, table = outcomes[task.name]
+        best_estimator = estimator_cls(**dict(base_params, **best_params))
+        if 'n_jobs' in best_estimator.get_params():
+            # Refit on all cores, but ship a model that predicts single rows without spinning up threads
+            n_jobs = best_estimator.get_params()['n_jobs']
+            best_estimator.set_params(n_jobs=-1).fit(task.X, task.y).set_params(n_jobs=n_jobs)
+        else:
+            best_estimator.fit(task.X, task.y)
+        results[task.name] = {'best_params': best_params, 'best_score': best_score,
+                              'best_estimator': best_estimator, 'results': table}
+    return results
@@ -0,0 +1,110 @@
+# Pooled, cached client for the prediction API used by the dashboard proxy
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client with a short TTL cache and stale-while-revalidate.
+
+    Within ``ttl`` seconds of the last successful fetch every caller gets the
+    cached prediction. Once it expires, callers still get the cached copy for
+    up to ``stale_ttl`` seconds while a single background refresh runs, so a
+    slow or down API never blocks the dashboard workers. Only when there is
+    nothing usable cached does a caller wait on the upstream call, and
+    concurrent callers share that one call.
+    """
+
+    def __init__(self, base_url, ttl=1.0, stale_ttl=60.0, timeout=5, pool_size=16, on_update=None):
+        self.base_url = base_url.rstrip('/')
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.on_update = on_update
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.stats = {'upstream_calls': 0, 'upstream_errors': 0, 'hits': 0, 'stale': 0, 'misses': 0}
+        self._latest = None
+        self._fetched_at = 0.0
+        self._last_error = None
+        self._failed_at = float('-inf')
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+        self._state_lock = threading.Lock()
+
+    def _fetch(self):
+        with self._state_lock:
+            self.stats['upstream_calls'] += 1
+        try:
+            response = self.session.get(f'{self.base_url}/simulate-and-predict', timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            with self._state_lock:
+                self.stats['upstream_errors'] += 1
+                self._last_error = e
+                self._failed_at = time.monotonic()
+            raise
+        with self._state_lock:
+            self._latest = data
+            self._fetched_at = time.monotonic()
+        if self.on_update is not None:
+            self.on_update(data)
+        return data
+
+    def _refresh_in_background(self):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with self._fetch_lock:
+                    if time.monotonic() - self._fetched_at >= self.ttl:
+                        self._fetch()
+            except Exception as e:
+                print(f"Background refresh failed, serving stale data: {e}")
+            finally:
+                with self._state_lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_latest(self):
+        """Return (prediction, cache_status) where cache_status is 'hit', 'stale' or 'miss'."""
+        with self._state_lock:
+            data, age = self._latest, time.monotonic() - self._fetched_at
+            if data is not None and age < self.ttl:
+                self.stats['hits'] += 1
+                return data, 'hit'
+            if data is not None and age < self.stale_ttl:
+                self.stats['stale'] += 1
+        if data is not None and age < self.stale_ttl:
+            self._refresh_in_background()
+            return data, 'stale'
+
+        # Nothing usable cached: one caller fetches, the rest wait for its result
+        with self._fetch_lock:
+            with self._state_lock:
+                if self._latest is not None and time.monotonic() - self._fetched_at < self.ttl:
+                    self.stats['hits'] += 1
+                    return self._latest, 'hit'
+                self.stats['misses'] += 1
+                # Callers queued behind a failed fetch share its error instead of each retrying
+                if time.monotonic() - self._failed_at < self.ttl:
+                    raise UpstreamUnavailable(str(self._last_error))
+            try:
+                return self._fetch(), 'miss'
+            except Exception as e:
+                raise UpstreamUnavailable(str(e)) from e
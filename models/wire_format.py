@@ -0,0 +1,173 @@
+# Response encodings for the prediction API: fast JSON, compact columnar batches, MessagePack and Arrow IPC
+import json
+
+import numpy as np
+
+# orjson, msgpack and pyarrow are optional; without orjson the same JSON is produced by the stdlib encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+JSON = 'application/json'
+COMPACT_JSON = 'application/vnd.rockfall.compact+json'
+MSGPACK = 'application/msgpack'
+ARROW = 'application/vnd.apache.arrow.stream'
+
+# ?format= name -> media type. Everything but 'json' carries a scored batch as columns, not one object per reading
+FORMATS = {'json': JSON, 'compact': COMPACT_JSON, 'msgpack': MSGPACK, 'arrow': ARROW}
+MEDIA_TYPES = {media_type: name for name, media_type in FORMATS.items()}
+MEDIA_TYPES['application/x-msgpack'] = 'msgpack'
+
+
+def available_formats():
+    installed = {'json': True, 'compact': True, 'msgpack': msgpack is not None, 'arrow': pa is not None}
+    return [name for name in FORMATS if installed[name]]
+
+
+def _accepted(accept):
+    """Format names an Accept header asks for, most preferred first (by q, then by position)."""
+    ranked = []
+    for position, part in enumerate((accept or '').split(',')):
+        media_type, *params = [p.strip() for p in part.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        name = MEDIA_TYPES.get(media_type.lower())
+        if name is not None and q > 0:
+            ranked.append((-q, position, name))
+    return [name for _, _, name in sorted(ranked)]
+
+
+def negotiate(format_param=None, accept=None, allowed=tuple(FORMATS)):
+    """Format name for a request: ``?format=`` wins, then the Accept header, else 'json'.
+
+    Raises ValueError for an unknown format, one this endpoint does not
+    offer, or one whose encoder is not installed (the caller answers 406).
+    """
+    if format_param:
+        name = format_param.lower()
+        if name not in allowed or name not in available_formats():
+            offered = [f for f in available_formats() if f in allowed]
+            raise ValueError(f"Unsupported format {format_param!r}; available: {', '.join(offered)}")
+        return name
+    for name in _accepted(accept):
+        if name in allowed and name in available_formats():
+            return name
+    return 'json'
+
+
+def parse_fields(value):
+    """``?fields=a,b.c`` as a list of dotted paths; None when the parameter is absent or empty."""
+    fields = [f.strip() for f in (value or '').split(',') if f.strip()]
+    return fields or None
+
+
+def project(payload, fields):
+    """Keep only the dotted ``fields`` of a JSON-able payload; lists are projected item by item.
+
+    ``fields=prediction,timestamp`` drops the echoed sensor_data of a
+    /simulate-and-predict response, ``fields=count,predictions.binary_result.risk_level``
+    keeps one value per reading of a batch. Paths that do not exist are ignored.
+    """
+    tree = {}
+    for path in fields:
+        node = tree
+        for part in path.split('.'):
+            node = node.setdefault(part, {})
+    return _project(payload, tree)
+
+
+def _project(value, tree):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+def json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, default=None, sort_keys=False):
+    """JSON bytes for ``obj``; NumPy scalars and arrays are written directly instead of via tolist()."""
+    if default is None:
+        default = json_default
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(obj, default=default, sort_keys=sort_keys, separators=(',', ':')).encode()
+
+
+def _plain(value):
+    return value.tolist() if isinstance(value, np.ndarray) else value
+
+
+def encode_compact_json(columns, meta):
+    return dumps(dict(meta, columns=columns))
+
+
+def encode_msgpack(columns, meta):
+    # Compact columns are float32 already, so floats go out as 4-byte msgpack floats
+    body = dict(meta, columns={name: _plain(values) for name, values in columns.items()})
+    return msgpack.packb(body, use_bin_type=True, use_single_float=True)
+
+
+def _arrow_column(values):
+    values = np.asarray(values)
+    if values.ndim == 2:
+        return pa.FixedSizeListArray.from_arrays(pa.array(np.ascontiguousarray(values).ravel()), values.shape[1])
+    if values.dtype.kind in 'UO':
+        # Risk levels and labels repeat a handful of values, so they are sent as dictionary indices
+        return pa.array(values.tolist(), type=pa.string()).dictionary_encode()
+    return pa.array(values)
+
+
+def encode_arrow(columns, meta):
+    """One Arrow IPC stream with a single record batch; ``meta`` goes into the schema metadata as JSON values."""
+    batch = pa.RecordBatch.from_arrays([_arrow_column(values) for values in columns.values()],
+                                       names=list(columns))
+    batch = batch.replace_schema_metadata({key: dumps(value) for key, value in meta.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+ENCODERS = {'compact': encode_compact_json, 'msgpack': encode_msgpack, 'arrow': encode_arrow}
+
+
+def select_columns(columns, fields, default_fields=None):
+    """The columns named in ``fields`` (the present ``default_fields``, else all, when None); ValueError for unknown names."""
+    if fields is None:
+        return {name: values for name, values in columns.items() if default_fields is None or name in default_fields}
+    unknown = [name for name in fields if name not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields {', '.join(unknown)}; available: {', '.join(columns)}")
+    return {name: columns[name] for name in fields}
+
+
+def encode_columns(format_name, columns, meta):
+    """(body bytes, media type) of a columnar batch in one of the compact formats."""
+    return ENCODERS[format_name](columns, meta), FORMATS[format_name]
@@ -0,0 +1,108 @@
+# Shared fixtures. The modules import each other by bare name, as the scripts do when run from their directories
+import importlib
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'dataset'))
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+sys.path.insert(0, os.path.join(ROOT, 'models'))
+
+from features import FEATURES_BASE, build_feature_frame  # noqa: E402
+
+
+def make_readings(n_rows, seed=0):
+    """Base sensor readings drawn from the data_generation.py ranges."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'slope_height_m': rng.uniform(10, 200, n_rows),
+        'slope_angle_deg': rng.uniform(30, 85, n_rows),
+        'cohesion_kpa': rng.uniform(0, 100, n_rows),
+        'friction_angle_deg': rng.uniform(20, 45, n_rows),
+        'unit_weight_kn_m3': rng.uniform(20, 28, n_rows),
+        'rqd_percent': rng.uniform(10, 95, n_rows),
+        'joint_spacing_m': rng.uniform(0.1, 3.0, n_rows),
+        'rainfall_mm': rng.exponential(5, n_rows),
+        'temperature_range_c': rng.uniform(5, 30, n_rows),
+        'groundwater_depth_m': rng.uniform(1, 50, n_rows),
+        'freeze_thaw_cycles': rng.poisson(15, n_rows).astype(float),
+        'blasting_distance_m': rng.uniform(10, 500, n_rows),
+        'vibration_intensity': rng.uniform(0, 10, n_rows),
+        'days_since_blast': rng.uniform(1, 60, n_rows),
+        'mining_depth_m': rng.uniform(5, 150, n_rows),
+        'days_since_rain': rng.uniform(0, 30, n_rows),
+        'season_encoded': rng.integers(0, 4, n_rows).astype(float),
+    })[FEATURES_BASE]
+
+
+def risk_labels(X):
+    """A learnable three-level target: steep, weak slopes are riskier."""
+    score = X['slope_steepness_factor'].rank(pct=True) + X['geological_weakness'].rank(pct=True)
+    return np.digitize(score, [0.8, 1.2])
+
+
+@pytest.fixture(scope='session')
+def training_frame():
+    return build_feature_frame(make_readings(600, seed=1))
+
+
+@pytest.fixture(scope='session')
+def query_frame():
+    return build_feature_frame(make_readings(300, seed=2))
+
+
+@pytest.fixture(scope='session')
+def forests(training_frame):
+    """(binary, multiclass, label encoder) fitted on the training frame."""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import LabelEncoder
+
+    y_multiclass = risk_labels(training_frame)
+    encoder = LabelEncoder().fit(np.array(['Low', 'Medium', 'High']))
+    binary = RandomForestClassifier(n_estimators=15, max_depth=8, random_state=0).fit(
+        training_frame, (y_multiclass == 2).astype(int))
+    multiclass = RandomForestClassifier(n_estimators=15, random_state=0).fit(training_frame, y_multiclass)
+    return binary, multiclass, encoder
+
+
+def write_model_dir(path, binary, multiclass=None, encoder=None):
+    """Pickle models under the file names ModelStore.from_dir reads; returns ``path``."""
+    import joblib
+    from model_store import BINARY_MODEL_FILE, LABEL_ENCODER_FILE, MULTICLASS_MODEL_FILE
+
+    os.makedirs(path, exist_ok=True)
+    joblib.dump(binary, os.path.join(path, BINARY_MODEL_FILE))
+    if multiclass is not None:
+        joblib.dump(multiclass, os.path.join(path, MULTICLASS_MODEL_FILE))
+    if encoder is not None:
+        joblib.dump(encoder, os.path.join(path, LABEL_ENCODER_FILE))
+    return str(path)
+
+
+@pytest.fixture(scope='session')
+def api(tmp_path_factory, forests):
+    """rockfall_api serving the test forests from a registry of its own; its settings are read at import."""
+    from model_registry import ModelRegistry
+    from risk_policy import POLICY_FILE
+
+    root = tmp_path_factory.mktemp('api')
+    registry = ModelRegistry(str(root / 'registry'))
+    version = registry.publish(write_model_dir(root / 'models', *forests))
+    policy_path = shutil.copy(POLICY_FILE, root / 'risk_policy.json')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('ROCKFALL_MODEL_REGISTRY', registry.root)
+        patch.setenv('ROCKFALL_REGISTRY_POLL', '3600')
+        patch.setenv('ROCKFALL_RISK_POLICY', str(policy_path))
+        # Another module (benchmark_pipeline) may have defaulted this to 0 at import
+        patch.setenv('ROCKFALL_CACHE_SIZE', '10000')
+        for name in ('ROCKFALL_ADMIN_TOKEN', 'ROCKFALL_SHM_RING', 'ROCKFALL_TEMPORAL_FEATURES'):
+            patch.delenv(name, raising=False)
+        module = importlib.import_module('rockfall_api')
+    assert module.live_models.version == version
+    yield module
+    module.registry_watcher.stop()
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from benchmark_pipeline import FINGERPRINT_KEYS, compare, fingerprint, load_readings, measure
+from features import FEATURES_BASE
+
+
+def report(*rows):
+    return {'results': [{'case': case, 'batch_size': batch_size, 'threads': 1, 'p50_ms': p50}
+                        for case, batch_size, p50 in rows]}
+
+
+def test_only_real_slowdowns_are_regressions():
+    baseline = report(('score', 1, 0.1), ('score', 100, 2.0), ('http', 1, 10.0))
+    current = report(('score', 1, 0.3), ('score', 100, 2.6), ('http', 1, 12.0), ('new_case', 1, 50.0))
+    regressions = compare(current, baseline)
+    # 0.1 -> 0.3 ms triples but stays under MIN_DELTA_MS; 10 -> 12 ms is within the 25% tolerance
+    assert [(r['case'], r['batch_size'], r['ratio']) for r in regressions] == [('score', 100, 1.3)]
+    assert regressions[0]['baseline_p50_ms'] == 2.0
+    assert compare(current, baseline, tolerance=0.1)[-1]['case'] == 'http'
+    assert compare(current, baseline, min_delta_ms=0.1)[0]['case'] == 'score'
+
+
+def test_fingerprint_covers_the_environment_but_not_the_models():
+    environment = {key: 'x' for key in FINGERPRINT_KEYS}
+    base = fingerprint(environment)
+    assert fingerprint(dict(environment, model_version='abc')) == base
+    assert fingerprint(dict(environment, numpy='2.0')) != base
+
+
+def test_measure_pools_latencies_across_threads():
+    seen = set()
+
+    def call():
+        seen.add(threading.get_ident())
+
+    latencies, wall = measure(call, threads=3, min_time=0.001, max_calls=7)
+    assert len(latencies) == 21 and (latencies >= 0).all() and wall > 0
+    assert len(seen) >= 3
+
+
+def test_measure_reraises_worker_failures():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) > 2:
+            raise RuntimeError('HTTP 500')
+
+    with pytest.raises(RuntimeError, match='HTTP 500'):
+        measure(flaky, threads=2, min_time=0.001, max_calls=10)
+
+
+def test_readings_are_reproducible_api_records():
+    readings = load_readings(5, seed=3)
+    assert readings == load_readings(5, seed=3)
+    assert set(readings[0]) == set(FEATURES_BASE) | {'timestamp', 'mine_id'}
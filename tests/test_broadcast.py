@@ -0,0 +1,55 @@
+import json
+import threading
+import time
+
+from broadcast import SSE_HEARTBEAT, Broadcaster, ndjson_format, sse_format
+
+
+def test_every_subscriber_gets_every_event():
+    hub = Broadcaster()
+    first, second = hub.subscribe(), hub.subscribe()
+    for i in range(3):
+        hub.publish({'n': i})
+    assert [first.get_nowait()['n'] for _ in range(3)] == [0, 1, 2]
+    assert [second.get_nowait()['n'] for _ in range(3)] == [0, 1, 2]
+
+
+def test_slow_subscriber_drops_its_oldest_events():
+    hub = Broadcaster(max_queue=2)
+    q = hub.subscribe()
+    for i in range(5):
+        hub.publish(i)
+    assert [q.get_nowait(), q.get_nowait()] == [3, 4]
+
+
+def test_new_subscriber_starts_with_the_latest_event():
+    hub = Broadcaster()
+    hub.publish('old')
+    hub.publish('latest')
+    assert hub.subscribe().get_nowait() == 'latest'
+
+
+def test_listen_formats_heartbeats_and_unsubscribes():
+    hub = Broadcaster()
+    stream = hub.listen(formatter=ndjson_format, heartbeat=0.01)
+    assert next(stream) == SSE_HEARTBEAT
+    hub.publish({'a': 1})
+    assert json.loads(next(stream)) == {'a': 1}
+    stream.close()
+    assert hub.subscriber_count == 0
+
+
+def test_sse_frames():
+    frame = sse_format({'a': 1})
+    assert frame.startswith('data: ') and frame.endswith('\n\n')
+    assert json.loads(frame[len('data: '):]) == {'a': 1}
+
+
+def test_periodic_producer_only_runs_while_someone_listens():
+    hub = Broadcaster()
+    produced = threading.Event()
+    hub.run_periodic(lambda: produced.set() or 'tick', interval=0.01)
+    time.sleep(0.05)
+    assert not produced.is_set()
+    q = hub.subscribe()
+    assert q.get(timeout=2) == 'tick'
@@ -0,0 +1,104 @@
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bulk_score
+from bulk_score import INVALID, MANIFEST_FILE
+from conftest import make_readings, write_model_dir
+
+CHUNK_SIZE = 50
+
+
+@pytest.fixture
+def model_dir(tmp_path, forests):
+    return write_model_dir(tmp_path / 'models', *forests)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    readings = make_readings(220, seed=5)
+    readings.insert(0, 'mine_id', [f'MINE_{i % 3}' for i in range(len(readings))])
+    readings.insert(0, 'timestamp', pd.date_range('2024-01-01', periods=len(readings), freq='min').astype(str))
+    readings.loc[[7, 130], 'rainfall_mm'] = np.nan
+    path = tmp_path / 'archive.csv'
+    readings.to_csv(path, index=False)
+    return str(path)
+
+
+def run(archive, out_dir, model_dir, **kwargs):
+    return bulk_score.bulk_score(archive, str(out_dir), chunk_size=CHUNK_SIZE, workers=1, fmt='csv',
+                                 model_dir=model_dir, log=lambda *a: None, **kwargs)
+
+
+def read_output(out_dir):
+    return pd.concat([pd.read_csv(p) for p in sorted(glob.glob(os.path.join(out_dir, 'part-*.csv')))],
+                     ignore_index=True)
+
+
+def test_every_row_is_scored_in_input_order(tmp_path, archive, model_dir):
+    manifest = run(archive, tmp_path / 'out', model_dir)
+    assert manifest['status'] == 'complete' and manifest['rows'] == 220 and len(manifest['chunks']) == 5
+    assert manifest['invalid'] == 2
+    out = read_output(tmp_path / 'out')
+    assert (out['timestamp'] == pd.read_csv(archive)['timestamp']).all()
+    assert list(out.index[out['risk_level'] == INVALID]) == [7, 130]
+    assert out['binary_probability'].isna().sum() == 2
+
+
+def test_rerun_after_a_killed_chunk_scores_only_the_rest(tmp_path, monkeypatch, archive, model_dir):
+    scored = []
+    kill_at = ['part-00000-000002']
+    real_score_chunk = bulk_score._score_chunk
+
+    def score_chunk(job):
+        if job[0] in kill_at:
+            raise KeyboardInterrupt
+        scored.append(job[0])
+        return real_score_chunk(job)
+
+    monkeypatch.setattr(bulk_score, '_score_chunk', score_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        run(archive, tmp_path / 'out', model_dir)
+    with open(tmp_path / 'out' / MANIFEST_FILE) as f:
+        failed = json.load(f)
+    assert failed['status'] == 'failed' and sorted(failed['chunks']) == scored
+
+    # A leftover staging file from the killed write is cleaned up on resume
+    (tmp_path / 'out' / 'part-00000-000002.csv.tmp').write_text('truncated')
+    scored.clear()
+    kill_at.clear()
+    manifest = run(archive, tmp_path / 'out', model_dir)
+    assert scored == ['part-00000-000002', 'part-00000-000003', 'part-00000-000004']
+    assert manifest['status'] == 'complete' and manifest['rows'] == 220
+    assert not glob.glob(str(tmp_path / 'out' / '*.tmp'))
+
+    run(archive, tmp_path / 'clean', model_dir)
+    pd.testing.assert_frame_equal(read_output(tmp_path / 'out'), read_output(tmp_path / 'clean'))
+
+
+def test_changed_settings_refuse_to_resume(tmp_path, archive, model_dir):
+    run(archive, tmp_path / 'out', model_dir)
+    with pytest.raises(ValueError, match='different inputs'):
+        bulk_score.bulk_score(archive, str(tmp_path / 'out'), chunk_size=CHUNK_SIZE * 2, workers=1, fmt='csv',
+                              model_dir=model_dir, log=lambda *a: None)
+    manifest = bulk_score.bulk_score(archive, str(tmp_path / 'out'), chunk_size=CHUNK_SIZE * 2, workers=1,
+                                     fmt='csv', model_dir=model_dir, restart=True, log=lambda *a: None)
+    assert len(manifest['chunks']) == 3
+    assert len(glob.glob(str(tmp_path / 'out' / 'part-*'))) == 3
+
+
+def test_worker_processes_match_the_inline_run(tmp_path, archive, model_dir):
+    run(archive, tmp_path / 'inline', model_dir)
+    bulk_score.bulk_score(archive, str(tmp_path / 'pool'), chunk_size=CHUNK_SIZE, workers=2, fmt='csv',
+                          model_dir=model_dir, log=lambda *a: None)
+    pd.testing.assert_frame_equal(read_output(tmp_path / 'pool'), read_output(tmp_path / 'inline'))
+
+
+def test_missing_sensor_column_fails_the_chunk(forests):
+    predictor = bulk_score.RockfallPredictor(*forests)
+    with pytest.raises(KeyError, match='rainfall_mm'):
+        bulk_score.score_frame(predictor, make_readings(3).drop(columns='rainfall_mm'))
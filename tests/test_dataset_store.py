@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+from conftest import risk_labels
+from dataset_store import DatasetStore, write_dataset_store
+from features import FEATURES_TEMPORAL
+from temporal_features import add_temporal_features
+
+
+@pytest.fixture
+def splits():
+    rows = np.random.default_rng(0).permutation(600)
+    return {'binary_train': rows[:400], 'binary_test': rows[400:],
+            'multiclass_train': rows[200:], 'multiclass_test': rows[:200]}
+
+
+@pytest.fixture
+def streams():
+    n = 600
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n, freq='37min').astype(str)[::-1],
+        'mine_id': [f'MINE_{i % 3}' for i in range(n)],
+        'sector_id': [f'S{i % 2}' for i in range(n)],
+    })
+
+
+@pytest.fixture
+def store(tmp_path, training_frame, splits, streams):
+    y = risk_labels(training_frame)
+    write_dataset_store(tmp_path / 'store', training_frame, {'binary': (y == 2).astype(int), 'multiclass': y},
+                        splits, classes={'multiclass': ['Low', 'Medium', 'High']}, streams=streams)
+    return DatasetStore(str(tmp_path / 'store'))
+
+
+def test_round_trip(store, training_frame, splits):
+    assert isinstance(store.features, np.memmap) and store.features.flags.f_contiguous
+    np.testing.assert_array_equal(store.matrix(), training_frame.to_numpy())
+    pd.testing.assert_frame_equal(store.frame('binary_test'),
+                                  training_frame.iloc[splits['binary_test']].reset_index(drop=True))
+    np.testing.assert_array_equal(store.target('multiclass', 'multiclass_test'),
+                                  risk_labels(training_frame)[splits['multiclass_test']])
+    np.testing.assert_array_equal(store.column('rainfall_mm'), training_frame['rainfall_mm'])
+    assert store.classes('multiclass') == ['Low', 'Medium', 'High'] and store.classes('binary') is None
+
+
+def test_scaling_matches_a_scaler_fit_on_the_training_split(store, training_frame, splits):
+    scaler = StandardScaler().fit(training_frame.iloc[np.sort(splits['multiclass_train'])])
+    expected = scaler.transform(training_frame.iloc[splits['multiclass_test']])
+    np.testing.assert_allclose(store.matrix('multiclass_test', scaled=True), expected, atol=1e-12)
+    np.testing.assert_allclose(store.scaler('multiclass').transform(store.frame('multiclass_test')), expected,
+                               atol=1e-12)
+    columns = ['rainfall_mm', 'slope_angle_deg']
+    np.testing.assert_allclose(store.matrix('multiclass_test', columns, scaled=True),
+                               expected[:, [training_frame.columns.get_loc(c) for c in columns]], atol=1e-12)
+    with pytest.raises(ValueError):
+        store.matrix(scaled=True)
+
+
+def test_rewriting_swaps_the_whole_store(tmp_path, store, training_frame, splits):
+    write_dataset_store(store.path, training_frame * 2, {'binary': np.zeros(600)}, splits)
+    reopened = DatasetStore(store.path)
+    np.testing.assert_array_equal(reopened.matrix(), training_frame.to_numpy() * 2)
+    assert reopened.streams() is None
+    assert not [p for p in tmp_path.iterdir() if p.name.startswith('.dataset-')]
+    with pytest.raises(ValueError):
+        reopened.temporal_frame('binary_train')
+
+
+def test_temporal_frame_replays_every_row_in_time_order(store, training_frame, streams, splits):
+    stored = store.streams('binary_test')
+    assert stored['mine_id'].tolist() == streams['mine_id'].iloc[splits['binary_test']].tolist()
+    assert stored['timestamp'].dtype == np.float64
+
+    expected = add_temporal_features(pd.concat([streams, training_frame], axis=1))
+    frame = store.temporal_frame('binary_test')
+    assert list(frame.columns[-len(FEATURES_TEMPORAL):]) == FEATURES_TEMPORAL
+    np.testing.assert_allclose(frame[FEATURES_TEMPORAL].to_numpy(), expected[splits['binary_test']])
+    pd.testing.assert_frame_equal(frame.drop(columns=FEATURES_TEMPORAL), store.frame('binary_test'))
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_readings
+from features import (FEATURES_BASE, FEATURES_DERIVED, add_derived_features, build_feature_matrix, columns_for,
+                      feature_columns, temporal_feature_columns)
+
+
+def test_matrix_matches_dataset_derivation():
+    readings = make_readings(50)
+    matrix = build_feature_matrix(readings)
+    expected = add_derived_features(readings.copy())[feature_columns].to_numpy()
+    np.testing.assert_array_equal(matrix, expected)
+    assert matrix.flags['C_CONTIGUOUS'] and matrix.dtype == np.float64
+
+
+def test_dict_records_and_frame_agree():
+    readings = make_readings(5)
+    records = readings.to_dict('records')
+    from_frame = build_feature_matrix(readings)
+    np.testing.assert_array_equal(build_feature_matrix(records), from_frame)
+    np.testing.assert_array_equal(build_feature_matrix(records[0]), from_frame[:1])
+
+
+def test_optional_readings_default_to_zero():
+    record = make_readings(1).to_dict('records')[0]
+    del record['groundwater_depth_m']
+    record['season_encoded'] = None
+    row = build_feature_matrix(record)[0]
+    assert row[FEATURES_BASE.index('groundwater_depth_m')] == 0.0
+    assert row[FEATURES_BASE.index('season_encoded')] == 0.0
+
+
+def test_missing_and_empty_required_readings_raise():
+    record = make_readings(1).to_dict('records')[0]
+    with pytest.raises(KeyError, match='slope_height_m'):
+        build_feature_matrix({k: v for k, v in record.items() if k != 'slope_height_m'})
+    with pytest.raises(ValueError, match='rainfall_mm'):
+        build_feature_matrix(pd.DataFrame([dict(record, rainfall_mm=None)]))
+
+
+def test_columns_for_widths():
+    assert columns_for(len(feature_columns)) == feature_columns
+    assert columns_for(len(temporal_feature_columns)) == temporal_feature_columns
+    with pytest.raises(ValueError):
+        columns_for(len(FEATURES_DERIVED))
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from conftest import make_readings
+from features import feature_columns
+from fleet_state import DEFAULT_SECTOR, FleetState
+
+RAIN = feature_columns.index('rainfall_mm')
+
+
+class RainPredictor:
+    """Scores a reading by its rainfall, so each test can set the probability it expects back."""
+
+    def __init__(self, labels=('Low', 'High')):
+        self.labels = np.array(labels)
+
+    def score(self, features):
+        probability = np.asarray(features)[:, RAIN] / 100
+        prediction = (probability > 0.5).astype(int)
+        return {'binary': {'probability': probability, 'prediction': prediction},
+                'multiclass': {'prediction_label': self.labels[prediction], 'confidence': np.full(len(prediction), 0.9)}}
+
+
+def readings(*rows):
+    """Reading dicts from (mine_id, sector_id, timestamp, rainfall) tuples."""
+    base = make_readings(len(rows), seed=6).to_dict('records')
+    for reading, (mine_id, sector_id, timestamp, rainfall) in zip(base, rows):
+        reading.update(mine_id=mine_id, timestamp=timestamp, rainfall_mm=rainfall)
+        if sector_id is not None:
+            reading['sector_id'] = sector_id
+    return base
+
+
+def test_newest_reading_per_sector_wins():
+    fleet = FleetState(RainPredictor())
+    binary, _ = fleet.ingest(readings(('M1', 'A', 30, 10.0), ('M1', 'A', 20, 90.0), ('M1', None, 5, 40.0)))
+    assert binary['probability'].tolist() == [0.1, 0.9, 0.4]
+    state = fleet.mine_state('M1')
+    assert state['sector_id'] == ['A', DEFAULT_SECTOR]
+    assert state['binary_probability'].tolist() == [0.1, 0.4]
+    assert state['readings'].tolist() == [2, 1]
+
+    # A late reading is counted but does not replace the newer state
+    fleet.ingest(readings(('M1', 'A', 25, 80.0)))
+    assert fleet.sector_state('M1', 'A')['binary_probability'].tolist() == [0.1]
+    fleet.ingest(readings(('M1', 'A', 31, 70.0)))
+    state = fleet.sector_state('M1', 'A')
+    assert state['binary_probability'].tolist() == [0.7] and state['mc_label'].tolist() == ['High']
+    assert state['readings'].tolist() == [4] and state['timestamp'].tolist() == [31.0]
+
+
+def test_route_mine_id_and_missing_ids():
+    fleet = FleetState(RainPredictor())
+    fleet.ingest(readings((None, 'A', 1, 10.0)), mine_id='M9')
+    assert fleet.mines == ['M9']
+    with pytest.raises(ValueError, match='mine_id'):
+        fleet.ingest(readings((None, 'A', 1, 10.0)))
+    with pytest.raises(ValueError):
+        fleet.ingest([])
+    with pytest.raises(KeyError):
+        fleet.mine_state('M1')
+
+
+def test_capacity_grows_and_keeps_existing_slots():
+    fleet = FleetState(RainPredictor(), initial_capacity=2)
+    fleet.ingest(readings(*[(f'M{i % 3}', f'S{i}', i, float(i)) for i in range(7)]))
+    assert len(fleet) == 7 and fleet.capacity == 8
+    state = fleet.fleet_state()
+    assert state['M0']['sector_id'] == ['S0', 'S3', 'S6']
+    assert state['M0']['binary_probability'].tolist() == [0.0, 0.03, 0.06]
+    assert state['M2']['binary_probability'].tolist() == [0.02, 0.05]
+
+
+def test_labels_stay_decoded_across_model_versions():
+    fleet = FleetState(RainPredictor())
+    fleet.ingest(readings(('M1', 'A', 1, 90.0), ('M1', 'B', 1, 10.0)))
+    # A newer model with other class names scores only sector B
+    fleet.ingest(readings(('M1', 'B', 2, 90.0)), predictor=RainPredictor(('Safe', 'Critical')))
+    assert fleet.mine_state('M1')['mc_label'].tolist() == ['High', 'Critical']
+    fleet.ingest(readings(('M2', 'A', 1, 10.0)), features=np.zeros((1, len(feature_columns))))
+    assert fleet.mine_state('M2')['binary_probability'].tolist() == [0.0]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from forest_engine import PackedForest, export_forest, float32_thresholds
+
+
+@pytest.mark.parametrize('task', [0, 1], ids=['binary', 'multiclass'])
+def test_packed_forest_matches_sklearn(forests, query_frame, task):
+    model = forests[task]
+    packed = export_forest(model)
+    np.testing.assert_allclose(packed.predict_proba(query_frame), model.predict_proba(query_frame), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(packed.predict(query_frame.to_numpy()), model.predict(query_frame))
+    np.testing.assert_array_equal(packed.classes_, model.classes_)
+    assert packed.n_estimators == len(model.estimators_)
+
+
+def test_float32_forest_makes_the_same_splits(forests, query_frame):
+    model = forests[1]
+    packed64, packed32 = export_forest(model), export_forest(model, dtype=np.float32)
+    np.testing.assert_array_equal(packed32.apply(query_frame), packed64.apply(query_frame))
+    np.testing.assert_allclose(packed32.predict_proba(query_frame), model.predict_proba(query_frame), atol=1e-6)
+    assert packed32.nbytes < packed64.nbytes
+
+
+def test_float32_thresholds_round_down():
+    thresholds = np.array([0.1, 1 / 3, 2.5, -7.3, 1e-9])
+    rounded = float32_thresholds(thresholds)
+    assert rounded.dtype == np.float32
+    assert np.all(rounded.astype(np.float64) <= thresholds)
+    assert np.all(np.nextafter(rounded, np.float32(np.inf)).astype(np.float64) > thresholds)
+
+
+def test_saved_forest_memory_maps_back(forests, query_frame, tmp_path):
+    packed = export_forest(forests[0])
+    packed.save(tmp_path / 'forest')
+    loaded = PackedForest.load(tmp_path / 'forest')
+    assert isinstance(loaded.threshold, np.memmap)
+    np.testing.assert_array_equal(loaded.predict_proba(query_frame), packed.predict_proba(query_frame))
+
+
+def test_rejects_wrong_width_and_unfitted_models(forests, query_frame):
+    from sklearn.ensemble import RandomForestClassifier
+
+    with pytest.raises(ValueError, match='features'):
+        export_forest(forests[0]).predict_proba(query_frame.to_numpy()[:, :5])
+    with pytest.raises(ValueError):
+        export_forest(RandomForestClassifier())
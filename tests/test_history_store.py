@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from history_store import HistoryStore
+
+T0 = 1_700_000_000.0
+
+
+def record(ts, confidence=0.5, risk_level='LOW', mine_id='MINE_1', rainfall=1.0):
+    return {
+        'timestamp': ts,
+        'sensor_data': {'mine_id': mine_id, 'rainfall_mm': rainfall},
+        'prediction': {
+            'binary_result': {'prediction': int(confidence > 0.5), 'confidence': confidence, 'risk_level': risk_level},
+            'multiclass_result': {'prediction_label': 'Low', 'confidence': 0.9, 'probabilities': [0.9, 0.05, 0.05]},
+        },
+    }
+
+
+def stored_times(rows):
+    return [row['sensor_data']['rainfall_mm'] for row in rows]
+
+
+@pytest.fixture(params=['memory', 'mapped'])
+def make_store(request, tmp_path):
+    def make(capacity):
+        path = str(tmp_path / 'history.bin') if request.param == 'mapped' else None
+        return HistoryStore(capacity=capacity, path=path)
+    return make
+
+
+def test_ring_wraps_and_keeps_the_newest_rows_oldest_first(make_store):
+    store = make_store(5)
+    for i in range(12):
+        store.append(record(T0 + i, rainfall=float(i)))
+    assert len(store) == 5
+    assert stored_times(store.query()) == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert int(store.header['head'][0]) == 12 % 5
+
+
+def test_round_trip_of_one_record(make_store):
+    store = make_store(4)
+    store.append(record(T0, confidence=0.8, risk_level='HIGH'))
+    row = store.query()[0]
+    assert row['sensor_data']['mine_id'] == 'MINE_1'
+    assert row['sensor_data']['groundwater_depth_m'] is None
+    assert row['prediction']['binary_result'] == {'prediction': 1, 'confidence': 0.8, 'risk_level': 'HIGH'}
+    assert row['prediction']['multiclass_result']['probabilities'] == [0.9, 0.05, 0.05]
+
+
+def test_time_filters_and_limit(make_store):
+    store = make_store(50)
+    for i in range(10):
+        store.append(record(T0 + i, rainfall=float(i)))
+    assert stored_times(store.query(since=T0 + 3, until=T0 + 5)) == [3.0, 4.0, 5.0]
+    assert stored_times(store.query(limit=2)) == [8.0, 9.0]
+    assert store.query(limit=0) == []
+
+
+def test_out_of_order_appends_come_back_in_time_order(make_store):
+    store = make_store(10)
+    for ts in (3, 1, 2):
+        store.append(record(T0 + ts, rainfall=float(ts)))
+    assert stored_times(store.query()) == [1.0, 2.0, 3.0]
+
+
+def test_downsampling_keeps_each_time_bucket_peak():
+    store = HistoryStore(capacity=100)
+    # A burst of readings early on must not push the late peak into another bucket
+    for i in range(20):
+        store.append(record(T0 + i * 0.1, confidence=0.1 + i * 0.01, rainfall=float(i)))
+    store.append(record(T0 + 90, confidence=0.95, rainfall=99.0))
+    store.append(record(T0 + 95, confidence=0.2, rainfall=98.0))
+    rows = store.query(downsample=2)
+    assert stored_times(rows) == [19.0, 99.0]
+
+
+def test_mapped_history_is_shared_and_survives_reopening(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    writer = HistoryStore(capacity=3, path=path)
+    reader = HistoryStore(capacity=3, path=path)
+    for i in range(4):
+        writer.append(record(T0 + i, rainfall=float(i)))
+    assert stored_times(reader.query()) == [1.0, 2.0, 3.0]
+    # The stored capacity wins over the one asked for
+    reopened = HistoryStore(capacity=999, path=path)
+    assert reopened.capacity == 3 and len(reopened) == 3
+    assert np.isclose(reopened.columns['timestamp'][0], T0 + 3)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import StandardScaler
+
+import knn_engine
+from conftest import risk_labels
+from knn_engine import MIN_RECALL, PackedKNN, export_knn
+
+
+def fit_knn(frame, weights='uniform'):
+    scaler = StandardScaler().fit(frame)
+    model = KNeighborsClassifier(n_neighbors=7, weights=weights).fit(scaler.transform(frame), risk_labels(frame))
+    return model, scaler
+
+
+@pytest.mark.parametrize('weights', ['uniform', 'distance'])
+def test_exact_search_matches_sklearn(training_frame, query_frame, weights):
+    model, scaler = fit_knn(training_frame, weights)
+    packed = export_knn(model, scaler)
+    assert not packed.indexed and packed.recall == 1.0
+    # Raw rows go in: the packed engine applies the scaler itself
+    np.testing.assert_allclose(packed.predict_proba(query_frame), model.predict_proba(scaler.transform(query_frame)),
+                               atol=1e-12)
+    np.testing.assert_array_equal(packed.predict(query_frame.to_numpy()), model.predict(scaler.transform(query_frame)))
+
+
+def test_training_rows_take_their_own_label_under_distance_weights(training_frame):
+    model, scaler = fit_knn(training_frame, 'distance')
+    packed = export_knn(model, scaler)
+    np.testing.assert_array_equal(packed.predict(training_frame[:50]), risk_labels(training_frame)[:50])
+
+
+def test_indexed_search_reaches_the_recall_target(monkeypatch, training_frame, query_frame):
+    monkeypatch.setattr(knn_engine, 'BRUTE_FORCE_LIMIT', 100)
+    model, scaler = fit_knn(training_frame)
+    packed = export_knn(model, scaler)
+    assert packed.indexed and packed.recall >= MIN_RECALL
+    agreement = (packed.predict(query_frame) == model.predict(scaler.transform(query_frame))).mean()
+    assert agreement >= 0.95
+
+
+def test_low_recall_falls_back_to_exact_search(monkeypatch, training_frame, query_frame):
+    monkeypatch.setattr(knn_engine, 'BRUTE_FORCE_LIMIT', 100)
+    model, scaler = fit_knn(training_frame)
+    packed = export_knn(model, scaler, n_probe=1, min_recall=1.01)
+    assert not packed.indexed and packed.recall == 1.0
+    # The rows stay in cell order, so the labels must have moved with them
+    np.testing.assert_allclose(packed.predict_proba(query_frame), model.predict_proba(scaler.transform(query_frame)),
+                               atol=1e-12)
+
+
+def test_save_and_load_memory_maps_the_arrays(tmp_path, monkeypatch, training_frame, query_frame):
+    monkeypatch.setattr(knn_engine, 'BRUTE_FORCE_LIMIT', 100)
+    model, scaler = fit_knn(training_frame)
+    packed = export_knn(model, scaler)
+    packed.save(tmp_path / 'knn')
+    loaded = PackedKNN.load(tmp_path / 'knn')
+    assert isinstance(loaded.data, np.memmap) and loaded.indexed
+    assert loaded.n_probe == packed.n_probe and loaded.recall == packed.recall
+    np.testing.assert_array_equal(loaded.predict_proba(query_frame), packed.predict_proba(query_frame))
+
+
+def test_wrong_feature_count_is_rejected(training_frame):
+    packed = export_knn(*fit_knn(training_frame))
+    with pytest.raises(ValueError, match='features'):
+        packed.predict_proba(np.zeros((2, 3)))
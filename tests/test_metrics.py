@@ -0,0 +1,45 @@
+import pytest
+
+from metrics import Histogram, MetricsRegistry, StageTimer
+
+
+def test_histogram_buckets_are_upper_inclusive_and_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', labels=('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, 'score')
+    counts, total, count = histogram.snapshot('score')
+    assert counts == [2, 1, 1] and total == pytest.approx(3.65) and count == 4
+    assert histogram.snapshot('other') == ([0, 0, 0], 0.0, 0)
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{stage="score",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="score",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{stage="score",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{stage="score"} 4' in lines
+
+
+def test_registry_renders_counters_and_skips_failing_collectors():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', labels=('route', 'status'))
+    requests.inc('/predict', 200)
+    requests.inc('/predict', 200, amount=2)
+    requests.inc('/predict', 500)
+    assert requests.value('/predict', 200) == 3 and requests.value('/health', 200) == 0
+
+    registry.collector(lambda: [('cache_size', 'gauge', 'Cache entries', 7)])
+    registry.collector(lambda: 1 / 0)
+    text = registry.render()
+    assert 'requests_total{route="/predict",status="200"} 3\n' in text
+    assert 'requests_total{route="/predict",status="500"} 1\n' in text
+    assert '# TYPE cache_size gauge\ncache_size 7\n' in text
+    assert text.endswith('\n')
+
+
+def test_stage_timer_records_failed_stages_too():
+    histogram = Histogram('stage_seconds', 'Stages', labels=('stage',))
+    timer = StageTimer(histogram)
+    with timer('features'):
+        pass
+    with pytest.raises(RuntimeError):
+        with timer('predict'):
+            raise RuntimeError
+    assert histogram.snapshot('features')[2] == 1 and histogram.snapshot('predict')[2] == 1
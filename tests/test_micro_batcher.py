@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+
+from micro_batcher import MicroBatcher
+
+
+def split_rows(result, start, stop):
+    return result[start:stop]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_requests_share_one_call_and_get_their_own_rows():
+    calls = []
+
+    def score(matrix, context):
+        calls.append(len(matrix))
+        return matrix[:, 0] * 10
+
+    async def main():
+        batcher = MicroBatcher(score, split_rows, max_batch_rows=64, max_wait_ms=50)
+        requests = [np.full((n, 2), float(i)) for i, n in enumerate([1, 3, 2])]
+        results = await asyncio.gather(*(batcher.submit(features) for features in requests))
+        await batcher.stop()
+        return requests, results, batcher
+
+    requests, results, batcher = run(main())
+    assert calls == [6]
+    for features, result in zip(requests, results):
+        np.testing.assert_array_equal(result, features[:, 0] * 10)
+    assert (batcher.batches, batcher.rows) == (1, 6)
+
+
+def test_full_batch_flushes_before_the_window():
+    calls = []
+
+    def score(matrix, context):
+        calls.append(len(matrix))
+        return matrix
+
+    async def main():
+        batcher = MicroBatcher(score, split_rows, max_batch_rows=4, max_wait_ms=10_000)
+        await asyncio.wait_for(asyncio.gather(*(batcher.submit(np.zeros((2, 1))) for _ in range(2))), timeout=5)
+        await batcher.stop()
+
+    run(main())
+    assert calls == [4]
+
+
+def test_contexts_are_never_scored_together():
+    seen = []
+
+    def score(matrix, context):
+        seen.append((context, len(matrix)))
+        return np.full(len(matrix), context)
+
+    async def main():
+        batcher = MicroBatcher(score, split_rows, max_wait_ms=50)
+        results = await asyncio.gather(batcher.submit(np.zeros((1, 1)), 'a'), batcher.submit(np.zeros((2, 1)), 'b'),
+                                       batcher.submit(np.zeros((1, 1)), 'a'))
+        await batcher.stop()
+        return results
+
+    results = run(main())
+    assert sorted(seen) == [('a', 2), ('b', 2)]
+    assert [list(r) for r in results] == [['a'], ['b', 'b'], ['a']]
+
+
+def test_scoring_errors_reach_every_caller_in_the_batch():
+    def score(matrix, context):
+        raise RuntimeError('model down')
+
+    async def main():
+        batcher = MicroBatcher(score, split_rows, max_wait_ms=20)
+        results = await asyncio.gather(batcher.submit(np.zeros((1, 1))), batcher.submit(np.zeros((1, 1))),
+                                       return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    assert all(isinstance(r, RuntimeError) for r in run(main()))
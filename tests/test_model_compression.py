@@ -0,0 +1,86 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import risk_labels
+from features import FEATURES_BASE, build_feature_frame
+from model_compression import (LATENCY_RESOLUTION_US, MODEL_FILES, pick, run_compression, transfer_set,
+                               truncate_forest, validation_split)
+
+
+def report(*rows):
+    columns = ['candidate', 'accuracy', 'auc', 'fidelity', 'single_row_us', 'single_row_f32_us', 'packed_kb',
+               'packed_f32_kb', 'pickle_kb', 'batch_us_per_row']
+    return pd.DataFrame([dict(zip(columns, row)) for row in rows])
+
+
+def test_truncated_forest_is_the_prefix_of_the_trees(forests, query_frame):
+    binary = forests[0]
+    pruned = truncate_forest(binary, 5)
+    assert len(pruned.estimators_) == 5 and len(binary.estimators_) == 15
+    expected = np.mean([tree.predict_proba(query_frame.to_numpy()) for tree in binary.estimators_[:5]], axis=0)
+    np.testing.assert_allclose(pruned.predict_proba(query_frame), expected, atol=1e-12)
+
+
+def test_latency_noise_does_not_outrank_a_smaller_model():
+    table = report(
+        ['teacher', 0.9, 0.95, 1.0, 40.0, 38.0, 900.0, 450.0, 2000.0, 5.0],
+        ['small', 0.9, 0.95, 1.0, 40.0 + LATENCY_RESOLUTION_US / 4, None, 100.0, 50.0, 300.0, 1.0],
+    )
+    choice = pick(table)
+    assert choice['candidate'] == 'small' and choice['fits']
+    # Only a latency gap above the resolution beats size
+    table.loc[1, 'single_row_us'] = 40.0 + 2 * LATENCY_RESOLUTION_US
+    assert pick(table)['candidate'] == 'teacher'
+
+
+def test_quality_comes_before_speed_and_float32_needs_a_real_gain():
+    table = report(
+        ['teacher', 0.9, 0.95, 1.0, 400.0, 300.0, 900.0, 450.0, 2000.0, 5.0],
+        ['fast', 0.88, 0.93, 0.95, 50.0, 45.0, 100.0, 50.0, 300.0, 1.0],
+    )
+    choice = pick(table)
+    assert choice['candidate'] == 'teacher'
+    assert choice['packed_dtype'] == 'float32' and choice['latency_us'] == 300.0 and choice['size_kb'] == 450.0
+    assert 'latency_rank' not in choice
+    fast = pick(table, latency_budget_us=100)
+    assert fast['candidate'] == 'fast' and fast['packed_dtype'] == 'float64'
+
+
+def test_no_candidate_within_budget_keeps_the_teacher():
+    table = report(
+        ['teacher', 0.9, 0.95, 1.0, 400.0, None, None, None, 2000.0, 5.0],
+        ['fast', 0.88, 0.93, 0.95, 50.0, None, 100.0, None, 300.0, 1.0],
+    )
+    choice = pick(table, latency_budget_us=10)
+    assert choice['candidate'] == 'teacher' and not choice['fits']
+    # Without a packed engine the pickle size stands in
+    assert choice['size_kb'] == 2000.0
+    assert pick(table, max_size_kb=200)['candidate'] == 'fast'
+
+
+def test_transfer_rows_keep_derived_features_consistent(training_frame):
+    X = transfer_set(training_frame, 900)
+    assert len(X) == 900 and list(X.columns) == list(training_frame.columns)
+    pd.testing.assert_frame_equal(X.iloc[:600], training_frame)
+    synthetic = X.iloc[600:].reset_index(drop=True)
+    rebuilt = build_feature_frame(synthetic[FEATURES_BASE])
+    np.testing.assert_allclose(synthetic.to_numpy(), rebuilt.to_numpy(), rtol=1e-9)
+
+
+def test_written_model_is_the_candidate_that_was_ranked(tmp_path, forests, training_frame, query_frame):
+    binary = forests[0]
+    y_train = (risk_labels(training_frame) == 2).astype(int)
+    y_test = (risk_labels(query_frame) == 2).astype(int)
+    result = run_compression({'binary': binary}, {'binary': (training_frame, y_train, query_frame, y_test)},
+                             str(tmp_path / 'out'), str(tmp_path), transfer_rows=1000, log=lambda *a: None)
+    choice = result['chosen']['binary']
+    written = joblib.load(tmp_path / 'out' / MODEL_FILES['binary'])
+    # The teacher would be written as the original model, so only a compressed pick shows the ranked object
+    assert choice['candidate'] != 'teacher'
+
+    X_fit, y_fit, X_val, y_val = validation_split(training_frame, y_train)
+    assert np.mean(written.predict(X_val) == y_val) == pytest.approx(choice['accuracy'])
+    assert np.mean(written.predict(query_frame) == y_test) == pytest.approx(choice['test_accuracy'])
+    assert {row['candidate'] for row in result['results']} >= {'teacher', 'trees_10', 'distill_rf'}
@@ -0,0 +1,105 @@
+import os
+import time
+
+import pytest
+
+from conftest import write_model_dir
+from model_registry import LiveModels, ModelRegistry, RegistryWatcher
+from prediction_cache import PredictionCache
+from predictor import RockfallPredictor
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(str(tmp_path / 'registry'))
+
+
+@pytest.fixture
+def model_dirs(tmp_path, forests):
+    binary, multiclass, encoder = forests
+    return (write_model_dir(tmp_path / 'v1', binary, multiclass, encoder),
+            write_model_dir(tmp_path / 'v2', multiclass, multiclass, encoder))
+
+
+def live_models(**kwargs):
+    return LiveModels(lambda store: RockfallPredictor.from_store(store, cache=PredictionCache()),
+                      log=lambda *a: None, **kwargs)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_versions_are_content_addressed(registry, model_dirs):
+    first = registry.publish(model_dirs[0])
+    assert registry.publish(model_dirs[0], activate=False) == first
+    second = registry.publish(model_dirs[1], activate=False)
+    assert second != first and registry.current() == first
+    # v2 only repeats v1's multiclass forest and encoder, so nothing new is stored for it
+    assert len(os.listdir(os.path.join(registry.root, 'objects'))) == 3
+
+    registry.activate(second)
+    store = registry.store()
+    assert store.version == second and store.has_multiclass
+    with pytest.raises(KeyError):
+        registry.activate('0' * 12)
+    with pytest.raises(FileNotFoundError):
+        registry.publish(os.path.dirname(model_dirs[0]))
+
+
+def test_verify_detects_a_modified_artifact(registry, model_dirs):
+    version = registry.publish(model_dirs[0])
+    registry.verify(version)
+    path = os.path.join(registry.root, registry.manifest()['versions'][version]['artifacts']['multiclass']['path'])
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+    with pytest.raises(ValueError, match='multiclass'):
+        registry.verify(version)
+
+
+def test_requests_finish_on_the_version_they_acquired(registry, model_dirs):
+    live = live_models()
+    first, second = (registry.publish(d) for d in model_dirs)
+    assert live.install(registry.store(first))
+    served = live.acquire()
+    old_predictor = served.predictor
+
+    assert live.install(registry.store(second))
+    assert live.version == second and served.version == first
+    assert live.retired == [served] and old_predictor.cache is None
+    assert not live.install(registry.store(second))
+
+    live.release(served)
+    wait_until(lambda: not live.retired)
+
+
+def test_drain_gives_up_after_the_timeout(registry, model_dirs):
+    live = live_models(drain_timeout=0.05)
+    first, second = (registry.publish(d) for d in model_dirs)
+    live.install(registry.store(first))
+    live.acquire()
+    live.install(registry.store(second))
+    wait_until(lambda: not live.retired)
+
+
+def test_watcher_installs_new_versions_and_remembers_failures(registry, model_dirs):
+    live = live_models()
+    watcher = RegistryWatcher(registry, live, log=lambda *a: None)
+    assert watcher.check() is None
+    first = registry.publish(model_dirs[0])
+    assert watcher.check() == first
+
+    second = registry.publish(model_dirs[1])
+    artifact = registry.manifest()['versions'][second]['artifacts']['binary']['path']
+    with open(os.path.join(registry.root, artifact), 'ab') as f:
+        f.write(b'\0')
+    with pytest.raises(ValueError):
+        watcher.check()
+    assert watcher.failed[1] == second
+    # Same manifest: not re-hashed, the working version keeps serving
+    assert watcher.check() == first
+    registry.activate(first)
+    assert watcher.check() == first and watcher.failed is None
@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import model_store
+from conftest import ROOT, write_model_dir
+from model_store import BINARY_MODEL_FILE, ModelStore
+
+
+@pytest.fixture
+def model_dir(tmp_path, forests):
+    return write_model_dir(tmp_path / 'models', *forests)
+
+
+def test_nothing_loads_until_used(model_dir, query_frame, forests):
+    store = ModelStore.from_dir(model_dir)
+    assert store.has_binary and store.has_multiclass
+    assert store._objects == {}
+    packed = store.packed('binary')
+    np.testing.assert_allclose(packed.predict_proba(query_frame), forests[0].predict_proba(query_frame), atol=1e-12)
+    assert isinstance(packed.threshold, np.memmap)
+
+
+def test_fresh_sidecar_is_mapped_without_unpickling(model_dir):
+    ModelStore.from_dir(model_dir).export()
+    store = ModelStore.from_dir(model_dir)
+    assert store.packed('binary') is not None and store.packed('multiclass') is not None
+    assert 'binary' not in store._objects and 'multiclass' not in store._objects
+
+
+def test_changed_pickle_makes_the_sidecar_stale(model_dir, forests, query_frame):
+    ModelStore.from_dir(model_dir).export()
+    # Another model under the same file name: the sidecar's source signature no longer matches
+    write_model_dir(model_dir, forests[1])
+    store = ModelStore.from_dir(model_dir)
+    np.testing.assert_allclose(store.packed('binary').predict_proba(query_frame),
+                               forests[1].predict_proba(query_frame), atol=1e-12)
+
+
+def test_reload_picks_up_new_files_and_version(model_dir, forests):
+    store = ModelStore.from_dir(model_dir)
+    before = store.version
+    assert store.model('binary') is not None
+    write_model_dir(model_dir, forests[1])
+    assert store.reload() != before
+    assert store.model('binary').n_classes_ == forests[1].n_classes_
+
+
+def test_failed_loads_are_retried_after_the_interval(model_dir, monkeypatch):
+    store = ModelStore.from_dir(model_dir)
+    path = os.path.join(model_dir, BINARY_MODEL_FILE)
+    os.rename(path, path + '.moved')
+    assert store.model('binary') is None
+    os.rename(path + '.moved', path)
+    # Inside the retry interval the failure stands; past it the file is read again
+    assert store.model('binary') is None
+    monkeypatch.setattr(model_store, 'LOAD_RETRY_INTERVAL', 0.0)
+    assert store.model('binary') is not None
+
+
+def test_concurrent_exports_leave_one_complete_sidecar(model_dir):
+    script = ("import sys; sys.path.insert(0, sys.argv[1]); from model_store import ModelStore; "
+              "s = ModelStore.from_dir(sys.argv[2]); s._export_sidecar('binary'); "
+              "assert s.packed('binary') is not None")
+    workers = [subprocess.Popen([sys.executable, '-c', script, os.path.join(ROOT, 'models'), model_dir],
+                                stdout=subprocess.DEVNULL) for _ in range(4)]
+    assert [worker.wait(timeout=120) for worker in workers] == [0] * 4
+    packed_dir = os.path.join(model_dir, 'packed')
+    assert os.path.islink(os.path.join(packed_dir, 'binary'))
+    exports = [name for name in os.listdir(packed_dir) if name.startswith('.binary-')]
+    assert exports == [os.readlink(os.path.join(packed_dir, 'binary'))]
@@ -0,0 +1,71 @@
+import numpy as np
+
+import prediction_cache
+from conftest import write_model_dir
+from model_store import ModelStore
+from prediction_cache import PredictionCache
+from predictor import RockfallPredictor
+
+
+def test_rounding_shares_keys_and_folds_negative_zero():
+    cache = PredictionCache(decimals=2)
+    keys = cache.keys('binary', np.array([[1.0, -0.0], [1.004, 0.0], [1.01, 0.0]]))
+    assert keys[0] == keys[1]
+    assert keys[0] != keys[2]
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(prediction_cache.time, 'monotonic', lambda: now[0])
+    cache = PredictionCache(ttl=10.0)
+    cache.put_many(['a'], [1])
+    now[0] += 5
+    assert cache.get_many(['a']) == [1]
+    now[0] += 6
+    assert cache.get_many(['a']) == [None]
+    assert cache.stats['expired'] == 1 and len(cache) == 0
+
+
+def test_lru_eviction_keeps_recently_read_entries():
+    cache = PredictionCache(max_entries=2)
+    cache.put_many(['a', 'b'], [1, 2])
+    cache.get_many(['a'])
+    cache.put_many(['c'], [3])
+    assert cache.get_many(['a', 'b', 'c']) == [1, None, 3]
+    assert cache.stats['evictions'] == 1
+
+
+def test_bind_drops_entries_only_on_a_new_version():
+    cache = PredictionCache()
+    cache.bind('v1')
+    cache.put_many(['a'], [1])
+    cache.bind('v1')
+    assert cache.get_many(['a']) == [1]
+    cache.bind('v2')
+    assert len(cache) == 0
+    assert cache.snapshot()['invalidations'] == 1 and cache.snapshot()['version'] == 'v2'
+
+
+def test_predictor_misses_after_the_models_change(tmp_path, forests, query_frame):
+    binary, multiclass, encoder = forests
+    model_dir = write_model_dir(tmp_path / 'models', *forests)
+    store = ModelStore.from_dir(model_dir)
+    cache = PredictionCache()
+    predictor = RockfallPredictor.from_store(store, cache=cache)
+    rows = query_frame.to_numpy()[:20]
+
+    first = predictor.score_binary(rows)['probability']
+    assert cache.stats['hits'] == 0 and cache.stats['misses'] == 20
+    np.testing.assert_array_equal(predictor.score_binary(rows)['probability'], first)
+    assert cache.stats['hits'] == 20
+
+    # Same file names, different model: the reload bumps the version so nothing stale is served
+    write_model_dir(model_dir, multiclass)
+    old_version = store.version
+    store.reload()
+    assert store.version != old_version
+    swapped = predictor.score_binary(rows)
+    assert cache.stats['invalidations'] == 1 and cache.stats['misses'] == 40
+    np.testing.assert_allclose(predictor.score(rows)['binary']['probabilities'],
+                               multiclass.predict_proba(query_frame[:20]), atol=1e-12)
+    assert not np.array_equal(swapped['probability'], first)
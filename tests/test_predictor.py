@@ -0,0 +1,51 @@
+import numpy as np
+
+from conftest import make_readings
+from features import build_feature_matrix
+from predictor import PACKED_BATCH_LIMIT, RockfallPredictor, slice_scores
+
+
+def test_scores_match_sklearn(forests, query_frame):
+    binary, multiclass, encoder = forests
+    predictor = RockfallPredictor(binary, multiclass, encoder)
+    matrix = query_frame.to_numpy()[:PACKED_BATCH_LIMIT]
+    scores = predictor.score(matrix)
+
+    np.testing.assert_allclose(scores['binary']['probabilities'], binary.predict_proba(query_frame[:len(matrix)]),
+                               atol=1e-12)
+    np.testing.assert_array_equal(scores['binary']['prediction'], binary.predict(query_frame[:len(matrix)]))
+    expected = multiclass.predict(query_frame[:len(matrix)])
+    np.testing.assert_array_equal(scores['multiclass']['prediction_encoded'], expected)
+    np.testing.assert_array_equal(scores['multiclass']['prediction_label'], encoder.inverse_transform(expected))
+
+
+def test_large_batches_use_sklearn_with_the_same_result(forests, query_frame):
+    binary, multiclass, encoder = forests
+    matrix = np.vstack([query_frame.to_numpy()] * 2)
+    assert len(matrix) > PACKED_BATCH_LIMIT
+    packed = RockfallPredictor(binary, multiclass, encoder).score_binary(matrix)
+    unpacked = RockfallPredictor(binary, multiclass, encoder, use_packed=False).score_binary(matrix)
+    np.testing.assert_allclose(packed['probability'], unpacked['probability'], atol=1e-12)
+
+
+def test_score_readings_builds_features(forests):
+    binary, multiclass, encoder = forests
+    readings = make_readings(4, seed=9)
+    predictor = RockfallPredictor(binary, multiclass, encoder)
+    by_readings = predictor.score_readings(readings.to_dict('records'))
+    by_matrix = predictor.score(build_feature_matrix(readings))
+    np.testing.assert_array_equal(by_readings['binary']['probability'], by_matrix['binary']['probability'])
+
+
+def test_without_multiclass_model(forests, query_frame):
+    predictor = RockfallPredictor(forests[0])
+    assert predictor.available and not predictor.has_multiclass
+    assert predictor.score(query_frame.to_numpy()[:3])['multiclass'] is None
+
+
+def test_slice_scores():
+    scores = {'prediction': np.arange(5), 'probabilities': np.eye(5)}
+    sliced = slice_scores(scores, 1, 3)
+    np.testing.assert_array_equal(sliced['prediction'], [1, 2])
+    assert sliced['probabilities'].shape == (2, 5)
+    assert slice_scores(None, 0, 1) is None
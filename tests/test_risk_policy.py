@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pytest
+
+from risk_policy import UNKNOWN, PolicyFile, RiskPolicy
+
+CONFIG = {
+    'levels': ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL'],
+    'cuts': [0.1, 0.3, 0.4],
+    'recommendations': ['continue', 'monitor', 'evacuate?', 'evacuate'],
+    'colors': ['green', 'yellow', 'orange', 'red'],
+    'alert_level': 'HIGH',
+    'mines': {'MINE_7': {'cuts': [0.05, 0.2, 0.3], 'alert_level': 'CRITICAL'}},
+}
+
+
+def test_a_probability_at_a_cut_stays_in_the_lower_level():
+    policy = RiskPolicy(CONFIG)
+    result = policy.classify([0.0, 0.1, np.nextafter(0.1, 1), 0.3, 0.35, 0.4, 0.41, 1.0])
+    assert result['risk_level'].tolist() == ['LOW', 'LOW', 'MEDIUM', 'MEDIUM', 'HIGH', 'HIGH', 'CRITICAL',
+                                             'CRITICAL']
+    assert result['alert'].tolist() == [False, False, False, False, True, True, True, True]
+    assert result['color'][0] == 'green' and result['recommendation'][-1] == 'evacuate'
+
+
+def test_nan_is_unknown_and_never_alerts():
+    result = RiskPolicy(CONFIG).classify([np.nan, 0.9])
+    assert result['risk_level'].tolist() == [UNKNOWN, 'CRITICAL']
+    assert result['color'][0] == 'gray' and result['recommendation'][0] == ''
+    assert result['alert'].tolist() == [False, True]
+
+
+def test_mine_overrides_apply_per_row():
+    policy = RiskPolicy(CONFIG)
+    probs = [0.25, 0.25, 0.35, 0.35]
+    mines = ['MINE_1', 'MINE_7', 'MINE_1', 'MINE_7']
+    result = policy.classify(probs, mines)
+    assert result['risk_level'].tolist() == ['MEDIUM', 'HIGH', 'HIGH', 'CRITICAL']
+    # MINE_7 only alerts from CRITICAL, with the shared recommendations of that level
+    assert result['alert'].tolist() == [False, False, True, True]
+    assert result['recommendation'][3] == 'evacuate'
+    assert policy.classify([0.25], 'MINE_7')['risk_level'].tolist() == ['HIGH']
+    assert policy.classify([0.25], 'MINE_99')['risk_level'].tolist() == ['MEDIUM']
+
+
+@pytest.mark.parametrize('change', [
+    {'cuts': [0.3, 0.1, 0.4]},
+    {'cuts': [0.1, 0.3]},
+    {'levels': ['LOW', 'MEDIUM', 'HIGH', 'SEVERE']},
+    {'levels': ['LOW', 'LOW', 'HIGH', 'CRITICAL']},
+    {'alert_level': 'SEVERE'},
+    {'mines': {'MINE_7': {'levels': ['A', 'B']}}},
+])
+def test_invalid_configs_are_rejected(change):
+    with pytest.raises(ValueError):
+        RiskPolicy(dict(CONFIG, **change))
+
+
+def test_policy_file_keeps_the_old_policy_on_a_bad_edit(tmp_path):
+    path = tmp_path / 'policy.json'
+    path.write_text(json.dumps(CONFIG))
+    messages = []
+    policy_file = PolicyFile(str(path), check_interval=0.0, log=messages.append)
+    assert policy_file.current.classify([0.35])['risk_level'][0] == 'HIGH'
+
+    path.write_text(json.dumps(dict(CONFIG, cuts=[0.1, 0.3, 0.34])))
+    assert policy_file.current.classify([0.35])['risk_level'][0] == 'CRITICAL'
+
+    path.write_text('{"levels": [')
+    assert policy_file.current.classify([0.35])['risk_level'][0] == 'CRITICAL'
+    assert 'Keeping the current risk policy' in messages[-1]
+    # The bad version is reported once, not on every check
+    policy_file.current
+    assert sum('Keeping' in m for m in messages) == 1
+    with pytest.raises(ValueError):
+        policy_file.reload()
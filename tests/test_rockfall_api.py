@@ -0,0 +1,102 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import make_readings
+from features import build_feature_frame
+from risk_policy import RiskPolicy
+
+REMOTE = {'REMOTE_ADDR': '10.1.2.3'}
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+
+def batch(n_rows, seed=11):
+    readings = make_readings(n_rows, seed=seed)
+    return readings, readings.to_dict('records')
+
+
+def test_batch_scores_every_reading_in_order(client, api, forests):
+    readings, body = batch(5)
+    response = client.post('/predict/batch', json=body)
+    assert response.status_code == 200
+    assert response.headers['X-Model-Version'] == api.live_models.version
+    payload = response.get_json()
+    assert payload['count'] == 5
+
+    frame = build_feature_frame(readings)
+    probs = forests[0].predict_proba(frame)[:, 1]
+    expected_levels = RiskPolicy.load(api.risk_policy.path).classify(probs)['risk_level']
+    results = [p['binary_result'] for p in payload['predictions']]
+    assert [r['prediction'] for r in results] == forests[0].predict(frame).tolist()
+    assert [r['confidence'] for r in results] == np.round(probs, 2).tolist()
+    assert [r['risk_level'] for r in results] == expected_levels.tolist()
+    labels = forests[2].inverse_transform(forests[1].predict(frame))
+    assert [p['multiclass_result']['prediction_label'] for p in payload['predictions']] == labels.tolist()
+
+
+def test_csv_and_wrapped_bodies_match_a_json_array(client):
+    readings, body = batch(4)
+    as_array = client.post('/predict/batch', json=body).get_json()['predictions']
+    wrapped = client.post('/predict/batch', json={'readings': body}).get_json()['predictions']
+    as_csv = client.post('/predict/batch', data=readings.to_csv(index=False), content_type='text/csv')
+    assert wrapped == as_array and as_csv.get_json()['predictions'] == as_array
+
+
+def test_bad_batches_are_rejected(client, api, monkeypatch):
+    _, body = batch(3)
+    assert client.post('/predict/batch', json=[]).status_code == 400
+    assert client.post('/predict/batch', json={'rows': body}).status_code == 400
+    missing = [dict(body[0]), body[1]]
+    del missing[0]['rainfall_mm']
+    response = client.post('/predict/batch', json=missing)
+    assert response.status_code == 400 and 'rainfall_mm' in response.get_json()['details']
+    assert client.post('/predict/batch?format=xml', json=body).status_code == 406
+    monkeypatch.setattr(api, 'MAX_BATCH_SIZE', 2)
+    assert client.post('/predict/batch', json=body).status_code == 413
+
+
+def test_compact_format_sends_columns(client):
+    _, body = batch(3)
+    response = client.post('/predict/batch?format=compact&fields=risk_level,binary_confidence', json=body)
+    assert response.mimetype == 'application/vnd.rockfall.compact+json'
+    payload = json.loads(response.data)
+    assert list(payload['columns']) == ['risk_level', 'binary_confidence'] and payload['count'] == 3
+    assert client.post('/predict/batch?format=compact&fields=nope', json=body).status_code == 400
+
+
+def test_repeated_readings_are_served_from_the_cache(client, api):
+    _, body = batch(6, seed=12)
+    client.post('/predict/batch', json=body)
+    hits = api.prediction_cache.stats['hits']
+    client.post('/predict/batch', json=body)
+    # Binary and multiclass lookups for every reading
+    assert api.prediction_cache.stats['hits'] - hits == 12
+
+
+def test_admin_routes_are_local_only_without_a_token(client):
+    assert client.post('/debug/profiler', json={'enabled': False}, environ_base=REMOTE).status_code == 403
+    assert client.post('/policy/reload', environ_base=REMOTE).status_code == 403
+    assert client.post('/models/reload', environ_base=REMOTE).status_code == 403
+    assert client.get('/debug/profiler', environ_base=REMOTE).status_code == 200
+    assert client.post('/policy/reload').status_code == 200
+
+
+def test_admin_token_is_required_when_configured(client, api, monkeypatch):
+    monkeypatch.setattr(api, 'ADMIN_TOKEN', 'secret')
+    assert client.post('/models/reload').status_code == 401
+    assert client.post('/models/reload', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.post('/models/reload', headers={'Authorization': 'Bearer secret'}, environ_base=REMOTE)
+    assert response.status_code == 200 and response.get_json()['model_version'] == api.live_models.version
+
+
+def test_profiler_interval_floor(client, api):
+    assert client.post('/debug/profiler', json={'interval_ms': 0.1}).status_code == 400
+    assert not api.profiler.enabled
+    response = client.post('/debug/profiler', json={'interval_ms': 5, 'slow_ms': 1000})
+    assert response.status_code == 200 and response.get_json()['enabled']
+    assert client.post('/debug/profiler', json={'enabled': False}).get_json()['enabled'] is False
@@ -0,0 +1,74 @@
+import asyncio
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from starlette.testclient import TestClient
+
+from conftest import make_readings
+
+
+@pytest.fixture(scope='module')
+def asgi(api):
+    return importlib.import_module('rockfall_asgi')
+
+
+@pytest.fixture
+def client(asgi):
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+def test_batch_matches_the_flask_app(client, api):
+    body = make_readings(4, seed=21).to_dict('records')
+    response = client.post('/predict/batch', json=body)
+    assert response.status_code == 200
+    assert response.headers['x-model-version'] == api.live_models.version
+    flask_predictions = api.app.test_client().post('/predict/batch', json=body).get_json()['predictions']
+    assert response.json()['predictions'] == flask_predictions
+
+    csv_body = make_readings(4, seed=21).to_csv(index=False)
+    as_csv = client.post('/predict/batch', content=csv_body, headers={'content-type': 'text/csv'})
+    assert as_csv.json()['predictions'] == flask_predictions
+
+
+def test_concurrent_requests_share_batches(client, asgi):
+    readings = make_readings(16, seed=22).to_dict('records')
+    rows = asgi.batcher.rows
+
+    def post(reading):
+        return client.post('/predict/batch', json=[reading]).json()['predictions'][0]
+
+    with ThreadPoolExecutor(8) as pool:
+        concurrent = list(pool.map(post, readings))
+    assert asgi.batcher.rows - rows == 16
+    assert concurrent == client.post('/predict/batch', json=readings).json()['predictions']
+
+
+def test_feature_building_runs_off_the_event_loop(client, api, monkeypatch):
+    threads = []
+    calculate_features = api.calculate_features
+
+    def recording(*args):
+        try:
+            asyncio.get_running_loop()
+            threads.append('event loop')
+        except RuntimeError:
+            threads.append(threading.current_thread().name)
+        return calculate_features(*args)
+
+    monkeypatch.setattr(api, 'calculate_features', recording)
+    assert client.get('/simulate-and-predict').status_code == 200
+    assert client.post('/predict/batch', json=make_readings(2).to_dict('records')).status_code == 200
+    assert len(threads) == 2 and 'event loop' not in threads
+
+
+def test_errors(client, api, monkeypatch):
+    assert client.post('/predict/batch', json=[]).status_code == 400
+    assert client.post('/predict/batch', content=b'not json').status_code == 400
+    assert client.post('/predict/batch?format=xml', json=[{}]).status_code == 406
+    assert client.get('/simulate-and-predict?format=compact').status_code == 406
+    monkeypatch.setattr(api, 'MAX_BATCH_SIZE', 1)
+    assert client.post('/predict/batch', json=make_readings(2).to_dict('records')).status_code == 413
+    assert 'rockfall_requests_total{endpoint="/predict/batch",status="413"}' in client.get('/metrics').text
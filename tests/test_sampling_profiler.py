@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from sampling_profiler import MIN_INTERVAL, SamplingProfiler
+
+
+def samplers():
+    return [t for t in threading.enumerate() if t.name == 'sampling-profiler']
+
+
+def slow_request_body(seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_nothing_is_recorded_while_stopped():
+    profiler = SamplingProfiler()
+    assert profiler.begin('GET /') is None
+    profiler.end(None, 10.0)
+    assert profiler.status()['enabled'] is False and len(profiler.traces) == 0
+
+
+def test_settings_are_validated():
+    profiler = SamplingProfiler()
+    with pytest.raises(ValueError):
+        profiler.start(interval=MIN_INTERVAL / 2)
+    with pytest.raises(ValueError):
+        profiler.start(slow_threshold=-1)
+    with pytest.raises(ValueError):
+        profiler.start(interval=float('nan'))
+    assert not profiler.enabled and not samplers()
+
+
+def test_slow_requests_keep_their_stacks():
+    profiler = SamplingProfiler()
+    profiler.start(interval=MIN_INTERVAL, slow_threshold=0.05)
+    try:
+        token = profiler.begin('POST /predict')
+        slow_request_body(0.1)
+        profiler.end(token, 0.1)
+        fast = profiler.begin('GET /health')
+        profiler.end(fast, 0.001)
+    finally:
+        profiler.stop()
+    assert len(profiler.traces) == 1
+    trace = profiler.traces[0]
+    assert trace['label'] == 'POST /predict' and trace['samples'] > 0
+    assert any('slow_request_body' in entry['stack'] for entry in trace['stacks'])
+    assert profiler.status()['slow_threshold_ms'] == 50
+
+
+def test_restarts_never_leave_two_samplers_running():
+    profiler = SamplingProfiler()
+    for _ in range(20):
+        profiler.start(interval=MIN_INTERVAL)
+        profiler.start()
+        assert len(samplers()) == 1
+        profiler.stop()
+    assert not profiler.enabled and not samplers()
+
+
+def test_racing_start_and_stop_leave_no_sampler_behind():
+    profiler = SamplingProfiler(interval=MIN_INTERVAL)
+
+    def toggle():
+        for _ in range(50):
+            profiler.start()
+            profiler.stop()
+
+    threads = [threading.Thread(target=toggle) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.stop()
+    assert not profiler.enabled and not samplers()
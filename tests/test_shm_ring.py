@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import tempfile
+import uuid
+
+import numpy as np
+import pytest
+
+from features import FEATURES_BASE
+from shm_ring import RECORD, ScoredRing, scored_rows
+
+
+@pytest.fixture
+def ring_name():
+    name = f'rockfall_test_{uuid.uuid4().hex[:12]}'
+    yield name
+    try:
+        ScoredRing.unlink(name)
+    except FileNotFoundError:
+        pass
+    lock_path = os.path.join(tempfile.gettempdir(), f'{name}.lock')
+    if os.path.exists(lock_path):
+        os.remove(lock_path)
+
+
+def numbered(start, n):
+    """Rows whose every numeric field holds the same value, so a row mixing two writes is visible."""
+    rows = np.zeros(n, dtype=RECORD)
+    values = np.arange(start, start + n, dtype=np.float64)
+    for name in ['timestamp', 'binary_confidence', 'mc_confidence', 'scored_at'] + FEATURES_BASE:
+        rows[name] = values
+    rows['mc_probabilities'] = values[:, None]
+    return rows
+
+
+def consistent(rows):
+    fields = np.column_stack([rows[name] for name in ['binary_confidence', 'mc_confidence', 'scored_at']
+                              + FEATURES_BASE] + [rows['mc_probabilities']])
+    return bool((fields == rows['timestamp'][:, None]).all())
+
+
+def test_cursor_reads_only_new_records_and_skips_overwritten_ones(ring_name):
+    ring = ScoredRing.open(ring_name, capacity=4)
+    ring.write(numbered(0, 3))
+    rows, cursor = ring.read()
+    assert rows['timestamp'].tolist() == [0, 1, 2] and cursor == 3
+
+    ring.write(numbered(3, 6))
+    rows, cursor = ring.read(cursor)
+    # Records 3 and 4 were overwritten before this read: only the 4 still in the ring come back
+    assert rows['timestamp'].tolist() == [5, 6, 7, 8] and cursor == 9
+    assert ring.read(cursor)[0].size == 0
+    assert ring.read(limit=2)[0]['timestamp'].tolist() == [7, 8]
+    # A batch larger than the ring keeps its newest rows and still counts every one
+    ring.write(numbered(9, 10))
+    assert ring.head == 19 and ring.latest()['timestamp'] == 18
+    ring.close()
+
+
+def test_attached_reader_sees_writes_but_cannot_write(ring_name):
+    writer = ScoredRing.open(ring_name, capacity=8)
+    reader = ScoredRing.attach(ring_name)
+    writer.write(numbered(0, 2))
+    assert reader.capacity == 8 and reader.read()[0]['timestamp'].tolist() == [0, 1]
+    with pytest.raises(ValueError, match='read-only'):
+        reader.write(numbered(2, 1))
+    # A cursor from before the ring was recreated resumes from the new ring's head
+    assert reader.read(cursor=100)[0].size == 0
+    reader.close()
+    writer.close()
+
+
+def test_scored_rows_round_trip_to_dashboard_records(ring_name, query_frame):
+    ring = ScoredRing.open(ring_name, capacity=8)
+    binary = {'prediction': np.array([0, 1]), 'probability': np.array([0.2, 0.7])}
+    multiclass = {'prediction_label': np.array(['Low', 'High']), 'confidence': np.array([0.6, 0.8]),
+                  'probabilities': np.array([[0.6, 0.3, 0.1], [0.1, 0.1, 0.8]])}
+    ring.write(scored_rows(query_frame.to_numpy()[:2], binary, multiclass, risk_levels=['LOW', 'HIGH'],
+                           mine_ids=['MINE_1', 'MINE_2'], timestamps=['2024-01-01T00:00:00', None]))
+    records, _ = ring.records()
+    assert records[0]['timestamp'].startswith('2024-01-01')
+    assert records[1]['sensor_data']['mine_id'] == 'MINE_2'
+    assert records[1]['sensor_data']['rainfall_mm'] == pytest.approx(query_frame['rainfall_mm'].iloc[1])
+    assert records[1]['prediction']['binary_result']['risk_level'] == 'HIGH'
+    assert records[1]['prediction']['multiclass_result']['prediction_label'] == 'High'
+    ring.close()
+
+
+def _write_continuously(name, batches):
+    ring = ScoredRing.open(name)
+    written = 0
+    for i in range(batches):
+        size = 1 + i % 5
+        ring.write(numbered(written, size))
+        written += size
+    ring.close()
+
+
+def test_concurrent_reader_never_sees_a_torn_record(ring_name):
+    ring = ScoredRing.open(ring_name, capacity=16)
+    writer = multiprocessing.get_context('fork').Process(target=_write_continuously, args=(ring_name, 20000))
+    writer.start()
+    reader = ScoredRing.attach(ring_name)
+    checked = 0
+    while writer.is_alive() or checked == 0:
+        rows, _ = reader.read()
+        assert consistent(rows)
+        assert (np.diff(rows['timestamp']) > 0).all()
+        checked += len(rows)
+    writer.join()
+    assert writer.exitcode == 0 and checked > 0
+    assert reader.latest()['timestamp'] == reader.head - 1
+    reader.close()
+    ring.close()
@@ -0,0 +1,49 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from stream_generation import (BINARY_THRESHOLD, RISK_WEIGHTS, chunk_sizes, generate_chunk, generate_dataset,
+                               iter_parts)
+
+
+def test_chunk_sizes_cover_every_row():
+    assert chunk_sizes(10, 4) == [4, 4, 2]
+    assert chunk_sizes(8, 4) == [4, 4]
+    assert chunk_sizes(3, 10) == [3]
+
+
+def test_a_chunk_depends_only_on_seed_and_index():
+    pd.testing.assert_frame_equal(generate_chunk(3, 100, seed=7), generate_chunk(3, 100, seed=7))
+    assert not generate_chunk(3, 100, seed=7).equals(generate_chunk(4, 100, seed=7))
+    assert not generate_chunk(3, 100, seed=7).equals(generate_chunk(3, 100, seed=8))
+    chunk = generate_chunk(0, 50, seed=7)
+    assert set(RISK_WEIGHTS) <= set(chunk.columns)
+    assert chunk['season_encoded'].between(0, 3).all()
+
+
+def test_parts_are_labelled_with_dataset_wide_maxima(tmp_path):
+    manifest = generate_dataset(250, str(tmp_path / 'a'), chunk_size=100, seed=7, workers=2, fmt='csv')
+    assert manifest['rows'] == 250 and manifest['chunks'] == 3
+    with open(tmp_path / 'a' / '_manifest.json') as f:
+        assert json.load(f)['rows'] == 250
+
+    data = pd.concat(iter_parts(str(tmp_path / 'a')), ignore_index=True)
+    assert len(data) == 250
+    for name in RISK_WEIGHTS:
+        # CSV round trip: equal up to the last printed digit
+        assert np.isclose(manifest['normalization_maxima'][name], data[name].max(), rtol=1e-12)
+    assert ((data['risk_score'] > BINARY_THRESHOLD) == (data['rockfall_binary'] == 1)).all()
+    assert data['risk_level'].notna().all()
+    assert sum(manifest['risk_level'].values()) == 250
+    assert manifest['rockfall_binary']['1'] == int(data['rockfall_binary'].sum())
+
+
+def test_reruns_write_identical_parts(tmp_path):
+    generate_dataset(150, str(tmp_path / 'a'), chunk_size=50, seed=7, workers=1, fmt='csv')
+    generate_dataset(150, str(tmp_path / 'b'), chunk_size=50, seed=7, workers=3, fmt='csv')
+    for a, b in zip(iter_parts(str(tmp_path / 'a')), iter_parts(str(tmp_path / 'b'))):
+        pd.testing.assert_frame_equal(a, b)
+    assert not list(tmp_path.glob('*/*.tmp'))
+    columns = next(iter_parts(str(tmp_path / 'a'), columns=['rainfall_mm', 'risk_level']))
+    assert list(columns.columns) == ['rainfall_mm', 'risk_level'] and np.isfinite(columns['rainfall_mm']).all()
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_readings
+from features import FEATURES_TEMPORAL, build_feature_matrix
+from temporal_features import DAY, HOUR, Ewma, TemporalFeatureEngine, WindowMax, WindowSum, add_temporal_features
+
+T0 = 1_700_000_000.0
+RAIN_24H, RAIN_7D, VIBRATION_MAX = range(3)
+
+
+def readings(rainfall, hours, mine_id='MINE_1', **extra):
+    df = make_readings(len(rainfall), seed=3)
+    df['rainfall_mm'] = rainfall
+    df['timestamp'] = [T0 + h * HOUR for h in hours]
+    df['mine_id'] = mine_id
+    for name, values in extra.items():
+        df[name] = values
+    return df
+
+
+def temporal(engine, df, **kwargs):
+    return engine.extend(df, build_feature_matrix(df), **kwargs)[:, -len(FEATURES_TEMPORAL):]
+
+
+def test_window_sum_drops_readings_a_full_window_old():
+    window = WindowSum(DAY)
+    assert window.add(0, 1.0) == 1.0
+    assert window.add(12 * HOUR, 2.0) == 3.0
+    assert window.add(DAY, 4.0) == 6.0
+    assert window.add(40 * HOUR, 0.5) == 4.5
+
+
+def test_window_max_forgets_expired_peaks():
+    window = WindowMax(DAY)
+    assert window.add(0, 9.0) == 9.0
+    assert window.add(HOUR, 3.0) == 9.0
+    assert window.add(DAY + HOUR / 2, 1.0) == 3.0
+    assert window.add(2 * DAY + HOUR, 2.0) == 2.0
+
+
+def test_ewma_moves_halfway_per_halflife():
+    ewma = Ewma(DAY)
+    assert ewma.add(0, 10.0) == 10.0
+    assert ewma.add(DAY, 20.0) == pytest.approx(15.0)
+    assert ewma.add(DAY, 25.0) == pytest.approx(15.0)
+
+
+def test_streams_accumulate_independently():
+    engine = TemporalFeatureEngine()
+    a = temporal(engine, readings([1.0, 2.0, 4.0], [0, 10, 30]))
+    b = temporal(engine, readings([8.0], [31], mine_id='MINE_2'))
+    assert a[:, RAIN_24H].tolist() == [1.0, 3.0, 6.0]
+    assert a[:, RAIN_7D].tolist() == [1.0, 3.0, 7.0]
+    assert b[0, RAIN_7D] == 8.0
+    assert len(engine) == 2
+    # The route's mine_id overrides the readings' own
+    c = temporal(engine, readings([1.0], [32], mine_id='MINE_2'), mine_id='MINE_1')
+    assert c[0, RAIN_7D] == 8.0
+
+
+def test_anonymous_readings_have_no_history():
+    engine = TemporalFeatureEngine()
+    df = readings([5.0, 6.0], [0, 1], mine_id=None)
+    out = temporal(engine, df)
+    assert out[:, RAIN_24H].tolist() == [5.0, 6.0] and out[:, RAIN_7D].tolist() == [5.0, 6.0]
+    np.testing.assert_array_equal(out[:, VIBRATION_MAX], df['vibration_intensity'])
+    assert len(engine) == 0
+
+
+def test_late_readings_do_not_move_the_window_back():
+    engine = TemporalFeatureEngine()
+    out = temporal(engine, readings([1.0, 2.0, 4.0], [30, 0, 31]))
+    # The reading stamped 30 hours early is counted at the stream's time, so it stays in the 24h sum
+    assert out[:, RAIN_24H].tolist() == [1.0, 3.0, 7.0]
+
+
+def test_offline_replay_matches_serving_in_time_order():
+    df = readings([1.0, 2.0, 4.0, 8.0], [0, 48, 10, 30], mine_id=['MINE_1', 'MINE_1', 'MINE_2', 'MINE_1'])
+    offline = add_temporal_features(df)
+    engine = TemporalFeatureEngine()
+    ordered = df.sort_values('timestamp')
+    served = temporal(engine, ordered)
+    np.testing.assert_array_equal(offline[ordered.index.to_numpy()], served)
+    assert offline[:, RAIN_24H].tolist() == [1.0, 10.0, 4.0, 8.0]
+
+
+def test_without_timestamps_every_row_is_instantaneous():
+    df = make_readings(5, seed=4)
+    out = add_temporal_features(df)
+    np.testing.assert_array_equal(out[:, RAIN_24H], df['rainfall_mm'])
+    np.testing.assert_array_equal(out[:, RAIN_7D], df['rainfall_mm'])
+    assert out.shape == (5, len(FEATURES_TEMPORAL))
+    assert not pd.isna(out).any()
@@ -0,0 +1,69 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+from sklearn.metrics import accuracy_score
+from sklearn.neighbors import KNeighborsClassifier
+
+import training_harness
+from conftest import risk_labels
+from dataset_store import DatasetStore, write_dataset_store
+from training_harness import SharedArrays, train_grid
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory, training_frame):
+    rows = np.random.default_rng(0).permutation(len(training_frame))
+    y = risk_labels(training_frame)
+    path = tmp_path_factory.mktemp('harness') / 'store'
+    write_dataset_store(path, training_frame, {'rockfall_binary': (y == 2).astype(int), 'risk_level': y},
+                        {'binary_train': rows[:450], 'binary_test': rows[450:],
+                         'multiclass_train': rows[150:], 'multiclass_test': rows[:150]})
+    return DatasetStore(str(path))
+
+
+def test_shared_arrays_round_trip_and_unlink():
+    array = np.arange(12, dtype=np.float64).reshape(3, 4)
+    shared = SharedArrays({'x': array[:, 1:]})
+    name, shape, dtype = shared.specs['x']
+    block = shared_memory.SharedMemory(name=name)
+    np.testing.assert_array_equal(np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf), array[:, 1:])
+    block.close()
+    shared.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_grid_fits_every_model_and_task(store):
+    results, models = train_grid(store, max_workers=2, log=lambda *a: None)
+    assert len(results) == 6 and (results['status'] == 'ok').all()
+    assert set(models) == {(name, task) for name in training_harness.MODEL_NAMES for task in ('binary', 'multiclass')}
+    assert results.loc[results['task'] == 'binary', 'auc'].notna().all()
+    assert results.loc[results['task'] == 'multiclass', 'auc'].isna().all()
+    assert (results.loc[results['task'] == 'binary', 'n_test'] == 150).all()
+
+    # Scaled models see the standardised splits, forests the raw named columns
+    knn = KNeighborsClassifier(n_neighbors=7).fit(store.matrix('multiclass_train', scaled=True),
+                                                  store.target('risk_level', 'multiclass_train'))
+    expected = accuracy_score(store.target('risk_level', 'multiclass_test'),
+                              knn.predict(store.matrix('multiclass_test', scaled=True)))
+    row = results[(results['model'] == 'K-Nearest Neighbors') & (results['task'] == 'multiclass')].iloc[0]
+    assert row['accuracy'] == pytest.approx(expected)
+    assert list(models['Random Forest', 'binary'].feature_names_in_) == store.feature_columns
+
+
+def test_a_failing_pair_is_reported_not_raised(store, monkeypatch):
+    build_model = training_harness.build_model
+
+    def broken_knn(name, task):
+        if name == 'K-Nearest Neighbors':
+            raise RuntimeError('no neighbours today')
+        return build_model(name, task)
+
+    monkeypatch.setattr(training_harness, 'build_model', broken_knn)
+    results, models = train_grid(store, model_names=['K-Nearest Neighbors', 'Logistic Regression'],
+                                 tasks=('binary',), max_workers=2, log=lambda *a: None)
+    assert results.set_index('model')['status'].to_dict() == {'K-Nearest Neighbors': 'failed',
+                                                              'Logistic Regression': 'ok'}
+    assert 'no neighbours today' in results.set_index('model').loc['K-Nearest Neighbors', 'error']
+    assert list(models) == [('Logistic Regression', 'binary')]
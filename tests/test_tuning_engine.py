@@ -0,0 +1,58 @@
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+
+from conftest import risk_labels
+from tuning_engine import FoldCache, TuningTask, _resources, dataset_fingerprint, tune_tasks
+
+GRID = {'max_depth': [1, 2, 4, 8], 'min_samples_leaf': [1, 20]}
+
+
+def test_resources_grow_by_the_factor_up_to_the_full_folds():
+    # 9 candidates: 9 then 3 survivors, one round each, before the winner is kept
+    assert _resources(9, 900, 20, 3) == [300, 900]
+    assert _resources(1, 900, 20, 3) == [900]
+    assert _resources(27, 100, 20, 3) == [20, 33, 100]
+
+
+def test_fingerprint_covers_values_columns_and_targets(training_frame):
+    y = risk_labels(training_frame)
+    base = dataset_fingerprint(training_frame, y)
+    assert dataset_fingerprint(training_frame.copy(), y.copy()) == base
+    assert dataset_fingerprint(training_frame, y[::-1]) != base
+    assert dataset_fingerprint(training_frame.rename(columns={'rainfall_mm': 'rain'}), y) != base
+    assert dataset_fingerprint(training_frame.to_numpy(), y) != base
+
+
+def test_fold_cache_round_trip_and_corrupt_entries(tmp_path):
+    cache = FoldCache(str(tmp_path))
+    key = FoldCache.key(params={'b': 1, 'a': 2}, fold=0)
+    assert key == FoldCache.key(fold=0, params={'a': 2, 'b': 1})
+    assert cache.get(key) is None
+    cache.put(key, {'score': 0.5, 'fit_time': 0.1})
+    assert cache.get(key) == {'score': 0.5, 'fit_time': 0.1}
+    with open(cache._path(key), 'w') as f:
+        f.write('{"score": ')
+    assert cache.get(key) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    FoldCache(None).put(key, {'score': 1.0})
+
+
+def test_rerun_is_served_from_the_fold_cache(tmp_path, training_frame):
+    y = risk_labels(training_frame)
+    tasks = [TuningTask('multiclass', training_frame, y), TuningTask('binary', training_frame, (y == 2).astype(int))]
+    kwargs = dict(estimator_cls=DecisionTreeClassifier, base_params={'random_state': 0}, cv=3,
+                  cache_dir=str(tmp_path / 'cache'), max_workers=2, log=lambda *a: None)
+    first = tune_tasks(tasks, GRID, **kwargs)
+    second = tune_tasks(tasks, GRID, **kwargs)
+    for name in ('multiclass', 'binary'):
+        assert first[name]['best_params'] == second[name]['best_params']
+        assert first[name]['best_score'] == second[name]['best_score']
+        assert (first[name]['results']['cached_folds'] == 0).all()
+        assert (second[name]['results']['cached_folds'] == 3).all()
+        # 8 candidates, then the best 3 of them on the full training folds
+        table = first[name]['results']
+        assert table.groupby('round').size().tolist() == [8, 3]
+        assert table.groupby('round')['resource'].first().tolist() == [133, 400]
+        best = second[name]['best_estimator']
+        assert best.get_params()['max_depth'] == second[name]['best_params']['max_depth']
+        assert best.predict(training_frame).shape == (600,)
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from upstream_client import UpstreamClient, UpstreamUnavailable
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    """Stands in for requests.Session: counts calls, can be slowed down or made to fail."""
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.error = None
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return FakeResponse({'n': self.calls})
+
+
+def client_with(session, **kwargs):
+    client = UpstreamClient('http://api', **kwargs)
+    client.session = session
+    return client
+
+
+def test_fresh_copy_is_served_from_cache():
+    session = FakeSession()
+    client = client_with(session, ttl=60)
+    assert client.get_latest() == ({'n': 1}, 'miss')
+    assert client.get_latest() == ({'n': 1}, 'hit')
+    assert session.calls == 1
+
+
+def test_concurrent_misses_share_one_upstream_call():
+    session = FakeSession(delay=0.1)
+    client = client_with(session, ttl=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.get_latest()[0])) for _ in range(8)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert session.calls == 1 and results == [{'n': 1}] * 8
+
+
+def test_expired_copy_is_served_stale_while_one_refresh_runs():
+    session = FakeSession(delay=0.05)
+    client = client_with(session, ttl=0.01, stale_ttl=60)
+    client.get_latest()
+    time.sleep(0.02)
+    assert client.get_latest() == ({'n': 1}, 'stale')
+    assert client.get_latest()[1] == 'stale'
+    time.sleep(0.2)
+    assert session.calls == 2
+    assert client.get_latest()[0] == {'n': 2}
+
+
+def test_upstream_failure_with_nothing_cached_raises():
+    session = FakeSession()
+    session.error = ConnectionError('refused')
+    client = client_with(session, ttl=60)
+    with pytest.raises(UpstreamUnavailable, match='refused'):
+        client.get_latest()
+    # Within the ttl the failure is shared rather than retried
+    with pytest.raises(UpstreamUnavailable):
+        client.get_latest()
+    assert session.calls == 1
@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+import wire_format
+from wire_format import (ARROW, COMPACT_JSON, MSGPACK, dumps, encode_columns, negotiate, parse_fields, project,
+                         select_columns)
+
+try:
+    import msgpack
+    import pyarrow as pa
+except ImportError:
+    msgpack = pa = None
+
+needs_encoders = pytest.mark.skipif(msgpack is None or pa is None, reason='msgpack and pyarrow are optional')
+
+COLUMNS = {
+    'binary_probability': np.array([0.25, 0.75], dtype=np.float32),
+    'risk_level': np.array(['LOW', 'HIGH'], dtype=object),
+    'mc_probabilities': np.array([[0.5, 0.25, 0.25], [0.125, 0.125, 0.75]], dtype=np.float32),
+}
+META = {'count': 2, 'model_version': 'abc123'}
+
+
+@needs_encoders
+def test_format_param_beats_accept_and_q_values_rank():
+    assert negotiate('MSGPACK', accept=ARROW) == 'msgpack'
+    assert negotiate(accept=f'{MSGPACK};q=0.5, {ARROW}') == 'arrow'
+    assert negotiate(accept=f'text/html, {COMPACT_JSON};q=0.9, {MSGPACK};q=0.9') == 'compact'
+    assert negotiate(accept=f'{ARROW};q=0') == 'json'
+    assert negotiate(accept='application/x-msgpack') == 'msgpack'
+    # An endpoint that only answers JSON ignores the Accept header but refuses an explicit format
+    assert negotiate(accept=ARROW, allowed=('json',)) == 'json'
+    with pytest.raises(ValueError, match='available: json'):
+        negotiate('arrow', allowed=('json',))
+    with pytest.raises(ValueError):
+        negotiate('xml')
+
+
+@needs_encoders
+def test_missing_encoders_are_not_offered(monkeypatch):
+    monkeypatch.setattr(wire_format, 'pa', None)
+    assert 'arrow' not in wire_format.available_formats()
+    assert negotiate(accept=f'{ARROW}, {MSGPACK};q=0.5') == 'msgpack'
+    with pytest.raises(ValueError):
+        negotiate('arrow')
+
+
+def test_field_projection():
+    payload = {'count': 2, 'predictions': [{'binary_result': {'risk_level': 'LOW', 'confidence': 0.1}, 'extra': 1},
+                                           {'binary_result': {'risk_level': 'HIGH', 'confidence': 0.9}}]}
+    fields = parse_fields(' count, predictions.binary_result.risk_level ,missing.path,')
+    assert project(payload, fields) == {'count': 2, 'predictions': [{'binary_result': {'risk_level': 'LOW'}},
+                                                                    {'binary_result': {'risk_level': 'HIGH'}}]}
+    assert parse_fields('') is None and parse_fields(' , ') is None
+    assert project(payload, ['count', 'count.value']) == {'count': 2}
+
+
+def test_select_columns():
+    assert list(select_columns(COLUMNS, None)) == list(COLUMNS)
+    assert list(select_columns(COLUMNS, None, default_fields={'risk_level'})) == ['risk_level']
+    assert list(select_columns(COLUMNS, ['risk_level', 'binary_probability'])) == ['risk_level',
+                                                                                   'binary_probability']
+    with pytest.raises(ValueError, match='nope'):
+        select_columns(COLUMNS, ['nope'])
+
+
+def test_numpy_values_serialise_like_their_python_equivalents():
+    body = {'a': np.float64(0.5), 'b': np.arange(3), 'c': np.int8(-1), 'z': 1}
+    expected = {'a': 0.5, 'b': [0, 1, 2], 'c': -1, 'z': 1}
+    assert json.loads(dumps(body)) == expected
+    assert dumps({'z': 1, 'a': 2}, sort_keys=True) == b'{"a":2,"z":1}'
+
+
+@needs_encoders
+def test_compact_formats_round_trip():
+    compact, media_type = encode_columns('compact', COLUMNS, META)
+    assert media_type == COMPACT_JSON
+    decoded = json.loads(compact)
+    assert decoded['count'] == 2 and decoded['columns']['risk_level'] == ['LOW', 'HIGH']
+    assert decoded['columns']['mc_probabilities'][1] == [0.125, 0.125, 0.75]
+
+    packed, media_type = encode_columns('msgpack', COLUMNS, META)
+    assert media_type == MSGPACK
+    assert msgpack.unpackb(packed) == dict(META, columns={name: values.tolist() for name, values in COLUMNS.items()})
+
+    arrow, media_type = encode_columns('arrow', COLUMNS, META)
+    assert media_type == ARROW
+    table = pa.ipc.open_stream(arrow).read_all()
+    assert {key.decode(): json.loads(value) for key, value in table.schema.metadata.items()} == META
+    assert pa.types.is_dictionary(table.schema.field('risk_level').type)
+    assert table.column('risk_level').to_pylist() == ['LOW', 'HIGH']
+    assert table.column('mc_probabilities').to_pylist() == COLUMNS['mc_probabilities'].tolist()
+    assert table.column('binary_probability').type == pa.float32()